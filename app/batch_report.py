@@ -1,115 +1,180 @@
 import os
 import sys
+import logging
+import re
 import shutil
-import main
+import signal
+import tempfile
+import log_parser
+import instrumentation
+import log_config
+import lrg_watch
+import lrg_discovery
+import report_db
+import memory_budget
+import trend_analytics
 import traceback
-from tqdm import tqdm
+import time
+import heapq
+from concurrent.futures import ProcessPoolExecutor
 import json
 from datetime import datetime, timedelta
 
-def batch_parse(report_dir, start_dir, max_files=None, show_errors=False):
-    results = []
-    processed_files = 0
+WATCH_FLAG = "--watch"
+NO_RENDER_FLAG = "--no-render"
+BATCH_OPTIONS = {'interval': 5.0, 'workers': 0, 'debounce': 2.0, 'format': "html", 'rules': "", 'trend_days': 14}
+REPORT_FORMATS = ("html", "json", "both")
+BATCH_DATA_FILE_NAME = "batch.ndjson"
+# Placeholders of batch_report.html that are filled from fragments spooled to temporary files.
+INDEX_FRAGMENTS = ("table_rows", "error_tables", "new_errors_table")
+TEMPLATE_PLACEHOLDER_PATTERN = re.compile(r'(\{\w+\})')
+# How long the watch loop waits for changes while LRGs are being parsed or the index is due.
+BUSY_POLL_SECONDS = 0.5
+# The index is rewritten at the latest this many debounce periods after the first pending result.
+MAX_DEBOUNCE_PERIODS = 5
 
-    dir_list = os.listdir(start_dir)
-    
-    cache_path = os.path.join(os.path.dirname(report_dir), 'cache.json')
-    try:
-        with open(cache_path, 'r') as f:
-            cache = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        cache = {}
-    now = datetime.now()
-    
+logger = logging.getLogger(__name__)
 
-    template_path = os.path.join(os.path.dirname(__file__), 'html_assets', 'template', 'batch_report.html')
-    with open(template_path, 'r') as f:
-        template_html = f.read()
-        
-    css_path = os.path.join(os.path.dirname(__file__), 'html_assets', 'template', 'batch_report.css')
-    shutil.copy(css_path, os.path.join(report_dir, 'style.css'))
+def report_db_dir(report_dir):
+    return os.path.dirname(report_dir)
 
+# Saves the LRG's cache entry as build_result left it, so an interrupted batch keeps it.
+def save_cache_entry(db, dir_name, cache):
+    if dir_name in cache:
+        report_db.save_lrg(db, dir_name, cache[dir_name])
+
+# Parses one LRG. Runs in the watch mode's worker processes, so failures are
+# returned as text rather than raised.
+# Returns:
+#     tuple: The parsed log contents, or None and the error with its traceback.
+def parse_lrg(report_dir, full_path, incremental=False, render=True, detail_rules=None):
+    import main
     try:
-        with tqdm(total=len(dir_list), desc="Processing directories") as pbar:
-            for dir_name in dir_list:
-                pbar.update(1)
-                if not "snr" in dir_name:
-                    continue
-                if max_files is not None and processed_files >= max_files:
-                    print(f"Reached file limit of {max_files}. Exiting.")
-                    break
-                full_path = os.path.join(start_dir, dir_name)
-                if os.path.isdir(full_path):
-                    diag_path = os.path.join(full_path, 'diag')
-                    if os.path.exists(diag_path) and os.path.isdir(diag_path) and os.path.exists(os.path.join(diag_path, 'rdbms')):
-                        try:
-                            log_contents = main.parseLog(report_dir, full_path)
+        return main.parseLog(report_dir, full_path, incremental=incremental, render=render, detailRules=detail_rules), None
+    except Exception as e:
+        return None, f"{e}\n{traceback.format_exc()}"
+
+# The parts of an LRG's log contents the top-level report uses. Results only keep these,
+# so the rest of the contents is released once the LRG's row is built.
+def batch_summary(log_contents):
+    return {'clean_run_diff': log_contents.get('clean_run_diff', []), 'timings': log_contents.get('timings'), 'detail_matches': log_contents.get('detail_matches', []), 'error_rollup': log_parser.errorRollups(log_contents)['lrg'], 'leadership': log_parser.leadershipStats(log_contents)['lrg']}
+
+# Turns the outcome of parse_lrg into a row of the batch report, updating the LRG's cache entry.
+# Returns:
+#     dict: The result, or None if the LRG has not been reset for too long and is dropped.
+def build_result(dir_name, log_contents, error_message, cache, now, show_errors=False):
+    if error_message is not None:
+        return {'dir': dir_name, 'status': 'Failed', 'details': error_message, 'log_contents': None, 'is_new': False, 'days_existed': 0, 'first_seen': now.isoformat(), 'last_prev_seen': now.isoformat(), 'current_date': now.isoformat()}
+
+    is_new = dir_name not in cache
+    if dir_name in cache:
+        old_last_accessed = cache[dir_name].get('last_accessed')
+        if old_last_accessed:
+            cache[dir_name]['lastReset'] = old_last_accessed
+        else:
+            cache[dir_name]['lastReset'] = cache[dir_name]['date']
+        cache[dir_name]['last_accessed'] = now.isoformat()
+        last_reset = datetime.fromisoformat(cache[dir_name]['lastReset'])
+        if (now - last_reset).days >= 10:
+            return None  # drop it
+        else:
+            days_existed = (now - datetime.fromisoformat(cache[dir_name]['date'])).days
+    else:
+        cache[dir_name] = {'date': now.isoformat(), 'lastReset': now.isoformat()}
+        cache[dir_name]['last_accessed'] = now.isoformat()
+        days_existed = 0
+
+    details = ""
+    if log_contents:
+        # The detail rules already ran over the contents while the LRG was parsed
+        for match in log_contents.get('detail_matches', []):
+            details += f"{match['message']}<br>"
+        if show_errors and log_contents.get('trace_errors'):
+            error_links = []
+            for error in log_contents['trace_errors']:
+                file_path = error.get('ospFile') if error.get('ospFile') else error.get('file')
+                line_number = error.get('line')
+                if file_path and os.path.exists(file_path):
+                    link = f'<a href="{os.path.join(dir_name, os.path.basename(file_path))}#line{line_number}" target="_blank">{os.path.basename(file_path)}</a>'
+                    error_links.append(link)
+            if error_links:
+                details += f"Incidents: {', '.join(error_links)}<br>"
+
+        # Add clean run diff info to details
+        clean_run_diff = log_contents.get('clean_run_diff', [])
+        if clean_run_diff:
+            details += f"New errors since clean run: {len(clean_run_diff)}<br>"
+        else:
+            details += "No new errors since clean run.<br>"
+
+        leadership = log_parser.leadershipStats(log_contents)['lrg']
+        if leadership['terms']:
+            details += f"Leadership: {leadership['terms']} terms, {leadership['terms_per_hour']:.2f} per hour"
+            if leadership['recovery_p95'] is not None:
+                details += f", p95 recovery {leadership['recovery_p95']:.2f}s, max {leadership['recovery_max']:.2f}s"
+            if leadership['flapping_shard_groups']:
+                details += f", flapping in {leadership['flapping_shard_groups']} shard groups"
+            details += "<br>"
+
+    new_errors_count = log_parser.errorRollups(log_contents)['lrg']['new_errors']
+    return {'dir': dir_name, 'status': 'Success', 'details': details, 'log_contents': batch_summary(log_contents), 'is_new': is_new, 'days_existed': days_existed, 'first_seen': cache[dir_name]['date'], 'last_prev_seen': cache[dir_name]['lastReset'], 'current_date': cache[dir_name]['last_accessed'], 'new_errors': new_errors_count}
+
+# Parses every LRG under start_dir into the batch report. The caller can pass the LRGs
+# it has already probed, see lrg_discovery.probeLrgs, so start_dir is not listed again.
+def batch_parse(report_dir, start_dir, max_files=None, show_errors=False, render=True, report_format="html", detail_rules=None, trend_days=BATCH_OPTIONS['trend_days'], lrgs=None):
+    from tqdm import tqdm
+    processed_files = 0
+
+    # The LRGs are discovered as they are parsed, so their number is only known when given
+    total = None if lrgs is None else len(lrgs)
+    if lrgs is None:
+        lrgs = lrg_discovery.discoverLrgs(start_dir)
+    now = datetime.now()
+    writer = open_batch_writer(report_dir, start_dir, report_format)
+
+    with report_db.open_report_db(report_db_dir(report_dir)) as db:
+        cache = report_db.load_lrgs(db)
+        try:
+            with tqdm(total=total, desc="Processing directories") as pbar:
+                for lrg in lrgs:
+                    pbar.update(1)
+                    if max_files is not None and processed_files >= max_files:
+                        logger.info("Reached file limit of %s. Exiting.", max_files)
+                        break
+                    dir_name = lrg['name']
+                    if lrg['is_lrg']:
+                        log_contents, error_message = parse_lrg(report_dir, lrg['path'], render=render, detail_rules=detail_rules)
+                        if error_message is None:
                             processed_files += 1
-                            is_new = dir_name not in cache
-                            if dir_name in cache:
-                                old_last_accessed = cache[dir_name].get('last_accessed')
-                                if old_last_accessed:
-                                    cache[dir_name]['lastReset'] = old_last_accessed
-                                else:
-                                    cache[dir_name]['lastReset'] = cache[dir_name]['date']
-                                cache[dir_name]['last_accessed'] = now.isoformat()
-                                last_reset = datetime.fromisoformat(cache[dir_name]['lastReset'])
-                                if (now - last_reset).days >= 10:
-                                    continue  # drop it
-                                else:
-                                    days_existed = (now - datetime.fromisoformat(cache[dir_name]['date'])).days
-                            else:
-                                cache[dir_name] = {'date': now.isoformat(), 'lastReset': now.isoformat()}
-                                cache[dir_name]['last_accessed'] = now.isoformat()
-                                days_existed = 0
-                            
-                            details = ""
-                            if log_contents:
-                                if any('blowout' in str(val) for val in log_contents.values()):
-                                    details += "Found 'blowout' in logs.<br>"
-                                if any('sdbcr' in str(val) for val in log_contents.values()):
-                                    details += "Found 'sdbcr' in logs.<br>"
-                                if show_errors and log_contents.get('trace_errors'):
-                                    error_links = []
-                                    for error in log_contents['trace_errors']:
-                                        file_path = error.get('ospFile') if error.get('ospFile') else error.get('file')
-                                        line_number = error.get('line')
-                                        if file_path and os.path.exists(file_path):
-                                            link = f'<a href="{os.path.join(dir_name, os.path.basename(file_path))}#line{line_number}" target="_blank">{os.path.basename(file_path)}</a>'
-                                            error_links.append(link)
-                                    if error_links:
-                                        details += f"Incidents: {', '.join(error_links)}<br>"
-
-                                # Add clean run diff info to details
-                                clean_run_diff = log_contents.get('clean_run_diff', [])
-                                if clean_run_diff:
-                                    details += f"New errors since clean run: {len(clean_run_diff)}<br>"
-                                else:
-                                    details += "No new errors since clean run.<br>"
-
-                            new_errors_count = len(log_contents.get('clean_run_diff', []))
-                            results.append({'dir': dir_name, 'status': 'Success', 'details': details, 'log_contents': log_contents, 'is_new': is_new, 'days_existed': days_existed, 'first_seen': cache[dir_name]['date'], 'last_prev_seen': cache[dir_name]['lastReset'], 'current_date': cache[dir_name]['last_accessed'], 'new_errors': new_errors_count})
-                        except Exception as e:
-                            error_message = f"{e}\n{traceback.format_exc()}"
-                            results.append({'dir': dir_name, 'status': 'Failed', 'details': error_message, 'log_contents': None, 'is_new': False, 'days_existed': 0, 'first_seen': now.isoformat(), 'last_prev_seen': now.isoformat(), 'current_date': now.isoformat()})
-    except KeyboardInterrupt:
-        print("\nInterrupted by user. Stopping batch processing.")
+                        if log_contents is not None:
+                            trend_analytics.record_run(db, dir_name, now, log_contents)
+                        result = build_result(dir_name, log_contents, error_message, cache, now, show_errors)
+                        save_cache_entry(db, dir_name, cache)
+                        if result is not None:
+                            add_batch_result(writer, result)
+        except KeyboardInterrupt:
+            logger.warning("Interrupted by user. Stopping batch processing.")
+        trends = trend_analytics.render_trends(db, now, trend_days) if trend_days else ""
+
+    close_batch_writer(writer, cache, now, trends)
 
-    table_rows = ""
-    processed_dirs = {result['dir'] for result in results}
+    # cleanup_folders(report_dir, start_dir)
 
+# Yields a 'Cached' row for every LRG in the cache that has a report but was not processed.
+def cached_results(report_dir, start_dir, processed_dirs, cache, now):
     for dir_name, data in cache.items():
         if dir_name not in processed_dirs:
             report_path = os.path.join(report_dir, dir_name, 'index.html')
+            result_path = os.path.join(report_dir, dir_name, log_parser.PARSE_RESULT_FILE_NAME)
             log_path = os.path.join(start_dir, dir_name)
-            if os.path.exists(report_path) and os.path.isdir(log_path):
+            if (os.path.exists(report_path) or os.path.exists(result_path)) and os.path.isdir(log_path):
                 last_reset_str = data.get('lastReset', data['date'])
                 last_reset = datetime.fromisoformat(last_reset_str)
                 if (now - last_reset).days >= 10:
                     continue  # drop it
                 else:
                     days_existed = (now - datetime.fromisoformat(data['date'])).days
-                results.append({
+                yield {
                     'dir': dir_name,
                     'status': 'Cached',
                     'details': 'Report loaded from cache.',
@@ -119,42 +184,145 @@ def batch_parse(report_dir, start_dir, max_files=None, show_errors=False):
                     'first_seen': data['date'],
                     'last_prev_seen': last_reset_str,
                     'current_date': data['last_accessed']
-                })
+                }
 
+def display_status(result):
+    original_status = result['status']
+    is_new = result.get('is_new')
+    if original_status == 'Success':
+        return 'New' if is_new else 'Existing'
+    elif original_status == 'Failed':
+        return 'New Failed' if is_new else 'Failed'
+    return original_status
 
+# Writes the top-level report and timings.json for a set of LRG results.
+# LRGs in the cache that are not in results are listed as 'Cached'.
+# Args:
+#     report_format (str): One of REPORT_FORMATS. 'html' writes index.html, 'json' writes
+#                          batch.ndjson and the single page viewer, 'both' writes both.
+#     trends (str): The trends section of index.html, see trend_analytics.render_trends.
+def write_batch_outputs(report_dir, start_dir, results, cache, now, report_format="html", trends=""):
+    writer = open_batch_writer(report_dir, start_dir, report_format)
     for result in results:
-        dir_name = result['dir']
-        original_status = result['status']
-        details = result['details']
-        
-        if original_status == 'Cached':
-            status_class = 'status-cached'
-        elif original_status == 'Success':
-            status_class = 'status-success'
-        else: # Failed
-            status_class = 'status-failure'
-        
-        is_new = result.get('is_new')
-        row_class = 'new-folder' if is_new else ''
-
-        if original_status == 'Success':
-            status = 'New' if is_new else 'Existing'
-        elif original_status == 'Failed':
-            status = 'New Failed' if is_new else 'Failed'
-        else:
-            status = original_status
+        add_batch_result(writer, result)
+    close_batch_writer(writer, cache, now, trends)
 
-        if original_status == 'Success' or original_status == 'Cached':
-            link = f'<a href="{dir_name}/index.html">{dir_name}</a>'
-        else:
-            link = dir_name
-            
-        days_existed = result.get('days_existed', 0)
-        first_seen = result.get('first_seen', '')
-        last_prev_seen = result.get('last_prev_seen', '')
-        current_date = result.get('current_date', '')
-        new_errors_count = result.get('new_errors', 0)
-        table_rows += f"""
+# Starts writing the top-level report. Results are added one at a time with add_batch_result
+# and written out right away: index.html's table rows and error tables go to temporary
+# fragments, batch.ndjson to its temporary file. close_batch_writer puts the fragments
+# into the template, so the memory used does not grow with the number of LRGs or errors.
+# Returns:
+#     dict: The writer state.
+def open_batch_writer(report_dir, start_dir, report_format="html"):
+    os.makedirs(report_dir, exist_ok=True)
+    writer = {'report_dir': report_dir, 'start_dir': start_dir, 'format': report_format, 'dirs': set(), 'timings': {}, 'new_reports_count': 0, 'new_errors_started': False, 'data': None}
+    if report_format in ("html", "both"):
+        for fragment in INDEX_FRAGMENTS:
+            writer[fragment] = tempfile.TemporaryFile('w+', encoding='utf-8')
+    if report_format in ("json", "both"):
+        writer['data'] = open(os.path.join(report_dir, BATCH_DATA_FILE_NAME + ".tmp"), 'w')
+    return writer
+
+# Writes one LRG's row and errors. The result is not referenced afterwards.
+def add_batch_result(writer, result):
+    writer['dirs'].add(result['dir'])
+    if result.get('is_new'):
+        writer['new_reports_count'] += 1
+    log_contents = result.get('log_contents')
+    if log_contents and log_contents.get('timings'):
+        writer['timings'][result['dir']] = log_contents['timings']
+    if 'table_rows' in writer:
+        write_index_fragments(writer, result)
+    if writer['data'] is not None:
+        write_data_records(writer['data'], result)
+
+# Adds the cached LRGs, then finishes index.html and batch.ndjson and writes timings.json.
+# trends is the trends section of index.html, see trend_analytics.render_trends.
+def close_batch_writer(writer, cache, now, trends=""):
+    report_dir = writer['report_dir']
+    for result in cached_results(report_dir, writer['start_dir'], writer['dirs'], cache, now):
+        add_batch_result(writer, result)
+
+    if 'table_rows' in writer:
+        write_batch_index(writer, trends)
+    if writer['data'] is not None:
+        writer['data'].close()
+        os.replace(writer['data'].name, os.path.join(report_dir, BATCH_DATA_FILE_NAME))
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'html_assets', 'template', 'viewer.html'), os.path.join(report_dir, 'viewer.html'))
+
+    lrg_timings = writer['timings']
+    instrumentation.writeStats(os.path.join(report_dir, instrumentation.TIMINGS_FILE_NAME), {'lrgs': lrg_timings, 'total': instrumentation.mergeStats(lrg_timings.values())})
+
+# Writes the batch data records of one LRG for viewer.html: an 'lrg' record for its row of the
+# batch table followed by an 'error' record for each of its new errors since the clean run.
+# Each LRG's own data is the results.json in its report folder.
+def write_data_records(f, result):
+    log_contents = result.get('log_contents') or {}
+    record = {
+        'type': 'lrg',
+        'dir': result['dir'],
+        'status': display_status(result),
+        'is_new': bool(result.get('is_new')),
+        'has_report': result['status'] != 'Failed',
+        'first_seen': result.get('first_seen', ''),
+        'last_prev_seen': result.get('last_prev_seen', ''),
+        'current_date': result.get('current_date', ''),
+        'days_existed': result.get('days_existed', 0),
+        'new_errors': result.get('new_errors', 0),
+        'details': result.get('details', ''),
+    }
+    f.write(json.dumps(record, default=str) + "\n")
+    for error in log_contents.get('clean_run_diff', []):
+        record = {
+            'type': 'error',
+            'dir': result['dir'],
+            'is_new': bool(result.get('is_new')),
+            'timestamp': error.get('timestamp', ''),
+            'code': error.get('code', ''),
+            'message': error.get('original', ''),
+            'file': os.path.basename(error['ospFile']) if error.get('ospFile') else '',
+            'line': error.get('scrollIndex'),
+        }
+        f.write(json.dumps(record, default=str) + "\n")
+
+def error_file_cell(dir_name, error):
+    file_cell = "N/A"
+    if 'ospFile' in error and error['ospFile']:
+        file_path = os.path.basename(error['ospFile'])
+        link = f'<a href="{dir_name}/{file_path}" target="_blank">{file_path}</a>'
+        if 'scrollIndex' in error:
+            link = f'<a href="{dir_name}/{file_path}#line{error["scrollIndex"]}" target="_blank">{file_path}</a>'
+        file_cell = link
+    return file_cell
+
+# Appends one LRG's table row, its error table and its rows of the aggregate new errors table.
+def write_index_fragments(writer, result):
+    dir_name = result['dir']
+    original_status = result['status']
+    details = result['details']
+
+    if original_status == 'Cached':
+        status_class = 'status-cached'
+    elif original_status == 'Success':
+        status_class = 'status-success'
+    else: # Failed
+        status_class = 'status-failure'
+
+    is_new = result.get('is_new')
+    row_class = 'new-folder' if is_new else ''
+    status = display_status(result)
+
+    if original_status == 'Success' or original_status == 'Cached':
+        link = f'<a href="{dir_name}/index.html">{dir_name}</a>'
+    else:
+        link = dir_name
+
+    days_existed = result.get('days_existed', 0)
+    first_seen = result.get('first_seen', '')
+    last_prev_seen = result.get('last_prev_seen', '')
+    current_date = result.get('current_date', '')
+    new_errors_count = result.get('new_errors', 0)
+    writer['table_rows'].write(f"""
         <tr class="{row_class}">
             <td>{link}</td>
             <td class="{status_class}">{status}</td>
@@ -165,16 +333,13 @@ def batch_parse(report_dir, start_dir, max_files=None, show_errors=False):
             <td>{new_errors_count}</td>
             <td>{details}</td>
         </tr>
-        """
-    
-    new_reports_count = sum(1 for r in results if r.get('is_new'))
+        """)
 
-    # Generate error tables for each LRG with new errors
-    error_tables = ""
-    for result in results:
-        if result.get('status') == 'Success' and result.get('log_contents') and 'clean_run_diff' in result['log_contents'] and result['log_contents']['clean_run_diff']:
-            dir_name = result['dir']
-            error_tables += f"""
+    # Error table for an LRG with new errors
+    log_contents = result.get('log_contents')
+    if result.get('status') == 'Success' and log_contents and log_contents.get('clean_run_diff'):
+        error_tables = writer['error_tables']
+        error_tables.write(f"""
     <h2>New Errors for {dir_name}</h2>
     <div class="table-container">
         <table>
@@ -187,41 +352,31 @@ def batch_parse(report_dir, start_dir, max_files=None, show_errors=False):
                 </tr>
             </thead>
             <tbody>
-"""
-            for error in result['log_contents']['clean_run_diff']:
-                timestamp = error.get('timestamp', '')
-                code = str(error.get('code', ''))
-                message = error.get('original', '')
-                file_cell = "N/A"
-                if 'ospFile' in error and error['ospFile']:
-                    file_path = os.path.basename(error['ospFile'])
-                    link = f'<a href="{dir_name}/{file_path}" target="_blank">{file_path}</a>'
-                    if 'scrollIndex' in error:
-                        link = f'<a href="{dir_name}/{file_path}#line{error["scrollIndex"]}" target="_blank">{file_path}</a>'
-                    file_cell = link
-                error_tables += f"""
+""")
+        for error in log_contents['clean_run_diff']:
+            timestamp = error.get('timestamp', '')
+            code = str(error.get('code', ''))
+            message = error.get('original', '')
+            error_tables.write(f"""
                 <tr>
                     <td>{timestamp}</td>
                     <td>{code}</td>
                     <td>{message}</td>
-                    <td>{file_cell}</td>
+                    <td>{error_file_cell(dir_name, error)}</td>
                 </tr>
-"""
-            error_tables += """
+""")
+        error_tables.write("""
             </tbody>
         </table>
     </div>
-"""
+""")
 
-    # Generate aggregate table for all new errors from new directories
-    new_errors_table = ""
-    all_new_errors = []
-    for result in results:
-        if result.get('is_new') and result.get('log_contents') and 'clean_run_diff' in result['log_contents']:
-            all_new_errors.extend(result['log_contents']['clean_run_diff'])
-
-    if all_new_errors:
-        new_errors_table = """
+    # Rows of the aggregate table of all new errors from new directories
+    if is_new and log_contents and log_contents.get('clean_run_diff'):
+        new_errors_table = writer['new_errors_table']
+        if not writer['new_errors_started']:
+            writer['new_errors_started'] = True
+            new_errors_table.write("""
     <h2>All New Errors from New Directories</h2>
     <div class="table-container">
         <table>
@@ -235,70 +390,212 @@ def batch_parse(report_dir, start_dir, max_files=None, show_errors=False):
                 </tr>
             </thead>
             <tbody>
-"""
-        for result in results:
-            if result.get('is_new') and result.get('log_contents') and 'clean_run_diff' in result['log_contents']:
-                dir_name = result['dir']
-                for error in result['log_contents']['clean_run_diff']:
-                    timestamp = error.get('timestamp', '')
-                    code = str(error.get('code', ''))
-                    message = error.get('original', '')
-                    file_cell = "N/A"
-                    if 'ospFile' in error and error['ospFile']:
-                        file_path = os.path.basename(error['ospFile'])
-                        link = f'<a href="{dir_name}/{file_path}" target="_blank">{file_path}</a>'
-                        if 'scrollIndex' in error:
-                            link = f'<a href="{dir_name}/{file_path}#line{error["scrollIndex"]}" target="_blank">{file_path}</a>'
-                        file_cell = link
-                    new_errors_table += f"""
+""")
+        for error in log_contents['clean_run_diff']:
+            timestamp = error.get('timestamp', '')
+            code = str(error.get('code', ''))
+            message = error.get('original', '')
+            new_errors_table.write(f"""
                 <tr>
                     <td>{dir_name}</td>
                     <td>{timestamp}</td>
                     <td>{code}</td>
                     <td>{message}</td>
-                    <td>{file_cell}</td>
+                    <td>{error_file_cell(dir_name, error)}</td>
                 </tr>
-"""
-        new_errors_table += """
+""")
+
+# Writes index.html from the template, copying the spooled fragments into their placeholders.
+def write_batch_index(writer, trends=""):
+    report_dir = writer['report_dir']
+    template_path = os.path.join(os.path.dirname(__file__), 'html_assets', 'template', 'batch_report.html')
+    with open(template_path, 'r') as f:
+        template_html = f.read().replace('<th>Details</th>', '<th>New Errors</th><th>Details</th>')
+
+    css_path = os.path.join(os.path.dirname(__file__), 'html_assets', 'template', 'batch_report.css')
+    shutil.copy(css_path, os.path.join(report_dir, 'style.css'))
+
+    if writer['new_errors_started']:
+        writer['new_errors_table'].write("""
             </tbody>
         </table>
     </div>
-"""
+""")
+    values = {'source_dir': writer['start_dir'], 'new_reports_count': str(writer['new_reports_count']), 'trends': trends}
 
-    final_html = template_html.replace('{table_rows}', table_rows)
-    final_html = final_html.replace('{source_dir}', start_dir)
-    final_html = final_html.replace('{new_reports_count}', str(new_reports_count))
-    final_html = final_html.replace('<th>Details</th>', '<th>New Errors</th><th>Details</th>')
-    final_html = final_html.replace('{error_tables}', error_tables)
-    final_html = final_html.replace('{new_errors_table}', new_errors_table)
-    
-    with open(os.path.join(report_dir, 'index.html'), 'w') as f:
-        f.write(final_html)
+    index_path = os.path.join(report_dir, 'index.html')
+    with open(index_path + ".tmp", 'w') as f:
+        for part in TEMPLATE_PLACEHOLDER_PATTERN.split(template_html):
+            name = part[1:-1] if TEMPLATE_PLACEHOLDER_PATTERN.fullmatch(part) else None
+            if name in INDEX_FRAGMENTS:
+                fragment = writer.pop(name)
+                fragment.seek(0)
+                shutil.copyfileobj(fragment, f)
+                fragment.close()
+            elif name in values:
+                f.write(values[name])
+            else:
+                f.write(part)
+    os.replace(index_path + ".tmp", index_path)
 
-    with open(cache_path, 'w') as f:
-        json.dump(cache, f, indent=4)
+# Keeps the batch report up to date instead of rebuilding it from scratch: new and
+# changed LRGs are detected through lrg_watch, parsed incrementally on a pool of
+# worker processes, newest LRG first, and only their own reports are re-rendered.
+# The top-level index.html is rewritten once results stop arriving for 'debounce'
+# seconds. Runs until interrupted.
+# Args:
+#     report_dir (str): The batch report directory.
+#     start_dir (str): The directory the LRGs are in.
+#     show_errors (bool): List trace incidents in the details column.
+#     interval (float): Seconds between two rescans when polling.
+#     workers (int): Worker processes, defaults to the number of CPUs.
+#     debounce (float): Quiet period before the index is rewritten.
+#     use_inotify (bool): Use inotify when inotify_simple is installed.
+#     render (bool): Write the static LRG pages, rather than leaving them to report_server.
+#     report_format (str): The top-level report to write, see write_batch_outputs.
+#     detail_rules (list): The rules of the flags in the details, see log_parser.loadDetailRules.
+#     trend_days (int): Days the trends section of index.html covers, 0 leaves it out.
+def watch_batch(report_dir, start_dir, show_errors=False, interval=5.0, workers=None, debounce=2.0, use_inotify=True, render=True, report_format="html", detail_rules=None, trend_days=BATCH_OPTIONS['trend_days']):
+    os.makedirs(report_dir, exist_ok=True)
+    with report_db.open_report_db(report_db_dir(report_dir)) as db:
+        watch_loop(db, report_dir, start_dir, show_errors, interval, workers, debounce, use_inotify, render, report_format, detail_rules, trend_days)
 
-    # cleanup_folders(report_dir, start_dir)
+# Whether an LRG's logs are unchanged since its report was last built, judging by the
+# fingerprint recorded then. Used to skip LRGs on the first scan after a restart.
+def report_is_current(db, report_dir, dir_name, signature):
+    if not os.path.exists(os.path.join(report_dir, dir_name, log_parser.PARSE_RESULT_FILE_NAME)):
+        return False
+    return report_db.load_fingerprint(db, dir_name) == lrg_watch.lrgFingerprint(signature)
+
+# Moves the new errors of the results the watch loop keeps between index rewrites to the
+# spill file, see memory_budget.SpilledList. The index streams them back when it is rewritten.
+def spill_results(results):
+    spilled = 0
+    for result in results.values():
+        log_contents = result.get('log_contents')
+        if log_contents and isinstance(log_contents.get('clean_run_diff'), list) and log_contents['clean_run_diff']:
+            spilled += len(log_contents['clean_run_diff'])
+            log_contents['clean_run_diff'] = memory_budget.SpilledList(log_contents['clean_run_diff'])
+    if spilled:
+        logger.info("Spilled %d new errors of finished LRGs to disk, over the memory budget", spilled)
+
+# Ctrl+C reaches the whole process group; the watch loop shuts the workers down itself.
+def ignore_interrupts():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def render_trends(db, trend_days):
+    return trend_analytics.render_trends(db, datetime.now(), trend_days) if trend_days else ""
+
+def watch_loop(db, report_dir, start_dir, show_errors, interval, workers, debounce, use_inotify, render, report_format, detail_rules, trend_days):
+    cache = report_db.load_lrgs(db)
+    results = {}
+    watcher = lrg_watch.createWatcher(start_dir, interval, use_inotify)
+    workers = workers or os.cpu_count() or 1
+    queue = []      # (-newest modification time, dir_name), so the newest LRG is parsed first
+    queued = set()
+    running = {}    # future -> dir_name
+    changed_while_running = set()
+    first_pending = None
+    last_result = None
+
+    def schedule(newest, dir_name):
+        if dir_name in running.values():
+            changed_while_running.add(dir_name)
+        elif dir_name not in queued:
+            heapq.heappush(queue, (-newest, dir_name))
+            queued.add(dir_name)
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=ignore_interrupts)
+    try:
+        while True:
+            busy = running or queue or first_pending is not None
+            for newest, dir_name in lrg_watch.pollChanges(watcher, BUSY_POLL_SECONDS if busy else interval):
+                if dir_name not in results and report_is_current(db, report_dir, dir_name, watcher['signatures'][dir_name]):
+                    logger.debug("Report of %s is current", dir_name)
+                    continue
+                logger.debug("Change detected in %s", dir_name)
+                schedule(newest, dir_name)
+
+            while queue and len(running) < workers:
+                _, dir_name = heapq.heappop(queue)
+                queued.discard(dir_name)
+                running[pool.submit(parse_lrg, report_dir, os.path.join(start_dir, dir_name), True, render, detail_rules)] = dir_name
+
+            for future in [future for future in running if future.done()]:
+                dir_name = running.pop(future)
+                log_contents, error_message = future.result()
+                if log_contents is not None:
+                    trend_analytics.record_run(db, dir_name, datetime.now(), log_contents)
+                result = build_result(dir_name, log_contents, error_message, cache, datetime.now(), show_errors)
+                save_cache_entry(db, dir_name, cache)
+                if error_message is None and dir_name in watcher['signatures'] and dir_name not in changed_while_running:
+                    report_db.save_fingerprint(db, dir_name, lrg_watch.lrgFingerprint(watcher['signatures'][dir_name]))
+                if result is None:
+                    results.pop(dir_name, None)
+                else:
+                    results[dir_name] = result
+                    logger.info("Updated report for %s (%s)", dir_name, result['status'])
+                    if memory_budget.overBudget():
+                        spill_results(results)
+                last_result = time.monotonic()
+                if first_pending is None:
+                    first_pending = last_result
+                if dir_name in changed_while_running:
+                    changed_while_running.discard(dir_name)
+                    schedule(watcher['signatures'].get(dir_name, (0,))[0], dir_name)
+
+            now = time.monotonic()
+            if first_pending is not None and (now - last_result >= debounce or now - first_pending >= debounce * MAX_DEBOUNCE_PERIODS):
+                write_batch_outputs(report_dir, start_dir, results.values(), cache, datetime.now(), report_format, render_trends(db, trend_days))
+                logger.info("Rewrote %s with %d LRG reports", os.path.join(report_dir, 'index.html'), len(results))
+                first_pending = None
+    except KeyboardInterrupt:
+        logger.warning("Interrupted by user. Stopping watch mode.")
+        if first_pending is not None:
+            write_batch_outputs(report_dir, start_dir, results.values(), cache, datetime.now(), report_format, render_trends(db, trend_days))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
 
+def pop_batch_options(argv):
+    options = dict(BATCH_OPTIONS)
+    remaining = []
+    for arg in argv:
+        key = arg[2:].split("=", 1)[0] if arg.startswith("--") and "=" in arg else None
+        if key in options:
+            options[key] = type(options[key])(arg.split("=", 1)[1])
+        else:
+            remaining.append(arg)
+    return remaining, options
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        raise ValueError("Usage: python batch_report.py <report_directory> <start_directory> [max_files] [show_errors]")
-    report_directory = sys.argv[1]
-    start_directory = sys.argv[2]
+    argv, debug = log_config.popDebugFlag(sys.argv)
+    log_config.configureLogging(debug)
+    watch = WATCH_FLAG in argv
+    argv, batch_options = pop_batch_options([arg for arg in argv if arg not in (WATCH_FLAG, NO_RENDER_FLAG)])
+    if len(argv) < 3 or batch_options['format'] not in REPORT_FORMATS:
+        raise ValueError("Usage: python batch_report.py <report_directory> <start_directory> [max_files] [show_errors] [--watch [--interval=5] [--workers=N] [--debounce=2]] [--format=html|json|both] [--rules=rules.json] [--trend_days=14] [--no-render] [--debug]")
+    report_format = batch_options['format']
+    detail_rules = log_parser.loadDetailRules(batch_options['rules'])
+    # The JSON report is browsed through viewer.html, which needs no per-LRG pages.
+    render = NO_RENDER_FLAG not in sys.argv and report_format != "json"
+    report_directory = argv[1]
+    start_directory = argv[2]
     max_files_arg = None
     show_errors_arg = False
 
-    if len(sys.argv) > 3:
+    if len(argv) > 3:
         try:
-            max_files_arg = int(sys.argv[3])
+            max_files_arg = int(argv[3])
         except (ValueError, IndexError):
             max_files_arg = None
 
-    if len(sys.argv) > 4:
+    if len(argv) > 4:
         try:
-            show_errors_arg = sys.argv[4].lower() == 'true'
+            show_errors_arg = argv[4].lower() == 'true'
         except (ValueError, IndexError):
             show_errors_arg = False
 
-    batch_parse(report_directory, start_directory, max_files_arg, show_errors_arg)
\ No newline at end of file
+    if watch:
+        watch_batch(report_directory, start_directory, show_errors_arg, batch_options['interval'], batch_options['workers'], batch_options['debounce'], render=render, report_format=report_format, detail_rules=detail_rules, trend_days=batch_options['trend_days'])
+    else:
+        batch_parse(report_directory, start_directory, max_files_arg, show_errors_arg, render, report_format, detail_rules, batch_options['trend_days'])
\ No newline at end of file
@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import statistics
+import tempfile
+import subprocess
+import synthetic_lrg
+import instrumentation
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+SCENARIOS = ("startup", "parse_log", "leadership_stats", "clean_run_report", "batch_parse")
+METRICS = ("wall_seconds", "peak_rss_bytes", "files_written")
+DEFAULT_TOLERANCE = 0.25
+# Absolute slack allowed on top of a metric's baseline whatever the tolerance, so timings of
+# a few milliseconds, such as startup, do not fail on scheduler and disk noise.
+MIN_SLACK = {'wall_seconds': 0.02}
+
+def countFiles(directory):
+    total = 0
+    for _, _, files in os.walk(directory):
+        total += len(files)
+    return total
+
+def runScenario(scenario, tree_dir, work_dir):
+    """
+    Runs one scenario in the current process and returns its measurements.
+    Meant to be called in a fresh interpreter so peak RSS and caches are per scenario.
+    """
+    logging.basicConfig(level=logging.WARNING)
+    report_root = os.path.join(work_dir, 'reports')
+    report_dir = os.path.join(report_root, 'report')
+    os.makedirs(report_dir, exist_ok=True)
+    lrg_dirs = sorted(os.path.join(tree_dir, d) for d in os.listdir(tree_dir))
+
+    start = time.perf_counter()
+    if scenario == "startup":
+        # What a single-LRG run or a spawned worker pays before parsing anything
+        import main
+        import batch_report
+        import clean_run_report
+    elif scenario == "parse_log":
+        import main
+        for lrg_dir in lrg_dirs:
+            if os.path.exists(os.path.join(lrg_dir, 'watson.dif')):
+                main.parseLog(report_dir, lrg_dir)
+    elif scenario == "leadership_stats":
+        # Only rebuilding the leadership statistics of the parsed LRGs is timed, to compare
+        # with what parse_log spends on the whole parse
+        import main
+        import log_parser
+        histories = [main.parseLog(report_dir, lrg_dir, render=False)['history'] for lrg_dir in lrg_dirs if os.path.exists(os.path.join(lrg_dir, 'watson.dif'))]
+        start = time.perf_counter()
+        for history in histories:
+            log_parser.buildLeadershipStats(history)
+    elif scenario == "clean_run_report":
+        import clean_run_report
+        clean_run_report.clean_run_report(report_dir, tree_dir)
+    elif scenario == "batch_parse":
+        import clean_run_report
+        import batch_report
+        clean_run_report.clean_run_report(report_dir, tree_dir)
+        start = time.perf_counter()
+        batch_report.batch_parse(report_dir, tree_dir)
+    else:
+        raise ValueError("Unknown scenario '{}', expected one of {}".format(scenario, ", ".join(SCENARIOS)))
+    wall_seconds = time.perf_counter() - start
+
+    return {
+        'wall_seconds': wall_seconds,
+        'peak_rss_bytes': instrumentation.peakRssBytes(),
+        'files_written': countFiles(report_root),
+    }
+
+def runIsolated(scenario, tree_dir, repeat):
+    """
+    Runs a scenario repeat times, each in a fresh interpreter, and returns the median of
+    each metric, which a single slow or lucky run does not move.
+    """
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="finishedlog_bench_") as work_dir:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--scenario", scenario, tree_dir, work_dir],
+                check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    medians = {}
+    for metric in METRICS:
+        values = [measured[metric] for measured in runs if measured.get(metric) is not None]
+        medians[metric] = statistics.median(values) if values else None
+    return medians
+
+def compareWithBaseline(results, baseline, tolerance):
+    regressions = []
+    for scenario, measured in results.items():
+        expected = baseline.get('scenarios', {}).get(scenario)
+        if not expected:
+            continue
+        for metric in METRICS:
+            if measured.get(metric) is None or expected.get(metric) is None:
+                continue
+            limit = max(expected[metric] * (1 + tolerance), expected[metric] + MIN_SLACK.get(metric, 0))
+            if measured[metric] > limit:
+                regressions.append("{} {}: {:.4g} > {:.4g} (baseline {:.4g}, tolerance {:.0%}, at least {:.4g})".format(scenario, metric, measured[metric], limit, expected[metric], tolerance, MIN_SLACK.get(metric, 0)))
+    return regressions
+
+def printResults(results, baseline):
+    print("{:<18} {:>14} {:>16} {:>14}".format("scenario", "wall_seconds", "peak_rss_mb", "files_written"))
+    for scenario, measured in results.items():
+        expected = baseline.get('scenarios', {}).get(scenario, {})
+        rss = measured['peak_rss_bytes'] / (1024 * 1024) if measured['peak_rss_bytes'] else 0
+        print("{:<18} {:>14.3f} {:>16.1f} {:>14}".format(scenario, measured['wall_seconds'], rss, measured['files_written']))
+        if expected:
+            expected_rss = expected['peak_rss_bytes'] / (1024 * 1024) if expected.get('peak_rss_bytes') else 0
+            print("{:<18} {:>14.3f} {:>16.1f} {:>14}".format("  baseline", expected['wall_seconds'], expected_rss, expected['files_written']))
+
+def benchmark(shape=None, scenarios=SCENARIOS, repeat=3, tolerance=DEFAULT_TOLERANCE, update_baseline=False, baseline_path=BASELINE_PATH):
+    """
+    Generates a synthetic LRG tree, runs each scenario against it in a fresh interpreter
+    and compares the median measurements with the stored baseline. A metric regresses when
+    it exceeds the baseline by more than the tolerance and by more than its MIN_SLACK.
+
+    Returns:
+        list: Descriptions of every metric that regressed past the tolerance.
+    """
+    shape = dict(synthetic_lrg.DEFAULT_SHAPE, **(shape or {}))
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, 'r') as f:
+            baseline = json.load(f)
+    if baseline and baseline.get('shape') != shape and not update_baseline:
+        raise ValueError("Baseline in {} was recorded for a different shape, rerun with --update-baseline".format(baseline_path))
+
+    tree_root = tempfile.mkdtemp(prefix="finishedlog_lrgs_")
+    try:
+        synthetic_lrg.generateTree(tree_root, shape)
+        results = {scenario: runIsolated(scenario, tree_root, repeat) for scenario in scenarios}
+    finally:
+        shutil.rmtree(tree_root, ignore_errors=True)
+
+    printResults(results, baseline)
+    if update_baseline:
+        recorded = baseline.get('scenarios', {}) if baseline.get('shape') == shape else {}
+        recorded.update(results)
+        with open(baseline_path, 'w') as f:
+            json.dump({'shape': shape, 'scenarios': recorded}, f, indent=4)
+        print("Baseline written to {}".format(baseline_path))
+        return []
+    return compareWithBaseline(results, baseline, tolerance)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--scenario":
+        print(json.dumps(runScenario(sys.argv[2], sys.argv[3], sys.argv[4])))
+        sys.exit(0)
+
+    args = sys.argv[1:]
+    update = "--update-baseline" in args
+    args = [arg for arg in args if arg != "--update-baseline"]
+    options = {'repeat': 3, 'tolerance': DEFAULT_TOLERANCE, 'scenarios': ",".join(SCENARIOS)}
+    shape_args = []
+    for arg in args:
+        key = arg[2:].split("=", 1)[0] if arg.startswith("--") else None
+        if key in options:
+            options[key] = type(options[key])(arg.split("=", 1)[1])
+        else:
+            shape_args.append(arg)
+
+    regressions = benchmark(synthetic_lrg.parseShapeArgs(shape_args), options['scenarios'].split(","), options['repeat'], options['tolerance'], update)
+    if regressions:
+        print("Performance regressions:")
+        for regression in regressions:
+            print("  " + regression)
+        sys.exit(1)
@@ -1,118 +1,139 @@
 import os
 import sys
+import logging
 from datetime import datetime
-import json
-import main
+import log_config
+import report_db
+import lrg_discovery
 import traceback
-from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor, Future
 import random
-
-def clean_run_report(report_dir, start_dir, test=False):
+import signal
+
+WORKERS_OPTION = "--workers="
+
+logger = logging.getLogger(__name__)
+
+# Collects the errors of a clean LRG's term histories, per term in timestamp order.
+def collect_lrg_errors(log_contents, lrg):
+    lrg_errors = []
+    for ruid, shard_groups in log_contents['history'].items():
+        for shard_group, events in shard_groups.items():
+            for term in range(len(events)):
+                termEvents = events[term]
+                toAdd = []
+                for event in termEvents.get('errors'):
+                    error_entry = event.copy()
+                    error_entry['ruid'] = ruid
+                    error_entry['shard_group'] = shard_group
+                    error_entry['term'] = termEvents.get('term')
+                    error_entry['lrg'] = lrg
+                    toAdd.append(error_entry)
+                toAdd.sort(key=lambda x: datetime.fromisoformat(x['timestamp']))
+                lrg_errors.extend(toAdd)
+    return lrg_errors
+
+# Parses one clean LRG and replaces its errors in the report cache database. Runs in a
+# worker process, which writes the LRG's errors itself, so only the row of the report
+# is sent back and no process holds more than one LRG's errors.
+# Returns:
+#     dict: The LRG's row of the clean run report.
+def build_lrg_baseline(report_dir, subdir, full_path, test=False):
+    import main
+    # Parse log to get errors (assuming it's a clean run)
+    try:
+        log_contents = main.parseLog(report_dir, full_path, True)
+        lrg_errors = collect_lrg_errors(log_contents, subdir)
+        del log_contents
+
+        # Apply test mode: randomly remove some errors BEFORE saving to cache
+        if test:
+            remove_percentage = 0# random.uniform(0.3, 0.7)
+            num_to_remove = int(len(lrg_errors) * remove_percentage)
+            if num_to_remove > 0:
+                indices_to_remove = set(random.sample(range(len(lrg_errors)), num_to_remove))
+                # Create a new list excluding the removed indices
+                lrg_errors = [error for i, error in enumerate(lrg_errors) if i not in indices_to_remove]
+                logger.info("Test mode: Removed %s errors (%.1f%%) for watson.dif testing", num_to_remove, remove_percentage * 100)
+
+        # Replace this LRG's errors, other LRGs' errors are kept
+        with report_db.open_report_db(os.path.dirname(report_dir)) as db:
+            report_db.save_clean_run_errors(db, subdir, lrg_errors)
+
+        return {'dir': subdir, 'status': 'Clean run processed', 'error_count': len(lrg_errors)}
+    except Exception as e:
+        error_message = f"{e}\n{traceback.format_exc()}"
+        logger.error("Failed to parse %s: %s", subdir, error_message)
+        return {'dir': subdir, 'status': 'Failed to parse', 'error_count': 0, 'details' : error_message}
+
+def ignore_interrupts():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def clean_run_report(report_dir, start_dir, test=False, workers=None, lrgs=None):
     """
     Generate a clean run HTML report listing LRGs (subfolders) that do not have a watson.dif file,
-    and cache all errors from these LRGs in a parquet file.
+    and cache all errors from these LRGs in the report cache database.
+
+    The LRGs are parsed in parallel worker processes, each of which saves its LRG's errors
+    in a transaction of its own, so an interrupted run keeps the LRGs it finished.
 
     Args:
         report_dir: Directory to save the HTML report
         start_dir: Directory containing LRG subfolders to scan
         test: If True, randomly remove some errors for testing watson.dif generation
+        workers: Number of worker processes, defaults to the number of CPUs
+        lrgs: The LRG directories probed with their watson.dif, see lrg_discovery.probeLrgs,
+              when the caller has already listed start_dir
     """
-    results = []
-    current_lrg_errors = {}  # Dictionary to store errors for current LRGs
-    all_errors = []
-
-    # Load cache if it exists
-    cache_path = os.path.join(os.path.dirname(report_dir), 'clean_run_errors_cache.json')
-    if os.path.exists(cache_path):
-        try:
-            with open(cache_path, 'r') as f:
-                cached_errors = json.load(f)
-            print(f"Loaded {len(cached_errors)} errors from {cache_path}")
-        except Exception as e:
-            print(f"Failed to load cache from {cache_path}: {e}")
-            cached_errors = []  # Ensure cached_errors is an empty list in case of failure
-    else:
-        cached_errors = []
-
+    from tqdm import tqdm
     if not os.path.exists(start_dir):
         raise ValueError(f"Start directory {start_dir} does not exist.")
 
     if not os.path.exists(report_dir):
         os.makedirs(report_dir)
 
+    # Create the database and import old caches once, before the workers open it
+    with report_db.open_report_db(os.path.dirname(report_dir)):
+        pass
+
     # List all subdirectories in start_dir that contain "snr" (similar to batch_report)
-    subdirs = [d for d in os.listdir(start_dir) if os.path.isdir(os.path.join(start_dir, d)) and "snr" in d]
-
-    with tqdm(total=len(subdirs), desc="Processing directories for clean run") as pbar:
-        for subdir in subdirs:
-            pbar.update(1)
-            full_path = os.path.join(start_dir, subdir)
-            watson_dif_path = os.path.join(full_path, 'watson.dif')
-            diag_path = os.path.join(full_path, 'diag')
-            # If LRG has watson.dif, ignore it completely
-            if os.path.exists(watson_dif_path) and not test:
-                continue
-
-            if os.path.exists(diag_path) and os.path.isdir(diag_path) and os.path.exists(os.path.join(diag_path, 'rdbms')):
-                # Parse log to get errors (assuming it's a clean run)
-                try:
-                    log_contents = main.parseLog(report_dir, full_path, True)
-                    # Extract errors from the history structure
-                    lrg_errors = []
-                    for ruid, shard_groups in log_contents['history'].items():
-                        for shard_group, events in shard_groups.items():
-                            for term in range(len(events)):
-                                termEvents = events[term]
-                                toAdd = []
-                                for event in termEvents.get('errors'):
-                                    error_entry = event.copy()
-                                    error_entry['ruid'] = ruid
-                                    error_entry['shard_group'] = shard_group
-                                    error_entry['term'] = termEvents.get('term')
-                                    error_entry['lrg'] = subdir
-                                    toAdd.append(error_entry)
-                                toAdd.sort(key=lambda x: datetime.fromisoformat(x['timestamp']))
-                                lrg_errors.extend(toAdd)
-
-                    current_lrg_errors[subdir] = lrg_errors
-
-                    error_count = len(lrg_errors)
-                    results.append({'dir': subdir, 'status': 'Clean run processed', 'error_count': error_count})
-                except Exception as e:
-                    error_message = f"{e}\n{traceback.format_exc()}"
-                    results.append({'dir': subdir, 'status': 'Failed to parse', 'error_count': 0, 'details' : error_message})
-                    print(f"Failed to parse {subdir}: {error_message}")
-            else:
-                results.append({'dir': subdir, 'status': 'Invalid structure', 'error_count': 0})
-
-    # Merge cache and new errors
-    # Remove errors from cache if LRG is in current_lrg_errors
-    filtered_cache = [error for error in cached_errors if error['lrg'] not in current_lrg_errors]
-
-    # Combine cache and new errors
-    for lrg in current_lrg_errors:
-        all_errors.extend(current_lrg_errors[lrg])
-    all_errors = filtered_cache + all_errors
-
-    # Save cache
-    cache_path = os.path.join(os.path.dirname(report_dir), 'clean_run_errors_cache.json')
-
-    # Apply test mode: randomly remove some errors BEFORE saving to cache
-    if test:
-        remove_percentage = 0# random.uniform(0.3, 0.7)
-        num_to_remove = int(len(all_errors) * remove_percentage)
-        if num_to_remove > 0:
-            indices_to_remove = random.sample(range(len(all_errors)), num_to_remove)
-            # Create a new list excluding the removed indices
-            all_errors = [error for i, error in enumerate(all_errors) if i not in indices_to_remove]
-            print(f"Test mode: Removed {num_to_remove} errors ({remove_percentage:.1%}) for watson.dif testing")
-
-    if all_errors:
-        with open(cache_path, 'w') as f:
-            json.dump(all_errors, f, indent=4)
-        print(f"Saved {len(all_errors)} errors to {cache_path}")
-    else:
-        print("No errors found to cache.")
+    # The LRGs are discovered as they are submitted, so their number is only known when given
+    total = None if lrgs is None else len(lrgs)
+    if lrgs is None:
+        lrgs = lrg_discovery.discoverLrgs(start_dir, check_watson_dif=not test)
+
+    # Rows of the report in directory order, futures for the LRGs still being parsed
+    rows = []
+    with tqdm(total=total, desc="Processing directories for clean run") as pbar:
+        pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, initializer=ignore_interrupts)
+        try:
+            for lrg in lrgs:
+                # If LRG has watson.dif, ignore it completely
+                if lrg['has_watson_dif']:
+                    pbar.update(1)
+                elif lrg['is_lrg']:
+                    future = pool.submit(build_lrg_baseline, report_dir, lrg['name'], lrg['path'], test)
+                    future.add_done_callback(lambda _: pbar.update(1))
+                    rows.append(future)
+                else:
+                    rows.append({'dir': lrg['name'], 'status': 'Invalid structure', 'error_count': 0})
+                    pbar.update(1)
+            results = [row.result() if isinstance(row, Future) else row for row in rows]
+        except KeyboardInterrupt:
+            logger.warning("Interrupted by user. Stopping clean run processing.")
+            # Cancelled here as well, since the pool's own cancelling is skipped when the pool
+            # is released before its manager thread gets to it
+            for row in rows:
+                if isinstance(row, Future):
+                    row.cancel()
+            raise
+        finally:
+            # Every LRG has been parsed unless interrupted, when waiting for the pool would
+            # parse every LRG already submitted first
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    with report_db.open_report_db(os.path.dirname(report_dir)) as db:
+        logger.info("Saved %s errors of %s LRGs, %s clean run errors cached in total", sum(result['error_count'] for result in results), len(results), report_db.count_clean_run_errors(db))
 
     # Load template
     template_path = os.path.join(os.path.dirname(__file__), 'html_assets', 'template', 'clean_run.html')
@@ -152,6 +173,7 @@ def clean_run_report(report_dir, start_dir, test=False):
     final_html = template_html.replace('{table_rows}', table_rows)
     final_html = final_html.replace('{source_dir}', start_dir)
     final_html = final_html.replace('{new_reports_count}', str(len(results)))
+    final_html = final_html.replace('{trends}', '')
 
     # Change title for clean run
     final_html = final_html.replace('Batch Processing Report', 'Clean Run Report')
@@ -168,15 +190,21 @@ def clean_run_report(report_dir, start_dir, test=False):
     with open(html_path, 'w', encoding='utf-8') as f:
         f.write(final_html)
 
-    print(f"Clean run report generated at {html_path}")
-    print(f"Found {len(results)} LRGs missing watson.dif files.")
+    logger.info("Clean run report generated at %s", html_path)
+    logger.info("Found %s LRGs missing watson.dif files.", len(results))
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        raise ValueError("Usage: python clean_run_report.py <report_directory> <start_directory> [--test]")
-    report_directory = sys.argv[1]
-    start_directory = sys.argv[2]
+    argv, debug = log_config.popDebugFlag(sys.argv)
+    log_config.configureLogging(debug)
+    if len(argv) < 3:
+        raise ValueError("Usage: python clean_run_report.py <report_directory> <start_directory> [--test] [--workers=N] [--debug]")
+    report_directory = argv[1]
+    start_directory = argv[2]
     test_mode = False
-    if len(sys.argv) > 3 and sys.argv[3] == '--test':
+    if len(argv) > 3 and argv[3] == '--test':
         test_mode = True
-    clean_run_report(report_directory, start_directory, test_mode)
\ No newline at end of file
+    workers = None
+    for arg in argv[3:]:
+        if arg.startswith(WORKERS_OPTION):
+            workers = int(arg[len(WORKERS_OPTION):])
+    clean_run_report(report_directory, start_directory, test_mode, workers)
\ No newline at end of file
@@ -1 +1,20 @@
-from .parseTarDirectory import *
+from lazy_package import lazyExports
+
+# Imported on first use, so tarfile is only loaded when an archive is extracted.
+lazyExports(__name__, {
+    "parseTarDirectory": (
+        "openTarDirectory",
+        "findMainDirs",
+        "findLogFileSources",
+        "placeLogFile",
+        "findLogFilesInDir",
+        "findLogFolder",
+    ),
+    "placeArtifact": (
+        "setArtifactMode",
+        "getArtifactMode",
+        "placeFile",
+        "placeGzipFile",
+        "refreshFile",
+    ),
+})
@@ -1,28 +1,32 @@
-import tarfile
 import os
-import gzip
-import shutil
+import logging
+from .placeArtifact import placeGzipFile, refreshFile
 MIN_LINES_FOR_LOG = 30
 DEBUG_STRING = "debug_"
 AIME_STRING = "aime"
+
+logger = logging.getLogger(__name__)
+
 # Opens and extracts a tar.gz file to a specified destination.
 # Args:
 #     filePath (str): The path to the tar.gz file.
 #     destination (str): The destination directory for the extracted files.
 def openTarDirectory(filePath, destination):
+    # Imported here, so parses that only look up log files do not load tarfile
+    import tarfile
     try:
         with tarfile.open(filePath, 'r:gz') as tar:
             for member in tar.getmembers():
                 target_path = os.path.join(destination, member.name)
                 if not os.path.exists(target_path):
                     tar.extract(member, path=destination)
-        print("Successfully extracted new files from '{}' to '{}'".format(filePath, destination))
+        logger.info("Successfully extracted new files from '%s' to '%s'", filePath, destination)
     except tarfile.ReadError as e:
-        print("Error reading tar file: {}".format(e))
+        logger.error("Error reading tar file: %s", e)
     except FileNotFoundError:
-        print("Error: Tar file '{}' not found.".format(filePath))
+        logger.error("Tar file '%s' not found.", filePath)
     except Exception as e:
-        print("An unexpected error occurred: {}".format(e))
+        logger.error("An unexpected error occurred: %s", e)
 
 def findMainDirs(directory):
     dirs = []
@@ -32,11 +36,17 @@ def findMainDirs(directory):
                 if item.is_dir() and AIME_STRING in item.name:
                     dirs.append(item.name)
     except FileNotFoundError:
-        print(f"Directory not found for findMainDirs: {directory}")
+        logger.warning("Directory not found for findMainDirs: %s", directory)
     return dirs
 
-def findLogFilesInDir(directory, destination_dir):
-    log_files = []
+# Finds the debug log of every aime folder of a database, without placing anything.
+# Args:
+#     directory (str): The database's diag/rdbms folder.
+#     destination_dir (str): The report directory the logs are placed in.
+# Returns:
+#     list: (source_path, dest_path) pairs. Compressed logs are preferred over plain ones.
+def findLogFileSources(directory, destination_dir):
+    log_sources = []
     aime_dirs = findMainDirs(directory)
     for aime_dir in aime_dirs:
         log_path = os.path.join(directory, aime_dir, 'log', f"debug_{aime_dir}.log")
@@ -45,27 +55,25 @@ def findLogFilesInDir(directory, destination_dir):
         unzipped_log_filename = f"{os.path.basename(directory)}_{aime_dir}_debug.log"
         unzipped_log_path = os.path.join(destination_dir, unzipped_log_filename)
 
-        found_log_path = None
         if os.path.exists(gz_log_path):
-            os.makedirs(destination_dir, exist_ok=True)
-            if not os.path.exists(unzipped_log_path):
-                with gzip.open(gz_log_path, 'rb') as f_in:
-                    if not os.path.exists(unzipped_log_path):
-                        with open(unzipped_log_path, 'wb') as f_out:
-                            shutil.copyfileobj(f_in, f_out)
-                print(f"Unzipped {gz_log_path} to {unzipped_log_path}")
-            found_log_path = unzipped_log_path
+            log_sources.append((gz_log_path, unzipped_log_path))
         elif os.path.exists(log_path):
-            os.makedirs(destination_dir, exist_ok=True)
-            if not os.path.exists(unzipped_log_path):
-                 if not os.path.exists(unzipped_log_path):
-                    shutil.copy(log_path, unzipped_log_path)
-            found_log_path = unzipped_log_path
+            log_sources.append((log_path, unzipped_log_path))
+    return log_sources
 
-        if found_log_path:
-            log_files.append(found_log_path)
+# Places a debug log in the report directory. Plain logs may still be growing,
+# so a stale copy from an earlier run is refreshed.
+def placeLogFile(source_path, dest_path):
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    if source_path.endswith(".gz"):
+        if not os.path.exists(dest_path):
+            placeGzipFile(source_path, dest_path)
+            logger.debug("Unzipped %s to %s", source_path, dest_path)
+        return dest_path
+    return refreshFile(source_path, dest_path)
 
-    return log_files
+def findLogFilesInDir(directory, destination_dir):
+    return [placeLogFile(source_path, dest_path) for source_path, dest_path in findLogFileSources(directory, destination_dir)]
 
 # Finds the log/diag folder in a directory.
 # Args:
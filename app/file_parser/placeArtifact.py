@@ -0,0 +1,206 @@
+import os
+import gzip
+import shutil
+import hashlib
+import tempfile
+import threading
+import instrumentation
+
+ARTIFACT_MODES = ("auto", "reflink", "hardlink", "symlink", "copy")
+ARTIFACT_MODE_ENV = "FINISHEDLOG_ARTIFACT_MODE"
+ARTIFACT_STORE_ENV = "FINISHEDLOG_ARTIFACT_STORE"
+STORE_DIR_NAME = ".artifact_store"
+HASH_CHUNK_SIZE = 1024 * 1024
+FICLONE = 0x40049409 # linux/fs.h, _IOW(0x94, 9, int)
+
+# Order in which each mode tries to place a file. Copy is always the last resort.
+MODE_STRATEGIES = {
+    "auto": ("reflink", "hardlink", "symlink", "copy"),
+    "reflink": ("reflink", "copy"),
+    "hardlink": ("hardlink", "copy"),
+    "symlink": ("symlink", "copy"),
+    "copy": ("copy",),
+}
+
+artifact_settings = {
+    'mode': os.environ.get(ARTIFACT_MODE_ENV, "auto"),
+    'store': os.environ.get(ARTIFACT_STORE_ENV) or None,
+}
+
+digest_cache = {}
+
+# Sets how artifacts are placed into report directories.
+# Args:
+#     mode (str): One of ARTIFACT_MODES.
+#     store_dir (str): Directory for decompressed .gz content, shared across reports.
+#                      Defaults to a '.artifact_store' folder next to the report directories.
+def setArtifactMode(mode, store_dir=None):
+    if mode not in ARTIFACT_MODES:
+        raise ValueError("Unknown artifact mode '{}', expected one of {}".format(mode, ", ".join(ARTIFACT_MODES)))
+    artifact_settings['mode'] = mode
+    artifact_settings['store'] = store_dir
+
+def getArtifactMode():
+    mode = artifact_settings['mode']
+    if mode not in MODE_STRATEGIES:
+        raise ValueError("Unknown artifact mode '{}', expected one of {}".format(mode, ", ".join(ARTIFACT_MODES)))
+    return mode
+
+# Clones source_path into a new file at dest_path. The file is created exclusively, so an
+# existing file, e.g. one hardlinked into the store, is never truncated.
+def reflinkFile(source_path, dest_path):
+    import fcntl
+    with open(source_path, 'rb') as f_in:
+        with open(dest_path, 'xb') as f_out:
+            try:
+                fcntl.ioctl(f_out.fileno(), FICLONE, f_in.fileno())
+            except OSError:
+                f_out.close()
+                os.remove(dest_path)
+                raise
+
+def copyFile(source_path, dest_path):
+    with open(source_path, 'rb') as f_in:
+        with open(dest_path, 'xb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+    shutil.copymode(source_path, dest_path)
+
+def linkFile(strategy, source_path, dest_path):
+    if strategy == "reflink":
+        reflinkFile(source_path, dest_path)
+    elif strategy == "hardlink":
+        os.link(source_path, dest_path)
+    elif strategy == "symlink":
+        os.symlink(os.path.abspath(source_path), dest_path)
+    else:
+        copyFile(source_path, dest_path)
+
+# A name next to dest_path that only this thread of this process places files under.
+def placementTempPath(dest_path):
+    return "{}.{}.{}.tmp".format(dest_path, os.getpid(), threading.get_ident())
+
+def removeIfPresent(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# Places a file at dest_path using the configured artifact mode, falling back
+# through the mode's strategies until one succeeds. Existing destinations are kept.
+# Every strategy places the file under a temporary name that is then renamed to
+# dest_path, so a placement racing with another one never writes to the file the
+# other one placed, which may be a link to a shared store object.
+# Args:
+#     source_path (str): The file to place.
+#     dest_path (str): Where the file should appear.
+# Returns:
+#     str: dest_path.
+def placeFile(source_path, dest_path):
+    if os.path.lexists(dest_path):
+        return dest_path
+
+    with instrumentation.stage("artifact_copy"):
+        strategies = MODE_STRATEGIES[getArtifactMode()]
+        tmp_path = placementTempPath(dest_path)
+        for index, strategy in enumerate(strategies):
+            # Left behind by an interrupted placement of this thread
+            removeIfPresent(tmp_path)
+            try:
+                linkFile(strategy, source_path, tmp_path)
+                os.replace(tmp_path, dest_path)
+                # rename() leaves both names when dest_path was meanwhile linked to the same file
+                removeIfPresent(tmp_path)
+                return dest_path
+            except FileExistsError:
+                removeIfPresent(tmp_path)
+                if os.path.lexists(dest_path):
+                    return dest_path
+                if index == len(strategies) - 1:
+                    raise
+            except (OSError, ImportError):
+                removeIfPresent(tmp_path)
+                if index == len(strategies) - 1:
+                    raise
+    return dest_path
+
+# Like placeFile, but replaces a destination that no longer matches its source,
+# e.g. a copy of a log that has been appended to since it was placed. Links that
+# resolve to the source itself are always current and are left alone.
+# Args:
+#     source_path (str): The file to place.
+#     dest_path (str): Where the file should appear.
+# Returns:
+#     str: dest_path.
+def refreshFile(source_path, dest_path):
+    if os.path.lexists(dest_path):
+        try:
+            source_stat = os.stat(source_path)
+            dest_stat = os.stat(dest_path)
+        except FileNotFoundError:
+            dest_stat = None
+        if dest_stat is not None:
+            if (dest_stat.st_dev, dest_stat.st_ino) == (source_stat.st_dev, source_stat.st_ino):
+                return dest_path
+            if dest_stat.st_size == source_stat.st_size and dest_stat.st_mtime_ns >= source_stat.st_mtime_ns:
+                return dest_path
+        os.remove(dest_path)
+    return placeFile(source_path, dest_path)
+
+def fileDigest(file_path):
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if key in digest_cache:
+        return digest_cache[key]
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    digest_cache[key] = digest.hexdigest()
+    return digest_cache[key]
+
+def storeDirFor(dest_path):
+    if artifact_settings['store']:
+        return artifact_settings['store']
+    report_dir = os.path.dirname(os.path.abspath(dest_path))
+    return os.path.join(os.path.dirname(report_dir), STORE_DIR_NAME)
+
+# Decompresses a .gz file into the content-addressed store, keyed by the hash
+# of the compressed bytes, unless an identical archive was inflated before.
+# Args:
+#     gz_path (str): The .gz file to inflate.
+#     store_dir (str): The store directory.
+# Returns:
+#     str: The path of the decompressed content inside the store.
+def inflateToStore(gz_path, store_dir):
+    digest = fileDigest(gz_path)
+    stored_path = os.path.join(store_dir, digest[:2], digest)
+    if os.path.exists(stored_path):
+        return stored_path
+
+    os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(stored_path), suffix=".tmp")
+    try:
+        with gzip.open(gz_path, 'rb') as f_in:
+            with os.fdopen(fd, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+        os.replace(tmp_path, stored_path)
+        instrumentation.countInflated(os.path.getsize(stored_path))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return stored_path
+
+# Places the decompressed content of a .gz file at dest_path, sharing the
+# inflated bytes with every other report that references the same archive.
+# Args:
+#     gz_path (str): The .gz file.
+#     dest_path (str): Where the decompressed file should appear.
+# Returns:
+#     str: dest_path.
+def placeGzipFile(gz_path, dest_path):
+    if os.path.lexists(dest_path):
+        return dest_path
+    with instrumentation.stage("artifact_copy"):
+        stored_path = inflateToStore(gz_path, storeDirFor(dest_path))
+        return placeFile(stored_path, dest_path)
@@ -0,0 +1,225 @@
+import os
+import sys
+import logging
+import log_config
+
+INCREMENTAL_FLAG = "--incremental"
+NO_RENDER_FLAG = "--no-render"
+WATCH_FLAG = "--watch"
+TEST_FLAG = "--test"
+UPDATE_BASELINE_FLAG = "--update-baseline"
+# Options every command takes: worker processes (0 for one per CPU), the memory budget
+# (e.g. 4G), past which finished structures are spilled to disk, and the directory of the
+# report cache database, the artifact store and the spill files.
+COMMON_OPTIONS = {'workers': 0, 'memory_budget': "", 'cache_dir': ""}
+COMMON_USAGE = "[--workers=N] [--memory-budget=SIZE] [--cache-dir=DIR] [--debug]"
+BATCH_USAGE = "[max_files] [show_errors] [--format=html|json|both] [--rules=rules.json] [--trend_days=14] [--no-render]"
+USAGES = {
+    'parse': "parse <report_directory> [lrg_directory] [--incremental] [--no-render] [--rules=rules.json]",
+    'batch': "batch <report_directory> <start_directory> " + BATCH_USAGE + " [--watch [--interval=5] [--debounce=2]]",
+    'clean-run': "clean-run <report_directory> <start_directory> [--test]",
+    'pipeline': "pipeline <report_directory> <start_directory> " + BATCH_USAGE,
+    'render': "render <report_directory>...",
+    'bench': "bench [--<shape key>=N ...] [--repeat=3] [--tolerance=0.25] [--scenarios=startup,...] [--update-baseline]",
+    'serve': "serve <report_directory> [--host=127.0.0.1] [--port=8000] [--cache-size=256]",
+}
+
+logger = logging.getLogger(__name__)
+
+def usage(command=None):
+    commands = [command] if command else list(USAGES)
+    return "Usage:\n" + "\n".join("  python finishedlog.py {} {}".format(USAGES[name], COMMON_USAGE) for name in commands)
+
+# Removes the --key=value options named in defaults from a list of arguments. Keys are
+# accepted with dashes or underscores, and values take the type of their default.
+# Returns:
+#     tuple: The other arguments, and the options with the defaults of those not given.
+def pop_options(argv, defaults):
+    options = dict(defaults)
+    remaining = []
+    for arg in argv:
+        key = arg[2:].split("=", 1)[0].replace("-", "_") if arg.startswith("--") and "=" in arg else None
+        if key in options:
+            options[key] = type(options[key])(arg.split("=", 1)[1])
+        else:
+            remaining.append(arg)
+    return remaining, options
+
+# Removes flags from a list of arguments.
+# Returns:
+#     tuple: The other arguments, and the set of flags that were given.
+def pop_flags(argv, flags):
+    return [arg for arg in argv if arg not in flags], {arg for arg in argv if arg in flags}
+
+# Applies the options every command takes. The environment is set as well, so worker
+# processes and benchmark scenarios started from this one get the same settings.
+def apply_common_options(options):
+    import report_db
+    import memory_budget
+    from file_parser import placeArtifact
+    if options['cache_dir']:
+        store_dir = os.path.join(options['cache_dir'], placeArtifact.STORE_DIR_NAME)
+        os.environ[report_db.CACHE_DIR_ENV] = options['cache_dir']
+        os.environ[placeArtifact.ARTIFACT_STORE_ENV] = store_dir
+        os.environ[memory_budget.SPILL_DIR_ENV] = options['cache_dir']
+        report_db.set_cache_dir(options['cache_dir'])
+        memory_budget.setSpillDir(options['cache_dir'])
+        placeArtifact.setArtifactMode(placeArtifact.getArtifactMode(), store_dir)
+    if options['memory_budget']:
+        os.environ[memory_budget.MEMORY_BUDGET_ENV] = options['memory_budget']
+        memory_budget.setMemoryBudget(memory_budget.parseByteSize(options['memory_budget']))
+
+# Reads the positional arguments and options of the batch and pipeline commands, as
+# batch_report.py takes them.
+# Returns:
+#     tuple: The report and start directories, max_files, show_errors and the batch options.
+def batch_arguments(command, argv, workers):
+    import batch_report
+    argv, options = pop_options(argv, {key: value for key, value in batch_report.BATCH_OPTIONS.items() if key != 'workers'})
+    if len(argv) < 2 or options['format'] not in batch_report.REPORT_FORMATS:
+        raise ValueError(usage(command))
+    options['workers'] = workers
+    max_files = None
+    show_errors = False
+    if len(argv) > 2:
+        try:
+            max_files = int(argv[2])
+        except ValueError:
+            max_files = None
+    if len(argv) > 3:
+        show_errors = argv[3].lower() == 'true'
+    return argv[0], argv[1], max_files, show_errors, options
+
+def run_parse(argv, common):
+    import main
+    import log_parser
+    argv, flags = pop_flags(argv, (INCREMENTAL_FLAG, NO_RENDER_FLAG))
+    argv, options = pop_options(argv, {'rules': ""})
+    if len(argv) < 1:
+        raise ValueError(usage('parse'))
+    main.parseLog(argv[0], argv[1] if len(argv) > 1 else '.', incremental=INCREMENTAL_FLAG in flags, render=NO_RENDER_FLAG not in flags, detailRules=log_parser.loadDetailRules(options['rules']))
+
+def run_batch(argv, common):
+    import batch_report
+    import log_parser
+    argv, flags = pop_flags(argv, (WATCH_FLAG, NO_RENDER_FLAG))
+    report_dir, start_dir, max_files, show_errors, options = batch_arguments('batch', argv, common['workers'])
+    detail_rules = log_parser.loadDetailRules(options['rules'])
+    # The JSON report is browsed through viewer.html, which needs no per-LRG pages.
+    render = NO_RENDER_FLAG not in flags and options['format'] != "json"
+    if WATCH_FLAG in flags:
+        batch_report.watch_batch(report_dir, start_dir, show_errors, options['interval'], options['workers'], options['debounce'], render=render, report_format=options['format'], detail_rules=detail_rules, trend_days=options['trend_days'])
+    else:
+        batch_report.batch_parse(report_dir, start_dir, max_files, show_errors, render, options['format'], detail_rules, options['trend_days'])
+
+def run_clean_run(argv, common):
+    import clean_run_report
+    argv, flags = pop_flags(argv, (TEST_FLAG,))
+    if len(argv) < 2:
+        raise ValueError(usage('clean-run'))
+    clean_run_report.clean_run_report(argv[0], argv[1], TEST_FLAG in flags, common['workers'] or None)
+
+# Builds the clean run baseline and then the batch report of the same LRGs in one process.
+# The LRG directories are listed and probed once for both stages, the clean run errors the
+# baseline stage saved are read back in one query and kept in memory while the batch
+# compares every LRG against them, unless that would exceed the memory budget, and the
+# templates and modules loaded for the first LRG serve all the others.
+def run_pipeline(argv, common):
+    import report_db
+    import batch_report
+    import clean_run_report
+    import lrg_discovery
+    import log_parser
+    import memory_budget
+    argv, flags = pop_flags(argv, (NO_RENDER_FLAG,))
+    report_dir, start_dir, max_files, show_errors, options = batch_arguments('pipeline', argv, common['workers'])
+    if not os.path.exists(start_dir):
+        raise ValueError(f"Start directory {start_dir} does not exist.")
+    detail_rules = log_parser.loadDetailRules(options['rules'])
+    render = NO_RENDER_FLAG not in flags and options['format'] != "json"
+
+    lrgs = list(lrg_discovery.discoverLrgs(start_dir, check_watson_dif=True))
+    logger.info("Found %d LRG directories in %s", len(lrgs), start_dir)
+    clean_run_report.clean_run_report(report_dir, start_dir, workers=options['workers'] or None, lrgs=lrgs)
+
+    with report_db.open_report_db(batch_report.report_db_dir(report_dir)) as db:
+        kept = report_db.keep_clean_run_errors(db)
+    if memory_budget.overBudget():
+        report_db.release_clean_run_errors()
+        logger.info("Reading clean run errors from the database, keeping them would exceed the memory budget")
+    else:
+        logger.info("Keeping %d clean run errors in memory for the batch", kept)
+    try:
+        batch_report.batch_parse(report_dir, start_dir, max_files, show_errors, render, options['format'], detail_rules, options['trend_days'], lrgs=lrgs)
+    finally:
+        report_db.release_clean_run_errors()
+
+# Renders LRG reports again from their saved parse results, without parsing the LRGs.
+# A directory without a parse result has each of its LRG report folders rendered.
+def run_render(argv, common):
+    import log_parser
+    import html_parser
+    if len(argv) < 1:
+        raise ValueError(usage('render'))
+    for directory in argv:
+        if os.path.exists(os.path.join(directory, log_parser.PARSE_RESULT_FILE_NAME)):
+            report_dirs = [directory]
+        else:
+            report_dirs = sorted(entry.path for entry in os.scandir(directory) if os.path.exists(os.path.join(entry.path, log_parser.PARSE_RESULT_FILE_NAME)))
+            if not report_dirs:
+                raise ValueError(f"No parse results found in {directory}")
+        for report_dir in report_dirs:
+            logger.info("Rendering %s", report_dir)
+            html_parser.createLogFolder(log_parser.loadParseResult(report_dir), report_dir)
+
+def run_bench(argv, common):
+    import benchmark
+    import synthetic_lrg
+    argv, flags = pop_flags(argv, (UPDATE_BASELINE_FLAG,))
+    argv, options = pop_options(argv, {'repeat': 3, 'tolerance': benchmark.DEFAULT_TOLERANCE, 'scenarios': ",".join(benchmark.SCENARIOS)})
+    regressions = benchmark.benchmark(synthetic_lrg.parseShapeArgs(argv), options['scenarios'].split(","), options['repeat'], options['tolerance'], UPDATE_BASELINE_FLAG in flags)
+    if regressions:
+        print("Performance regressions:")
+        for regression in regressions:
+            print("  " + regression)
+        return 1
+    return 0
+
+def run_serve(argv, common):
+    import report_server
+    argv, options = pop_options(argv, report_server.SERVER_OPTIONS)
+    if len(argv) < 1:
+        raise ValueError(usage('serve'))
+    report_server.serve(argv[0], options['host'], options['port'], options['cache_size'])
+
+COMMANDS = {
+    'parse': run_parse,
+    'batch': run_batch,
+    'clean-run': run_clean_run,
+    'pipeline': run_pipeline,
+    'render': run_render,
+    'bench': run_bench,
+    'serve': run_serve,
+}
+
+# Runs one command of the command line.
+# Args:
+#     argv (list): The arguments, usually sys.argv.
+# Returns:
+#     int: The exit status.
+def main(argv):
+    argv, debug = log_config.popDebugFlag(argv)
+    log_config.configureLogging(debug)
+    if len(argv) < 2 or argv[1] not in COMMANDS:
+        raise ValueError(usage())
+    command = argv[1]
+    arguments, common = pop_options(argv[2:], COMMON_OPTIONS)
+    apply_common_options(common)
+    return COMMANDS[command](arguments, common) or 0
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv))
+    except KeyboardInterrupt:
+        print("\nScript interrupted by user. Exiting...")
+        sys.exit(0)
@@ -1,2 +1,20 @@
-from .createLogFolders import *
-from .file_to_html import *
\ No newline at end of file
+from lazy_package import lazyExports
+
+# Imported on first use, so parses that render no HTML do not load bs4.
+lazyExports(__name__, {
+    "createLogFolders": (
+        "loadTemplate",
+        "copy_file_to_report_dir",
+        "static_file_link",
+        "render_index_page",
+        "render_ru_page",
+        "render_shard_group_page",
+        "render_history_page",
+        "history_page_names",
+        "createLogFolder",
+    ),
+    "file_to_html": (
+        "convert_file_to_html",
+        "render_file_chunk",
+    ),
+})
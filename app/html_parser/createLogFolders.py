@@ -1,9 +1,28 @@
 import bs4
 import os
+import logging
 import datetime
-import uuid
-import gzip
-import shutil
+import re
+import json
+import hashlib
+import functools
+from file_parser.placeArtifact import placeFile, placeGzipFile
+from log_parser.parseState import writeJsonAtomic
+from log_parser.errorRollups import errorRollups
+from log_parser.leadershipStats import leadershipStats, FLAP_WINDOW_SECONDS
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'html_assets', 'template')
+RENDER_MANIFEST_FILE_NAME = "render_manifest.json"
+LEGACY_HISTORY_PAGE_PATTERN = re.compile(r'^history_[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.html$')
+COPY_PATH_SCRIPT = "navigator.clipboard.writeText(this.href); event.preventDefault(); alert('Path copied to clipboard!');"
+
+logger = logging.getLogger(__name__)
+
+# Templates are read once per process; the report server renders many pages from them.
+@functools.lru_cache(maxsize=None)
+def loadTemplate(name):
+    with open(os.path.join(TEMPLATE_DIR, name), 'r', encoding='utf-8', errors='ignore') as f:
+        return f.read()
 
 def copy_file_to_report_dir(file_path, report_dir):
     if not file_path or 'file:///' in file_path:
@@ -22,43 +41,42 @@ def copy_file_to_report_dir(file_path, report_dir):
         unzipped_base_name = os.path.basename(file_path[:-3])
         dest_path = os.path.join(report_dir, unzipped_base_name)
         
-        if not os.path.exists(dest_path):
-            with gzip.open(file_path, 'rb') as f_in:
-                with open(dest_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
+        placeGzipFile(file_path, dest_path)
         
         return './' + unzipped_base_name
     else:
         base_name = os.path.basename(file_path)
         dest_path = os.path.join(report_dir, base_name)
         
-        if not os.path.exists(dest_path):
-            shutil.copy(file_path, dest_path)
+        placeFile(file_path, dest_path)
             
         return './' + base_name
 
-# Generates an HTML log folder from a dictionary of results.
+# Links an error's trace file from a static report page, placing the file in the report.
+# Args:
+#     file_path (str): The trace (or its converted .html) file.
+#     scroll_index (int): The line to scroll to, or None.
+#     report_dir (str): The report directory.
+# Returns:
+#     str: The href.
+def static_file_link(file_path, scroll_index, report_dir):
+    link_path = copy_file_to_report_dir(file_path, report_dir)
+    if scroll_index is not None:
+        link_path += f"#line{scroll_index}"
+    return link_path
+
+# Renders the LRG's index page: the RUIDs, and the trace, Watson, GSM and clean run diff tables.
 # Args:
 #     results (dict): A dictionary containing the parsed log data.
-def createLogFolder(results, results_dir):
+#     logDirectory (str): The report directory, trace and Watson files are placed in it.
+#     file_link (function): Builds the href of a trace, Watson or error trace file, see
+#                           static_file_link. The trace and Watson files are linked without
+#                           a line to scroll to.
+# Returns:
+#     str: The page.
+def render_index_page(results, logDirectory, file_link=static_file_link):
     directoryName = results['logDirectory']
-    logDirectory = results_dir
-    os.makedirs(logDirectory, exist_ok=True)
-
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    main_html_path = os.path.join(script_dir, '..', 'html_assets', 'template', 'main.html')
-    ruLogPath = os.path.join(script_dir, '..', 'html_assets', 'template', 'emptyRULog.html')
-    shardLogPath = os.path.join(script_dir, '..', 'html_assets', 'template', 'emptyShardLog.html')
-    style_css_path = os.path.join(script_dir, '..', 'html_assets', 'template', 'style.css')
-    history_log_path = os.path.join(script_dir, '..', 'html_assets', 'template', 'emptyShardLogHistory.html')
-
-    with open(main_html_path, 'r', encoding='utf-8', errors='ignore') as f:
-        shardListHTML = f.read()
-
-    with open(style_css_path, 'r', encoding='utf-8', errors='ignore') as f:
-        globalCSS = f.read()
-
-    soup = bs4.BeautifulSoup(shardListHTML, 'html.parser')
+    soup = bs4.BeautifulSoup(loadTemplate('main.html'), 'html.parser')
 
     logTitle = soup.find("h1", class_="main-title")
     logTitle.string = "{} replication unit".format(os.path.basename(directoryName))
@@ -66,19 +84,10 @@ def createLogFolder(results, results_dir):
     tableBody = soup.find('tbody')
     tableBody.clear()
 
-    ruid_error_flags = {ruid: False for ruid in results['allRUIDS']}
-    for ruid in results['allRUIDS']:
-        for shard_group in results['history'][ruid]:
-            for event in results['history'][ruid][shard_group]:
-                if event.get('errors'):
-                    ruid_error_flags[ruid] = True
-                    break
-            if ruid_error_flags[ruid]:
-                break
-
+    rollups = errorRollups(results)['ruids']
     for ruid in results['allRUIDS']:
         newRow = soup.new_tag('tr')
-        if ruid_error_flags[ruid]:
+        if rollups[ruid]['errors']:
             newRow['class'] = 'error-highlight'
         cell1 = soup.new_tag('td')
         link = soup.new_tag('a', attrs={'href': './RULog{}.html'.format(ruid)})
@@ -87,13 +96,7 @@ def createLogFolder(results, results_dir):
         newRow.append(cell1)
 
         error_cell = soup.new_tag('td')
-        errors = list() #set
-        for shard_group in results['history'][ruid]:
-            for event in results['history'][ruid][shard_group]:
-                if event.get('errors'):
-                    for error in event.get('errors'):
-                        if error.get('code') not in errors:
-                            errors.append(error.get('code'))
+        errors = rollups[ruid]['codes']
         error_cell.string = str(errors) if errors else "No Errors"
         newRow.append(error_cell)
         tableBody.append(newRow)
@@ -126,10 +129,10 @@ def createLogFolder(results, results_dir):
             file_cell = soup.new_tag('td')
             file_path = item.get('file')
             if file_path:
-                link_path = copy_file_to_report_dir(file_path, logDirectory)
-                file_link = soup.new_tag('a', attrs={'href': link_path, 'oncontextmenu': "navigator.clipboard.writeText(this.href); event.preventDefault(); alert('Path copied to clipboard!');"})
-                file_link.string = os.path.basename(file_path)
-                file_cell.append(file_link)
+                link_path = file_link(file_path, None, logDirectory)
+                trace_link = soup.new_tag('a', attrs={'href': link_path, 'oncontextmenu': "navigator.clipboard.writeText(this.href); event.preventDefault(); alert('Path copied to clipboard!');"})
+                trace_link.string = os.path.basename(file_path)
+                file_cell.append(trace_link)
             else:
                 file_cell.string = "N/A"
             new_row.append(file_cell)
@@ -138,7 +141,7 @@ def createLogFolder(results, results_dir):
             log_cell = soup.new_tag('td')
             log_file_path = item.get('log_file')
             if log_file_path:
-                link_path = copy_file_to_report_dir(log_file_path, logDirectory)
+                link_path = file_link(log_file_path, None, logDirectory)
                 log_link = soup.new_tag('a', attrs={'href': link_path, 'oncontextmenu': "navigator.clipboard.writeText(this.href); event.preventDefault(); alert('Path copied to clipboard!');"})
                 log_link.string = os.path.basename(log_file_path)
                 log_cell.append(log_link)
@@ -182,14 +185,14 @@ def createLogFolder(results, results_dir):
             new_row = soup.new_tag('tr')
             
             dif_cell = soup.new_tag('td')
-            dif_link = soup.new_tag('a', attrs={'href': copy_file_to_report_dir(difFile, logDirectory), 'oncontextmenu': "navigator.clipboard.writeText(this.href); event.preventDefault(); alert('Path copied to clipboard!');"})
+            dif_link = soup.new_tag('a', attrs={'href': file_link(difFile, None, logDirectory), 'oncontextmenu': "navigator.clipboard.writeText(this.href); event.preventDefault(); alert('Path copied to clipboard!');"})
             dif_link.string = os.path.basename(item['dif_file'])
             dif_cell.append(dif_link)
             new_row.append(dif_cell)
 
             log_cell = soup.new_tag('td')
             if item.get('log_file') and os.path.exists(item['log_file']):
-                log_link = soup.new_tag('a', attrs={'href': copy_file_to_report_dir(logFile, logDirectory), 'oncontextmenu': "navigator.clipboard.writeText(this.href); event.preventDefault(); alert('Path copied to clipboard!');"})
+                log_link = soup.new_tag('a', attrs={'href': file_link(logFile, None, logDirectory), 'oncontextmenu': "navigator.clipboard.writeText(this.href); event.preventDefault(); alert('Path copied to clipboard!');"})
                 log_link.string = os.path.basename(item['log_file'])
                 log_cell.append(log_link)
             else:
@@ -290,9 +293,7 @@ def createLogFolder(results, results_dir):
             file_cell = soup.new_tag('td')
             if 'ospFile' in item and item['ospFile']:
                 osp_path = item['ospFile']
-                link_path = copy_file_to_report_dir(osp_path, logDirectory)
-                if 'scrollIndex' in item:
-                    link_path += f"#line{item['scrollIndex']}"
+                link_path = file_link(osp_path, item.get('scrollIndex'), logDirectory)
                 error_file = soup.new_tag('a', attrs={'href': link_path, 'target' : "_blank"})
                 error_file.string = os.path.basename(osp_path)
                 file_cell.append(error_file)
@@ -318,162 +319,300 @@ def createLogFolder(results, results_dir):
         diff_container.append(diff_table)
         container.append(diff_container)
 
-    resultingHTML = soup.prettify()
+    return soup.prettify()
+
+def format_seconds(value):
+    return "{:.2f}".format(value) if value is not None else "N/A"
+
+def format_flapping(stats):
+    return "Since {}".format(stats['flap_start'].split('+')[0]) if stats['flapping'] else "No"
+
+# The leadership statistics of one RUID in one shard group, as the cells of a table row.
+def leadership_cells(soup, stats):
+    values = ["{}".format(stats['terms']), "{:.2f}".format(stats['terms_per_hour']), format_seconds(stats['recovery_mean']),
+              format_seconds(stats['recovery_p95']), format_seconds(stats['recovery_max']), format_seconds(stats['first_leader_seconds'])]
+    cells = []
+    for value in values:
+        cell = soup.new_tag('td')
+        cell.string = value
+        cells.append(cell)
+    return cells
+
+# Renders the page listing the shard groups of one RUID.
+def render_ru_page(results, ruid):
+    ruidSoup = bs4.BeautifulSoup(loadTemplate('emptyRULog.html'), 'html.parser')
+
+    mainRUIDTitle = ruidSoup.find("h1", class_ = "main-title")
+    mainRUIDTitle.string = "Shard Groups for RUID: {}".format(ruid)
+    shardGroupList = ruidSoup.find('tbody')
+    shardGroupList.clear()
+    rollups = errorRollups(results)['ruids'][ruid]['shard_groups']
+    stats = leadershipStats(results)['ruids'][ruid]
+    for shardGroup in results['shardGroups']:
+        newRow = ruidSoup.new_tag('tr')
+        if rollups[shardGroup]['errors']:
+            newRow['class'] = 'error-highlight'
 
-    with open(os.path.join(logDirectory,"index.html"), 'w', encoding='utf-8') as f:
-        f.write(resultingHTML)
+        cell1 = ruidSoup.new_tag('td')
+        link = ruidSoup.new_tag('a', attrs={'href': './ShardGroupLog_{}_RUID_{}.html'.format(shardGroup, ruid)})
+        link.string = "Shard Group {}".format(shardGroup)
+        cell1.append(link)
+        newRow.append(cell1)
 
-    with open(os.path.join(logDirectory,"style.css"),'w', encoding='utf-8') as f:
-        f.write(globalCSS)
+        error_cell = ruidSoup.new_tag('td')
+        errors = rollups[shardGroup]['codes']
+        error_cell.string = str(errors) if errors else "No Errors"
+        newRow.append(error_cell)
 
-    for ruid in results['allRUIDS']:
-        with open(ruLogPath,'r', encoding='utf-8', errors='ignore') as fp:
-            ruidSoup = bs4.BeautifulSoup(fp.read(), 'html.parser')
+        for cell in leadership_cells(ruidSoup, stats[shardGroup]):
+            newRow.append(cell)
+        flapping_cell = ruidSoup.new_tag('td')
+        flapping_cell.string = format_flapping(stats[shardGroup])
+        newRow.append(flapping_cell)
+        shardGroupList.append(newRow)
+
+    return ruidSoup.prettify()
+
+# Renders the leadership history of one RUID in one shard group.
+# Args:
+#     results (dict): A dictionary containing the parsed log data.
+#     ruid (int): The RUID.
+#     shardGroup (str): The shard group.
+#     history_names (list): The file name of each term's history page, in order.
+# Returns:
+#     str: The page.
+def render_shard_group_page(results, ruid, shardGroup, history_names):
+    shardGroupSoup = bs4.BeautifulSoup(loadTemplate('emptyShardLog.html'), 'html.parser')
+
+    shardGroupTitle = shardGroupSoup.find("h1", class_="main-title")
+    shardGroupTitle.string = "Leadership History for Shard Group {} for RU_ID {}".format(shardGroup, ruid)
+    shardGroupHistory = list(results['history'][ruid][shardGroup])
+
+    logResultList = shardGroupSoup.find('tbody')
+    logResultList.clear()
+    for logResult, history_filename in zip(shardGroupHistory, history_names):
+        log_result_error = False
+        if logResult.get('errors'):
+            log_result_error = True
+
+        has_new_error = (ruid, shardGroup, logResult['term']) in results.get('terms_with_new_errors', set())
+
+        newRow = shardGroupSoup.new_tag('tr')
+        if has_new_error:
+            newRow['class'] = 'error-highlight-new'
+        elif log_result_error:
+            newRow['class'] = 'error-highlight'
 
-        mainRUIDTitle = ruidSoup.find("h1", class_ = "main-title")
-        mainRUIDTitle.string = "Shard Groups for RUID: {}".format(ruid)
-        shardGroupList = ruidSoup.find('tbody')
-        shardGroupList.clear()
+        cell1 = shardGroupSoup.new_tag('td')
+        link = shardGroupSoup.new_tag('a', attrs={'href': './{}'.format(history_filename)})
+        link.string = logResult['timestamp'].split('+')[0]
+        cell1.append(link)
+        newRow.append(cell1)
+
+        cell2 = shardGroupSoup.new_tag('td')
+        cell2.string = logResult['dbName']
+        newRow.append(cell2)
+
+        cell3 = shardGroupSoup.new_tag('td')
+        cell3.string = str(logResult['dbId'])
+        newRow.append(cell3)
+
+        cell4 = shardGroupSoup.new_tag('td')
+        cell4.string = "{}".format(logResult['term'])
+        newRow.append(cell4)
+
+        cell5 = shardGroupSoup.new_tag('td')
+        cell5.string = "{:.2f}".format(logResult.get('recoveryTime', 0))
+        newRow.append(cell5)
+
+        logResultList.append(newRow)
+
+    stats = leadershipStats(results)['ruids'][ruid][shardGroup]
+    statsContainer = shardGroupSoup.new_tag('div', attrs={'class': 'table-container'})
+    statsTable = shardGroupSoup.new_tag('table')
+    statsHead = shardGroupSoup.new_tag('thead')
+    statsHeaderRow = shardGroupSoup.new_tag('tr')
+    headers = ["Terms", "Terms per Hour", "Mean Recovery", "p95 Recovery", "Max Recovery", "Time to First Leader",
+               "Most Terms in {} Minutes".format(FLAP_WINDOW_SECONDS // 60), "Flapping"]
+    for header_text in headers:
+        header = shardGroupSoup.new_tag('th')
+        header.string = header_text
+        statsHeaderRow.append(header)
+    statsHead.append(statsHeaderRow)
+    statsTable.append(statsHead)
+    statsBody = shardGroupSoup.new_tag('tbody')
+    statsRow = shardGroupSoup.new_tag('tr')
+    if stats['flapping']:
+        statsRow['class'] = 'error-highlight'
+    for cell in leadership_cells(shardGroupSoup, stats):
+        statsRow.append(cell)
+    windowCell = shardGroupSoup.new_tag('td')
+    windowCell.string = str(stats['max_window_terms'])
+    statsRow.append(windowCell)
+    flappingCell = shardGroupSoup.new_tag('td')
+    flappingCell.string = format_flapping(stats)
+    statsRow.append(flappingCell)
+    statsBody.append(statsRow)
+    statsTable.append(statsBody)
+    statsContainer.append(statsTable)
+    shardGroupTitle.insert_after(statsContainer)
+
+    return shardGroupSoup.prettify()
+
+# Renders the events and errors of one leadership term.
+# Args:
+#     logResult (dict): The term, from results['history'].
+#     logDirectory (str): The report directory, trace files are placed in it.
+#     file_link (function): Builds the href of an error's trace file, see static_file_link.
+# Returns:
+#     str: The page.
+def render_history_page(logResult, logDirectory, file_link=static_file_link):
+    historySoup = bs4.BeautifulSoup(loadTemplate('emptyShardLogHistory.html'), 'html.parser')
+    history_title = historySoup.find("h1", class_="main-title")
+    history_title.string = "History for Term {}".format(logResult['term'])
+    history_table_body = historySoup.find('tbody')
+    history_table_body.clear()
+
+    all_events = list(logResult.get('history', [])) + logResult.get('errors', [])
+    all_events.sort(key=lambda result: datetime.datetime.fromisoformat(result['timestamp'].strip()).timestamp(), reverse=False)
+
+    for history_item in all_events:
+        history_item_row = historySoup.new_tag('tr', attrs={'class': 'hoverable-row'})
+        if history_item.get('type') == 'error':
+            history_item_row['class'] = history_item_row.get('class', [])
+            if history_item.get('isNew', False):
+                history_item_row['class'].append('event-error-new')
+            else:
+                history_item_row['class'].append('event-error')
+
+        ts_cell = historySoup.new_tag('td')
+        if 'ospFile' in history_item and history_item['ospFile']:
+            osp_path = history_item['ospFile']
+            link_path = file_link(osp_path, history_item.get('scrollIndex'), logDirectory)
+            error_file = historySoup.new_tag('a', attrs={'href': link_path, 'target' : "_blank"})
+            error_file.string = history_item['timestamp'].split('+')[0]
+            ts_cell.append(error_file)
+        else:
+            ts_cell.append(history_item['timestamp'].split('+')[0])
+
+        info_div = historySoup.new_tag('div', attrs={'class': 'row-info'})
+        parameter_info = "".join(history_item['parameters'])
+        logger.debug("Rendering history item %s", history_item)
+        info_div.string = history_item['original'] + parameter_info
+        ts_cell.append(info_div)
+        history_item_row.append(ts_cell)
+
+        db_name_cell = historySoup.new_tag('td')
+        db_name_cell.string = history_item['dbName']
+        history_item_row.append(db_name_cell)
+
+        db_id_cell = historySoup.new_tag('td')
+        db_id_cell.string = str(history_item['dbId'])
+        history_item_row.append(db_id_cell)
+
+        event_cell = historySoup.new_tag('td')
+        targetReason = "N/A"
+        if 'reason' in history_item:
+            targetReason = history_item['reason']
+        if history_item['type'] == 'error':
+            event_cell.string = "Error: ({})".format(history_item['code'])
+        else:
+            event_cell.string = "{} / {}".format(history_item['type'], targetReason)
+        history_item_row.append(event_cell)
+
+        history_table_body.append(history_item_row)
+
+    return historySoup.prettify()
+
+# Names a term's history page after the term itself, so a re-render writes the same
+# file for the same term. Terms sharing a term number and database get a suffix.
+# Args:
+#     ruid (int): The RUID.
+#     shardGroup (str): The shard group.
+#     terms (list): The shard group's terms, in page order.
+# Returns:
+#     list: The page name of each term.
+def history_page_names(ruid, shardGroup, terms):
+    names = []
+    seen = {}
+    for term in terms:
+        name = "history_{}_{}_{}_{}".format(ruid, shardGroup, term['term'], term['dbId'])
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            name += "_{}".format(seen[name])
+        names.append(name + ".html")
+    return names
+
+def loadRenderManifest(report_dir):
+    manifest_path = os.path.join(report_dir, RENDER_MANIFEST_FILE_NAME)
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable render manifest %s: %s", manifest_path, e)
+        return {}
+
+# Writes a page unless the previous render wrote the same content to it.
+# Args:
+#     report_dir (str): The report directory.
+#     name (str): The page's file name.
+#     page (str): The page.
+#     previous (dict): The previous render's manifest, page name -> content hash.
+#     manifest (dict): This render's manifest, the page is recorded in it.
+# Returns:
+#     bool: Whether the page was written.
+def write_page(report_dir, name, page, previous, manifest):
+    data = page.encode('utf-8')
+    digest = hashlib.sha1(data).hexdigest()
+    manifest[name] = digest
+    path = os.path.join(report_dir, name)
+    if previous.get(name) == digest and os.path.exists(path):
+        return False
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+# Removes the pages the previous render wrote that this one did not, and history
+# pages left behind by renders that named them with random UUIDs.
+def prunePages(report_dir, previous, manifest):
+    stale = [name for name in previous if name not in manifest]
+    stale.extend(name for name in os.listdir(report_dir) if LEGACY_HISTORY_PAGE_PATTERN.match(name))
+    for name in stale:
+        try:
+            os.remove(os.path.join(report_dir, name))
+        except FileNotFoundError:
+            pass
+    return len(stale)
+
+# Generates an HTML log folder from a dictionary of results.
+# This is the static export used for archiving; report_server renders the same pages on request.
+# Pages whose content did not change since the previous render are not rewritten, and
+# pages that are no longer part of the report are removed, so a re-run only touches
+# the files that changed.
+# Args:
+#     results (dict): A dictionary containing the parsed log data.
+#     results_dir (str): The report directory.
+def createLogFolder(results, results_dir):
+    logDirectory = results_dir
+    os.makedirs(logDirectory, exist_ok=True)
+    previous = loadRenderManifest(logDirectory)
+    manifest = {}
+    written = write_page(logDirectory, "index.html", render_index_page(results, logDirectory), previous, manifest)
+    written += write_page(logDirectory, "style.css", loadTemplate('style.css'), previous, manifest)
+
+    for ruid in results['allRUIDS']:
         for shardGroup in results['shardGroups']:
-            shard_group_error = False
-            for event in results['history'][ruid][shardGroup]:
-                if event.get('errors'):
-                    shard_group_error = True
-                    break
-            
-            newRow = soup.new_tag('tr')
-            if shard_group_error:
-                newRow['class'] = 'error-highlight'
-
-            cell1 = soup.new_tag('td')
-            link = soup.new_tag('a', attrs={'href': './ShardGroupLog_{}_RUID_{}.html'.format(shardGroup, ruid)})
-            link.string = "Shard Group {}".format(shardGroup)
-            cell1.append(link)
-            newRow.append(cell1)
-
-            error_cell = soup.new_tag('td')
-            errors = list() #set
-            for event in results['history'][ruid][shardGroup]:
-                if event.get('errors'):
-                    for error in event.get('errors'):
-                        if error.get('code') not in errors:
-                            errors.append(error.get('code'))
-            error_cell.string = str(errors) if errors else "No Errors"
-            newRow.append(error_cell)
-            shardGroupList.append(newRow)
-
-            with open(shardLogPath, 'r', encoding='utf-8', errors='ignore') as fp:
-                shardGroupSoup = bs4.BeautifulSoup(fp.read(), 'html.parser')
-
-            shardGroupTitle = shardGroupSoup.find("h1", class_="main-title")
-            shardGroupTitle.string = "Leadership History for Shard Group {} for RU_ID {}".format(shardGroup, ruid)
-            shardGroupHistory = list(results['history'][ruid][shardGroup])
-
-            logResultList = shardGroupSoup.find('tbody')
-            logResultList.clear()
-            for logResult in shardGroupHistory:
-                log_result_error = False
-                if logResult.get('errors'):
-                    log_result_error = True
-                
-                has_new_error = (ruid, shardGroup, logResult['term']) in results.get('terms_with_new_errors', set())
-                
-                newRow = soup.new_tag('tr')
-                if has_new_error:
-                    newRow['class'] = 'error-highlight-new'
-                elif log_result_error:
-                    newRow['class'] = 'error-highlight'
-
-                history_filename = "history_{}.html".format(uuid.uuid4())
-                cell1 = soup.new_tag('td')
-                link = soup.new_tag('a', attrs={'href': './{}'.format(history_filename)})
-                link.string = logResult['timestamp'].split('+')[0]
-                cell1.append(link)
-                newRow.append(cell1)
-
-                cell2 = soup.new_tag('td')
-                cell2.string = logResult['dbName']
-                newRow.append(cell2)
-
-                cell3 = soup.new_tag('td')
-                cell3.string = str(logResult['dbId'])
-                newRow.append(cell3)
-
-                cell4 = soup.new_tag('td')
-                cell4.string = "{}".format(logResult['term'])
-                newRow.append(cell4)
-
-                cell5 = soup.new_tag('td')
-                cell5.string = "{:.2f}".format(logResult.get('recoveryTime', 0))
-                newRow.append(cell5)
-
-                logResultList.append(newRow)
-
-                with open(history_log_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    history_html = f.read()
-
-                historySoup = bs4.BeautifulSoup(history_html, 'html.parser')
-                history_title = historySoup.find("h1", class_="main-title")
-                history_title.string = "History for Term {}".format(logResult['term'])
-                history_table_body = historySoup.find('tbody')
-                history_table_body.clear()
-
-                all_events = logResult.get('history', []) + logResult.get('errors', [])
-                all_events.sort(key=lambda result: datetime.datetime.fromisoformat(result['timestamp'].strip()).timestamp(), reverse=False)
-
-                for history_item in all_events:
-                    history_item_row = soup.new_tag('tr', attrs={'class': 'hoverable-row'})
-                    if history_item.get('type') == 'error':
-                        history_item_row['class'] = history_item_row.get('class', [])
-                        if history_item.get('isNew', False):
-                            history_item_row['class'].append('event-error-new')
-                        else:
-                            history_item_row['class'].append('event-error')
-
-                    ts_cell = soup.new_tag('td')
-                    if 'ospFile' in history_item and history_item['ospFile']:
-                        osp_path = history_item['ospFile']
-                        link_path = copy_file_to_report_dir(osp_path, logDirectory)
-                        if 'scrollIndex' in history_item:
-                            link_path += f"#line{history_item['scrollIndex']}"
-                        error_file = soup.new_tag('a', attrs={'href': link_path, 'target' : "_blank"})
-                        error_file.string = history_item['timestamp'].split('+')[0]
-                        ts_cell.append(error_file)
-                    else:
-                        ts_cell.append(history_item['timestamp'].split('+')[0])
-
-                    info_div = soup.new_tag('div', attrs={'class': 'row-info'})
-                    parameter_info = "".join(history_item['parameters'])
-                    print(history_item)
-                    info_div.string = history_item['original'] + parameter_info
-                    ts_cell.append(info_div)
-                    history_item_row.append(ts_cell)
-
-                    db_name_cell = soup.new_tag('td')
-                    db_name_cell.string = history_item['dbName']
-                    history_item_row.append(db_name_cell)
-
-                    db_id_cell = soup.new_tag('td')
-                    db_id_cell.string = str(history_item['dbId'])
-                    history_item_row.append(db_id_cell)
-
-                    event_cell = soup.new_tag('td')
-                    targetReason = "N/A"
-                    if 'reason' in history_item:
-                        targetReason = history_item['reason']
-                    if history_item['type'] == 'error':
-                        event_cell.string = "Error: ({})".format(history_item['code'])
-                    else:
-                        event_cell.string = "{} / {}".format(history_item['type'], targetReason)
-                    history_item_row.append(event_cell)
-
-                    history_table_body.append(history_item_row)
-
-                with open(os.path.join(logDirectory, history_filename), 'w', encoding='utf-8') as f:
-                    f.write(historySoup.prettify())
-
-            with open(os.path.join(logDirectory, './ShardGroupLog_{}_RUID_{}.html'.format(shardGroup, ruid)), 'w', encoding='utf-8') as fp:
-                fp.write(shardGroupSoup.prettify())
-
-        with open(os.path.join(logDirectory, './RULog{}.html'.format(ruid)), 'w', encoding='utf-8') as fp:
-            fp.write(ruidSoup.prettify())
+            shardGroupHistory = results['history'][ruid][shardGroup]
+            history_names = history_page_names(ruid, shardGroup, shardGroupHistory)
+            for logResult, history_filename in zip(shardGroupHistory, history_names):
+                written += write_page(logDirectory, history_filename, render_history_page(logResult, logDirectory), previous, manifest)
+            page = render_shard_group_page(results, ruid, shardGroup, history_names)
+            written += write_page(logDirectory, 'ShardGroupLog_{}_RUID_{}.html'.format(shardGroup, ruid), page, previous, manifest)
+
+        written += write_page(logDirectory, 'RULog{}.html'.format(ruid), render_ru_page(results, ruid), previous, manifest)
+
+    pruned = prunePages(logDirectory, previous, manifest)
+    writeJsonAtomic(os.path.join(logDirectory, RENDER_MANIFEST_FILE_NAME), manifest)
+    logger.info("Rendered %d pages into %s: %d written, %d unchanged, %d removed", len(manifest), logDirectory, written, len(manifest) - written, pruned)
@@ -1,5 +1,10 @@
 import os
 import html
+import itertools
+import logging
+import instrumentation
+
+logger = logging.getLogger(__name__)
 
 def convert_file_to_html(source_path, output_dir):
     """
@@ -12,7 +17,12 @@ def convert_file_to_html(source_path, output_dir):
     html_file_name = f"{base_name}.html"
     html_path = os.path.join(output_dir, html_file_name)
 
+    # A conversion written after the source last changed is still current.
+    if os.path.exists(html_path) and os.path.getmtime(html_path) >= os.path.getmtime(source_path):
+        return html_path
+
     try:
+        instrumentation.countFileRead(source_path)
         with open(source_path, 'r', encoding='utf-8', errors='ignore') as f_in:
             lines = f_in.readlines()
 
@@ -28,5 +38,40 @@ def convert_file_to_html(source_path, output_dir):
         
         return html_path
     except Exception as e:
-        print(f"Error converting {source_path} to HTML: {e}")
-        return None
\ No newline at end of file
+        logger.error("Error converting %s to HTML: %s", source_path, e)
+        return None
+
+def render_file_chunk(source_path, first_line, line_count, chunk_href):
+    """
+    Renders lines first_line .. first_line + line_count - 1 of a text file in the same
+    format as convert_file_to_html, with links to the previous and next chunk.
+    Only the lines up to the end of the chunk are read, so large traces stay cheap.
+
+    chunk_href(first_line) builds the link to another chunk of the same file.
+    """
+    base_name = os.path.basename(source_path)
+    first_line = max(1, first_line)
+    instrumentation.countFileRead(source_path)
+    with open(source_path, 'r', encoding='utf-8', errors='ignore') as f_in:
+        lines = list(itertools.islice(f_in, first_line - 1, first_line - 1 + line_count + 1))
+    has_next = len(lines) > line_count
+    lines = lines[:line_count]
+
+    navigation = []
+    if first_line > 1:
+        navigation.append(f'<a href="{html.escape(chunk_href(max(1, first_line - line_count)))}">previous {line_count} lines</a>')
+    if has_next:
+        navigation.append(f'<a href="{html.escape(chunk_href(first_line + line_count))}">next {line_count} lines</a>')
+    navigation_html = f'<p>{" | ".join(navigation)}</p>\n' if navigation else ''
+
+    parts = ['<!DOCTYPE html>\n<html lang="en">\n<head>\n',
+             f'<title>{html.escape(base_name)}</title>\n',
+             '<meta charset="UTF-8">\n',
+             '<style>p { margin: 0; padding: 0; }</style>\n',
+             '</head>\n<body>\n',
+             navigation_html]
+    for i, line in enumerate(lines):
+        parts.append(f'<p id="line{first_line + i}">{html.escape(line)}</p>\n')
+    parts.append(navigation_html)
+    parts.append('</body>\n</html>')
+    return "".join(parts)
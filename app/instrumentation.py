@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import threading
+import contextlib
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+STAGES = (
+    "gdsctl_parse",
+    "ruid_discovery",
+    "leadership_parse",
+    "event_parse",
+    "trace_lookup",
+    "watson",
+    "gsm",
+    "detail_rules",
+    "render",
+    "artifact_copy",
+)
+COUNTERS = ("bytes_read", "files_opened", "gzip_bytes_inflated", "bytes_spilled")
+PROFILERS = ("cprofile", "pyinstrument")
+PROFILE_ENV = "FINISHEDLOG_PROFILE"
+PROFILE_STAGES_ENV = "FINISHEDLOG_PROFILE_STAGES"
+TIMINGS_FILE_NAME = "timings.json"
+
+profile_settings = {
+    'profiler': os.environ.get(PROFILE_ENV) or None,
+    'stages': set(filter(None, os.environ.get(PROFILE_STAGES_ENV, "").split(","))) or None,
+}
+
+current_run = {}
+# Guards current_run, which stages running on several threads (e.g. the watson.dif
+# resolution) update at once.
+run_lock = threading.RLock()
+
+def newRun(label, output_dir):
+    return {
+        'label': label,
+        'output_dir': output_dir,
+        'started': time.time(),
+        'stages': {name: {'seconds': 0.0, 'calls': 0} for name in STAGES},
+        'counters': {name: 0 for name in COUNTERS},
+        # The stages running on each thread, so a stage nested in itself is counted once per
+        # thread. Stages running on several threads at once each add their own time.
+        'active': threading.local(),
+        'profiling': False,
+    }
+
+# Starts collecting stats for a new LRG, discarding whatever was collected before.
+# Args:
+#     label (str): Name of the run, usually the LRG directory name.
+#     output_dir (str): Where per-stage profiles are written when profiling is enabled.
+def reset(label, output_dir=None):
+    with run_lock:
+        current_run.clear()
+        current_run.update(newRun(label, output_dir))
+
+def ensureRun():
+    with run_lock:
+        if not current_run:
+            reset(None)
+
+# Turns on a profiler around the given stages (all stages when None).
+# Args:
+#     profiler (str): 'cprofile' or 'pyinstrument', or None to disable profiling.
+#     stages (iterable): Stage names to profile.
+def enableProfiling(profiler, stages=None):
+    if profiler is not None and profiler not in PROFILERS:
+        raise ValueError("Unknown profiler '{}', expected one of {}".format(profiler, ", ".join(PROFILERS)))
+    profile_settings['profiler'] = profiler
+    profile_settings['stages'] = set(stages) if stages else None
+
+def shouldProfile(name):
+    if not profile_settings['profiler'] or current_run.get('profiling'):
+        return False
+    if not current_run.get('output_dir'):
+        return False
+    return profile_settings['stages'] is None or name in profile_settings['stages']
+
+@contextlib.contextmanager
+def profileStage(name):
+    profile_dir = os.path.join(current_run['output_dir'], 'profiles')
+    os.makedirs(profile_dir, exist_ok=True)
+    calls = current_run['stages'][name]['calls']
+    base_path = os.path.join(profile_dir, "{}_{}".format(name, calls))
+    current_run['profiling'] = True
+    try:
+        if profile_settings['profiler'] == "pyinstrument":
+            import pyinstrument
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(base_path + ".html", 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_html())
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(base_path + ".prof")
+    finally:
+        current_run['profiling'] = False
+
+# Times a pipeline stage. Re-entering a stage that is already running
+# (e.g. a copy nested in another copy) is only counted once.
+# Args:
+#     name (str): One of STAGES.
+@contextlib.contextmanager
+def stage(name):
+    ensureRun()
+    active = current_run['active']
+    if getattr(active, name, False):
+        yield
+        return
+
+    setattr(active, name, True)
+    start = time.perf_counter()
+    try:
+        if shouldProfile(name):
+            with profileStage(name):
+                yield
+        else:
+            yield
+    finally:
+        setattr(active, name, False)
+        with run_lock:
+            stats = current_run['stages'][name]
+            stats['seconds'] += time.perf_counter() - start
+            stats['calls'] += 1
+
+def count(counter, amount=1):
+    ensureRun()
+    with run_lock:
+        current_run['counters'][counter] += amount
+
+# Records that a file is about to be read in full.
+# Args:
+#     path (str): The file being opened.
+def countFileRead(path):
+    count('files_opened')
+    try:
+        count('bytes_read', os.path.getsize(path))
+    except OSError:
+        pass
+
+def countInflated(nbytes):
+    count('gzip_bytes_inflated', nbytes)
+
+def peakRssBytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+# Returns the stats collected since the last reset as a JSON-serializable dict.
+def snapshot():
+    ensureRun()
+    with run_lock:
+        return {
+            'label': current_run['label'],
+            'started': current_run['started'],
+            'wall_seconds': time.time() - current_run['started'],
+            'stages': {name: dict(stats) for name, stats in current_run['stages'].items()},
+            'counters': dict(current_run['counters']),
+            'peak_rss_bytes': peakRssBytes(),
+        }
+
+def writeStats(path, stats=None):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(stats if stats is not None else snapshot(), f, indent=4)
+
+# Sums a list of per-LRG snapshots into one batch-wide summary.
+# Args:
+#     stats_list (list): Snapshots as returned by snapshot().
+# Returns:
+#     dict: Totals per stage and counter, plus the highest peak RSS seen.
+def mergeStats(stats_list):
+    total = {
+        'lrg_count': 0,
+        'wall_seconds': 0.0,
+        'stages': {name: {'seconds': 0.0, 'calls': 0} for name in STAGES},
+        'counters': {name: 0 for name in COUNTERS},
+        'peak_rss_bytes': None,
+    }
+    for stats in stats_list:
+        if not stats:
+            continue
+        total['lrg_count'] += 1
+        total['wall_seconds'] += stats.get('wall_seconds', 0.0)
+        for name, stage_stats in stats.get('stages', {}).items():
+            merged = total['stages'].setdefault(name, {'seconds': 0.0, 'calls': 0})
+            merged['seconds'] += stage_stats['seconds']
+            merged['calls'] += stage_stats['calls']
+        for name, value in stats.get('counters', {}).items():
+            total['counters'][name] = total['counters'].get(name, 0) + value
+        peak = stats.get('peak_rss_bytes')
+        if peak is not None and (total['peak_rss_bytes'] is None or peak > total['peak_rss_bytes']):
+            total['peak_rss_bytes'] = peak
+    return total
@@ -0,0 +1,48 @@
+import sys
+import types
+import importlib
+
+# A package whose submodules are exported lazily, see lazyExports.
+class LazyPackage(types.ModuleType):
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(f"module '{self.__name__}' has no attribute '{name}'")
+        if name in self._lazySubmodules:
+            module = importlib.import_module(f"{self.__name__}.{name}")
+            return vars(self).get(name, vars(module).get(name, module))
+        submodule = self._lazyNames.get(name)
+        if submodule is None:
+            raise AttributeError(f"module '{self.__name__}' has no attribute '{name}'")
+        value = getattr(importlib.import_module(f"{self.__name__}.{submodule}"), name)
+        setattr(self, name, value)
+        return value
+
+    # The import system binds every submodule it imports on the package under its own name.
+    # A submodule that exports an attribute of that name, e.g. parseHistory.parseHistory, is
+    # replaced by the attribute, as `from .parseHistory import *` did.
+    def __setattr__(self, name, value):
+        if name in vars(self).get('_lazySubmodules', ()) and isinstance(value, types.ModuleType):
+            value = vars(value).get(name, value)
+        super().__setattr__(name, value)
+
+    def __dir__(self):
+        return sorted(set(vars(self)) | set(self._lazySubmodules) | set(self._lazyNames))
+
+# Exports the names of a package's submodules lazily, so importing the package is cheap and a
+# submodule, with the dependencies it pulls in, is only imported the first time one of its
+# names is looked up on the package. Only the submodule a name is mapped to is imported; a
+# name that is not mapped raises AttributeError without importing anything.
+# Args:
+#     packageName (str): The package's __name__, from its __init__.
+#     exports (dict): Maps each submodule to the tuple of names it exports on the package.
+def lazyExports(packageName, exports):
+    package = sys.modules[packageName]
+    names = {}
+    for submodule, submoduleNames in exports.items():
+        for name in submoduleNames:
+            if name in names:
+                raise ValueError(f"{packageName}: '{name}' is exported by both {names[name]} and {submodule}")
+            names[name] = submodule
+    package._lazySubmodules = tuple(exports)
+    package._lazyNames = names
+    package.__class__ = LazyPackage
@@ -0,0 +1,25 @@
+import os
+import sys
+import logging
+
+DEBUG_FLAG = "--debug"
+DEBUG_ENV = "FINISHEDLOG_DEBUG"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Removes the --debug flag from a list of command line arguments.
+# Args:
+#     argv (list): The arguments, usually sys.argv.
+# Returns:
+#     tuple: The arguments without the flag, and whether the flag was present.
+def popDebugFlag(argv):
+    remaining = [arg for arg in argv if arg != DEBUG_FLAG]
+    return remaining, len(remaining) != len(argv)
+
+# Sets up the root logger. Debug output is off unless requested through
+# the --debug flag or the FINISHEDLOG_DEBUG environment variable.
+# Args:
+#     debug (bool): Whether to emit debug messages.
+def configureLogging(debug=False):
+    if not debug:
+        debug = os.environ.get(DEBUG_ENV, "").lower() in ("1", "true", "yes")
+    logging.basicConfig(level=logging.DEBUG if debug else logging.INFO, format=LOG_FORMAT, stream=sys.stdout, force=True)
@@ -1,4 +1,56 @@
-from .parseAddShard import *
-from .parseHistory import *
-from .parseRUID import *
-from .parseGsm import *
\ No newline at end of file
+from lazy_package import lazyExports
+
+# Parsers are imported on first use, see lazy_package.lazyExports.
+lazyExports(__name__, {
+    "parseAddShard": (
+        "fetchAddShardInfo",
+        "parseAddShard",
+    ),
+    "parseGdsctl": (
+        "gdsctlFingerprint",
+        "parseGdsctlTopology",
+        "findGdsctlLogs",
+        "mergeGdsctlTopologies",
+    ),
+    "parseHistory": (
+        "spillHistory",
+        "scanBounds",
+        "parseHistory",
+        "parseWatsonLog",
+    ),
+    "parseRUID": (
+        "parseRUIDFile",
+    ),
+    "parseGsm": (
+        "parse_gsm_logs",
+    ),
+    "scanLog": (
+        "mapLogFile",
+        "iterMatchingLines",
+    ),
+    "parseState": (
+        "PARSE_RESULT_FILE_NAME",
+        "loadParseState",
+        "saveParseState",
+        "saveParseResult",
+        "loadParseResult",
+        "findRotatedLogs",
+        "planLogScan",
+    ),
+    "detailRules": (
+        "loadDetailRules",
+        "matchDetailRules",
+    ),
+    "errorRollups": (
+        "buildErrorRollups",
+        "errorRollups",
+    ),
+    "leadershipStats": (
+        "buildLeadershipStats",
+        "leadershipStats",
+    ),
+    "traceMarkers": (
+        "setMarkerWindows",
+        "probeMarker",
+    ),
+})
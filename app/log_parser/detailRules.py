@@ -0,0 +1,91 @@
+import re
+import json
+import itertools
+import memory_budget
+
+# The flags batch_report adds to an LRG's details. A rule matches when its pattern occurs
+# anywhere in the parse result: the LRG's path, its file names or the text of its errors.
+# 'pattern' is a literal keyword, unless 'regex' is set.
+DEFAULT_DETAIL_RULES = [
+    {'name': 'blowout', 'pattern': 'blowout', 'message': "Found 'blowout' in logs."},
+    {'name': 'sdbcr', 'pattern': 'sdbcr', 'message': "Found 'sdbcr' in logs."},
+]
+
+# Combined patterns by the rules they were compiled from, so every LRG of a batch reuses them.
+compiledRules = {}
+
+# Loads detail rules from a JSON file holding a list in the form of DEFAULT_DETAIL_RULES.
+# Returns:
+#     list: The rules, or DEFAULT_DETAIL_RULES when no path is given.
+def loadDetailRules(path=None):
+    if not path:
+        return DEFAULT_DETAIL_RULES
+    with open(path, 'r') as f:
+        rules = json.load(f)
+    for rule in rules:
+        if 'name' not in rule or 'pattern' not in rule:
+            raise ValueError(f"Detail rule {rule} needs a 'name' and a 'pattern'")
+        rule.setdefault('message', f"Found '{rule['name']}' in logs.")
+        re.compile(rule['pattern'] if rule.get('regex') else re.escape(rule['pattern']))
+    return rules
+
+# Compiles the rules that have not matched yet into one alternation, a named group per rule.
+# rulesKey identifies the rules, see matchDetailRules.
+def compileRules(rules, rulesKey, pending):
+    key = (rulesKey, tuple(pending))
+    if key not in compiledRules:
+        alternatives = []
+        for index in pending:
+            rule = rules[index]
+            pattern = rule['pattern'] if rule.get('regex') else re.escape(rule['pattern'])
+            alternatives.append(f"(?P<r{index}>{pattern})")
+        compiledRules[key] = re.compile("|".join(alternatives))
+    return compiledRules[key]
+
+# Yields every string in a parse result, dict keys included, with where it is.
+def iterStrings(value, where=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            path = f"{where}/{key}" if where else str(key)
+            yield path, str(key)
+            yield from iterStrings(item, path)
+    elif isinstance(value, (list, tuple, set, memory_budget.SpilledList)):
+        for index, item in enumerate(value):
+            yield from iterStrings(item, f"{where}/{index}")
+    elif value is not None:
+        yield where, value if isinstance(value, str) else str(value)
+
+# Runs the detail rules over a parse result in a single pass, instead of searching the repr
+# of the whole result once per rule. Each string is searched with one combined pattern; once
+# a rule matched it is dropped from the pattern, and the search resumes where the match
+# started, so rules whose matches overlap are still found.
+# Args:
+#     logContents (dict): The parse result, as parseLog builds it.
+#     rules (list): Rules in the form of DEFAULT_DETAIL_RULES.
+# Returns:
+#     list: {'rule', 'message', 'where', 'offset'} of the first match of each rule that
+#           matched, in the order of the rules.
+def matchDetailRules(logContents, rules=None):
+    rules = DEFAULT_DETAIL_RULES if rules is None else rules
+    rulesKey = json.dumps(rules, sort_keys=True)
+    pending = list(range(len(rules)))
+    if not pending:
+        return []
+    matches = {}
+    pattern = compileRules(rules, rulesKey, pending)
+    strings = itertools.chain.from_iterable(iterStrings(value, str(key)) for key, value in logContents.items())
+    for where, text in strings:
+        position = 0
+        while pending:
+            match = pattern.search(text, position)
+            if match is None:
+                break
+            index = int(match.lastgroup[1:])
+            matches[index] = {'rule': rules[index]['name'], 'message': rules[index]['message'], 'where': where, 'offset': match.start()}
+            pending.remove(index)
+            if pending:
+                pattern = compileRules(rules, rulesKey, pending)
+            position = match.start()
+        if not pending:
+            break
+    return [matches[index] for index in sorted(matches)]
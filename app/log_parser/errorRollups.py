@@ -0,0 +1,76 @@
+from datetime import datetime
+
+def newRollup():
+    return {'errors': 0, 'new_errors': 0, 'codes': [], 'first_error': None, 'last_error': None}
+
+# Adds a rollup into the one of the level above it. seenCodes holds the codes of total, so
+# the distinct codes are kept as a list in the order they first occur, deduplicated by a set.
+def addRollup(total, seenCodes, rollup):
+    total['errors'] += rollup['errors']
+    total['new_errors'] += rollup['new_errors']
+    for code in rollup['codes']:
+        if code not in seenCodes:
+            seenCodes.add(code)
+            total['codes'].append(code)
+    if rollup['first_error'] is not None:
+        if total['first_error'] is None or datetime.fromisoformat(rollup['first_error']) < datetime.fromisoformat(total['first_error']):
+            total['first_error'] = rollup['first_error']
+    if rollup['last_error'] is not None:
+        if total['last_error'] is None or datetime.fromisoformat(rollup['last_error']) > datetime.fromisoformat(total['last_error']):
+            total['last_error'] = rollup['last_error']
+
+def termRollup(term):
+    rollup = newRollup()
+    seenCodes = set()
+    first = last = None
+    for error in term.get('errors') or []:
+        rollup['errors'] += 1
+        if error.get('isNew'):
+            rollup['new_errors'] += 1
+        code = error.get('code')
+        if code not in seenCodes:
+            seenCodes.add(code)
+            rollup['codes'].append(code)
+        if error.get('timestamp'):
+            when = datetime.fromisoformat(error['timestamp'])
+            if first is None or when < first:
+                first, rollup['first_error'] = when, error['timestamp']
+            if last is None or when > last:
+                last, rollup['last_error'] = when, error['timestamp']
+    return rollup
+
+# Rolls the errors of the leadership history up per term, shard group and RUID in a single
+# walk, so pages and the batch report look their error counts and codes up instead of
+# walking the history again. Built once the clean run diff has marked the new errors.
+# Args:
+#     history (dict): RUID -> shard group -> list of terms, as parseHistory returns it.
+# Returns:
+#     dict: 'ruids' maps each RUID to its rollup, which has a rollup per shard group under
+#           'shard_groups', each of which has a rollup per term, in history order, under
+#           'terms'. The totals of the LRG are under 'lrg'. A rollup has the 'errors' and
+#           'new_errors' counts, the distinct 'codes' in the order they first occur, and
+#           the 'first_error' and 'last_error' timestamps.
+def buildErrorRollups(history):
+    rollups = {'lrg': newRollup(), 'ruids': {}}
+    lrgCodes = set()
+    for ruid, shardGroups in history.items():
+        ruidRollup = dict(newRollup(), shard_groups={})
+        ruidCodes = set()
+        for shardGroup, terms in shardGroups.items():
+            shardGroupRollup = dict(newRollup(), terms=[])
+            shardGroupCodes = set()
+            for term in terms:
+                rollup = termRollup(term)
+                shardGroupRollup['terms'].append(rollup)
+                addRollup(shardGroupRollup, shardGroupCodes, rollup)
+            ruidRollup['shard_groups'][shardGroup] = shardGroupRollup
+            addRollup(ruidRollup, ruidCodes, shardGroupRollup)
+        rollups['ruids'][ruid] = ruidRollup
+        addRollup(rollups['lrg'], lrgCodes, ruidRollup)
+    return rollups
+
+# The error rollups of a parse result, built from its history if it was saved without them.
+def errorRollups(logContents):
+    if 'error_rollups' not in logContents:
+        logContents['error_rollups'] = buildErrorRollups(logContents['history'])
+    return logContents['error_rollups']
@@ -0,0 +1,113 @@
+import bisect
+import itertools
+import statistics
+from array import array
+from datetime import datetime
+
+# Terms per hour are computed over at least this span, so a few terms in a minute do not
+# look like hundreds an hour.
+MIN_RATE_SPAN_SECONDS = 600
+RECOVERY_PERCENTILE = 95
+# A shard group flaps when its leader changes FLAP_TERMS times within FLAP_WINDOW_SECONDS.
+FLAP_WINDOW_SECONDS = 600
+FLAP_TERMS = 3
+
+# Nearest-rank percentile of sorted values.
+def percentile(values, percent):
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+def epoch(timestamp):
+    return datetime.fromisoformat(timestamp.strip()).timestamp()
+
+# Packs the terms of one RUID in one shard group into arrays, parsing each term's timestamp once.
+# Returns:
+#     tuple: The start of each term in seconds and its timestamp, both sorted by start, and
+#            the recovery times of the terms that have one.
+def termArrays(terms):
+    timed = sorted((epoch(term['timestamp']), term['timestamp']) for term in terms)
+    starts = array('d', (start for start, _ in timed))
+    recoveries = array('d', (term['recoveryTime'] for term in terms if 'recoveryTime' in term))
+    return starts, [timestamp for _, timestamp in timed], recoveries
+
+# Seconds from the first event of a shard group to its first leader. Events logged before
+# the first term are filed under it, see slotEvents.
+def firstLeaderSeconds(terms, starts):
+    if not starts:
+        return None
+    events = itertools.chain(terms[0].get('history', []), terms[0].get('errors') or [])
+    earliest = min((epoch(event['timestamp']) for event in events), default=starts[0])
+    return max(0.0, starts[0] - earliest)
+
+# The number of terms starting within FLAP_WINDOW_SECONDS of each term, found by bisecting
+# the sorted starts rather than walking every window.
+def windowCounts(starts, window=FLAP_WINDOW_SECONDS):
+    return [bisect.bisect_right(starts, start + window, index) - index for index, start in enumerate(starts)]
+
+def summarizeTerms(starts, recoveries):
+    span = starts[-1] - starts[0] if starts else 0.0
+    ordered = sorted(recoveries)
+    return {
+        'terms': len(starts),
+        'span_seconds': span,
+        'terms_per_hour': len(starts) / (max(span, MIN_RATE_SPAN_SECONDS) / 3600),
+        'recoveries': len(ordered),
+        'recovery_mean': statistics.fmean(ordered) if ordered else None,
+        'recovery_p95': percentile(ordered, RECOVERY_PERCENTILE) if ordered else None,
+        'recovery_max': ordered[-1] if ordered else None,
+    }
+
+# Computes the leadership statistics of one RUID in one shard group.
+def shardGroupStats(terms):
+    starts, timestamps, recoveries = termArrays(terms)
+    stats = summarizeTerms(starts, recoveries)
+    counts = windowCounts(starts)
+    flapIndex = next((index for index, count in enumerate(counts) if count >= FLAP_TERMS), None)
+    stats['first_leader_seconds'] = firstLeaderSeconds(terms, starts)
+    stats['max_window_terms'] = max(counts, default=0)
+    stats['flapping'] = flapIndex is not None
+    stats['flap_start'] = timestamps[flapIndex] if flapIndex is not None else None
+    return stats, starts, recoveries
+
+# Computes the leadership statistics of an LRG from its term timestamps and recovery times,
+# held in arrays per RUID and shard group. These are stdlib arrays walked term by term, not
+# pyarrow vectors: importing pyarrow would add some 45MB to every parse process, for a
+# step the leadership_stats benchmark shows to be a small part of a parse.
+# Args:
+#     history (dict): RUID -> shard group -> list of terms, as parseHistory returns it.
+# Returns:
+#     dict: 'ruids' maps each RUID to a shard group -> statistics dict, and 'lrg' has the
+#           statistics of all terms together. The statistics are the 'terms' count, their
+#           'span_seconds' and 'terms_per_hour', the 'recovery_mean', 'recovery_p95' and
+#           'recovery_max' seconds, the 'first_leader_seconds' and the 'max_window_terms'
+#           within FLAP_WINDOW_SECONDS. Shard groups also have 'flapping' and 'flap_start',
+#           the LRG the number of 'flapping_shard_groups'.
+def buildLeadershipStats(history):
+    stats = {'lrg': None, 'ruids': {}}
+    allStarts = array('d')
+    allRecoveries = array('d')
+    firstLeaders = []
+    maxWindowTerms = 0
+    flapping = 0
+    for ruid, shardGroups in history.items():
+        stats['ruids'][ruid] = {}
+        for shardGroup, terms in shardGroups.items():
+            shardGroupStatistics, starts, recoveries = shardGroupStats(terms)
+            stats['ruids'][ruid][shardGroup] = shardGroupStatistics
+            allStarts.extend(starts)
+            allRecoveries.extend(recoveries)
+            if shardGroupStatistics['first_leader_seconds'] is not None:
+                firstLeaders.append(shardGroupStatistics['first_leader_seconds'])
+            maxWindowTerms = max(maxWindowTerms, shardGroupStatistics['max_window_terms'])
+            flapping += shardGroupStatistics['flapping']
+    stats['lrg'] = summarizeTerms(sorted(allStarts), allRecoveries)
+    stats['lrg']['first_leader_seconds'] = max(firstLeaders, default=None)
+    stats['lrg']['max_window_terms'] = maxWindowTerms
+    stats['lrg']['flapping_shard_groups'] = flapping
+    return stats
+
+# The leadership statistics of a parse result, built from its history if it was saved without them.
+def leadershipStats(logContents):
+    if 'leadership_stats' not in logContents:
+        logContents['leadership_stats'] = buildLeadershipStats(logContents['history'])
+    return logContents['leadership_stats']
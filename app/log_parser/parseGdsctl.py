@@ -0,0 +1,138 @@
+import os
+import gzip
+import itertools
+import hashlib
+import instrumentation
+from .parseAddShard import ADDSHARD_PREFIX, SHARDGROUP_PREFIX, SHARDSPACE_PREFIX, DBNAME_PREFIX, parseAddShard
+
+GDSCTL_FILE_NAME = "sdbdeploy_gdsctl.lst"
+# Every file whose name contains this is a gdsctl log of the LRG.
+GDSCTL_NAME_STRING = "gdsctl.lst"
+COMMAND_PREFIX = "Command name: "
+# Argument lines of an add shard command its shard group and database are looked for in.
+ADDSHARD_ARGUMENT_LINES = 10
+# Commands besides add shard that describe the topology, recorded with their arguments.
+TOPOLOGY_COMMANDS = ("add shardgroup", "add shardspace", "add cdb", "add region", "config shard", "remove shard", "deploy")
+# Changes whenever the records parseGdsctlTopology returns change, so cached topologies are not reused.
+GDSCTL_TOPOLOGY_VERSION = 1
+FINGERPRINT_CHUNK_BYTES = 1 << 20
+
+# Opens a gdsctl log for reading text, decompressing it on the fly if it is gzipped.
+def openGdsctlLog(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='ignore')
+    return open(path, 'r', encoding='utf-8', errors='ignore')
+
+# Identifies a gdsctl log by its contents, so LRGs deployed the same way share a parsed
+# topology. Gzipped logs are hashed as they are, without decompressing them.
+# Returns:
+#     str: The fingerprint.
+def gdsctlFingerprint(path):
+    digest = hashlib.sha1(f"{GDSCTL_TOPOLOGY_VERSION}:{path.endswith('.gz')}:".encode())
+    instrumentation.countFileRead(path)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(FINGERPRINT_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Splits the lines of a gdsctl log into command blocks, keeping one block in memory at a time.
+# Args:
+#     lines (iterable): The lines of the log, e.g. the open file.
+# Yields:
+#     dict: 'command' (its name), 'header' (the command line), 'line' (its line number)
+#           and 'lines' (the argument lines up to the next command).
+def iterGdsctlCommands(lines):
+    block = None
+    for lineNumber, line in enumerate(lines, 1):
+        if COMMAND_PREFIX in line:
+            if block is not None:
+                yield block
+            block = {'command': line.split(COMMAND_PREFIX, 1)[1].strip(), 'header': line, 'line': lineNumber, 'lines': []}
+        elif block is not None:
+            block['lines'].append(line)
+    if block is not None:
+        yield block
+
+# Parses the "name : value" argument lines of a command.
+def parseCommandArguments(lines):
+    arguments = {}
+    for line in lines:
+        if " : " in line:
+            name, value = line.split(" : ", 1)
+            arguments[name.strip()] = value.strip()
+    return arguments
+
+# Reads the shard group and database of an add shard command.
+# Returns:
+#     tuple: The shard group and database name.
+def parseAddShardCommand(block):
+    targetLines = ["NULL", "NULL"]
+    for line in block['lines'][:ADDSHARD_ARGUMENT_LINES]:
+        if SHARDGROUP_PREFIX in line or SHARDSPACE_PREFIX in line:
+            targetLines[0] = line
+        if DBNAME_PREFIX in line:
+            targetLines[1] = line
+        if "NULL" not in targetLines:
+            break
+    if "NULL" in targetLines:
+        raise ValueError("Error from add shard command on line {}, failed to fetch db + shardgroup info lines!".format(block['line']))
+    shardGroup, dbName = parseAddShard(targetLines)
+    if shardGroup == "NULL":
+        raise ValueError("Error from add shard command on line {}, failed to parse db + shardgroup info lines!".format(block['line']))
+    return shardGroup, dbName
+
+# Parses the topology commands of a gdsctl log in a single streamed pass.
+# Args:
+#     path (str): The gdsctl log, plain or gzipped.
+# Returns:
+#     list: A record per topology command in file order, with its 'command' and 'line';
+#           add shard records also have 'shardGroup' and 'dbName', the others 'arguments'.
+def parseGdsctlTopology(path):
+    records = []
+    instrumentation.count('files_opened')
+    with openGdsctlLog(path) as f:
+        firstLine = f.readline()
+        if not firstLine:
+            raise ValueError("Error: No lines in the log file  file '{}'!".format(os.path.basename(path)))
+        for block in iterGdsctlCommands(itertools.chain([firstLine], f)):
+            if ADDSHARD_PREFIX in block['header']:
+                shardGroup, dbName = parseAddShardCommand(block)
+                records.append({'command': "add shard", 'line': block['line'], 'shardGroup': shardGroup, 'dbName': dbName})
+            elif block['command'] in TOPOLOGY_COMMANDS:
+                records.append({'command': block['command'], 'line': block['line'], 'arguments': parseCommandArguments(block['lines'])})
+        if path.endswith('.gz'):
+            instrumentation.countInflated(f.buffer.tell())
+    return records
+
+# Lists the gdsctl logs of an LRG. Some LRGs split their topology across several logs.
+# sdbdeploy_gdsctl.lst comes first and the others follow by name, so the order, and with it
+# the IDs given to the databases, is the same on every run. A gzipped log is skipped when
+# it was unzipped next to itself.
+# Args:
+#     directory (str): The LRG directory.
+# Returns:
+#     list: The file names.
+def findGdsctlLogs(directory):
+    with os.scandir(directory) as it:
+        names = {entry.name for entry in it if GDSCTL_NAME_STRING in entry.name and entry.is_file()}
+    names = [name for name in names if not (name.endswith('.gz') and name[:-3] in names)]
+    return sorted(names, key=lambda name: (not name.startswith(GDSCTL_FILE_NAME), name))
+
+# Merges the add shard commands of several gdsctl logs, in a single pass over them.
+# A database added to the same shard group by more than one command is only kept once.
+# Args:
+#     topologies (list): Topologies from parseGdsctlTopology, in the order of findGdsctlLogs.
+# Returns:
+#     list: The add shard records, in the order the databases were first added.
+def mergeGdsctlTopologies(topologies):
+    merged = []
+    seen = set()
+    for topology in topologies:
+        for record in topology:
+            if record['command'] != "add shard":
+                continue
+            key = (record['shardGroup'], record['dbName'])
+            if key not in seen:
+                seen.add(key)
+                merged.append(record)
+    return merged
@@ -1,7 +1,18 @@
 import os
-import gzip
-import shutil
 import re
+import logging
+import instrumentation
+from file_parser.placeArtifact import placeGzipFile, refreshFile
+from . import scanLog
+from .parseState import fileFingerprint, isAppendOf
+
+CATALOG_REQUEST_STRING = b"Catalog request"
+REQUEST_DONE_STRING = b"Request Done"
+GSM_REQUEST_PATTERN = scanLog.compileNeedles([CATALOG_REQUEST_STRING, REQUEST_DONE_STRING])
+CATALOG_ID_PATTERN = re.compile(rb'Id="(\d+)"')
+DONE_ID_PATTERN = re.compile(rb'Id="?(\d+)')
+
+logger = logging.getLogger(__name__)
 
 def find_gsm_log_dir(diag_path):
     """Finds the first non-empty subdirectory in the gsm log directory."""
@@ -15,79 +26,104 @@ def find_gsm_log_dir(diag_path):
             return dir_path
     return None
 
-def extract_log_file(gsm_sub_dir, report_dir):
-    """Extracts the first log file from a gsm subdirectory."""
+def find_log_file(gsm_sub_dir, report_dir):
+    """Returns the first log file of a gsm subdirectory and where it goes in the report."""
     log_path = os.path.join(gsm_sub_dir, 'log')
     if not os.path.exists(log_path):
-        return None
+        return None, None
 
     for file_name in sorted(os.listdir(log_path)):
         if file_name.endswith('.log') or file_name.endswith('.log.gz'):
             log_file_path = os.path.join(log_path, file_name)
             dest_path = os.path.join(report_dir, os.path.basename(log_file_path))
-
             if file_name.endswith('.gz'):
                 dest_path = dest_path[:-3] # Remove .gz
-                if not os.path.exists(dest_path):
-                    with gzip.open(log_file_path, 'rb') as f_in:
-                        with open(dest_path, 'wb') as f_out:
-                            shutil.copyfileobj(f_in, f_out)
-                return dest_path
-            else:
-                if not os.path.exists(dest_path):
-                    shutil.copy(log_file_path, dest_path)
-                return dest_path
-    return None
+            return log_file_path, dest_path
+    return None, None
 
-def parse_gsm_log(log_file_path):
-    """Parses a GSM log file for errors."""
-    errors = []
-    with open(log_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        lines = f.readlines()
+def place_log_file(log_file_path, dest_path):
+    """Places a gsm log in the report, refreshing a copy of a log that is still being written."""
+    if log_file_path.endswith('.gz'):
+        return placeGzipFile(log_file_path, dest_path)
+    return refreshFile(log_file_path, dest_path)
 
-    for i, line in enumerate(lines):
-        if "Request Done" in line and "Error" in line:
-            id_match = re.search(r'Id=(\d+)', line)
-            if not id_match:
-                id_match = re.search(r'Id="(\d+)"', line)
+def extract_log_file(gsm_sub_dir, report_dir):
+    """Extracts the first log file from a gsm subdirectory."""
+    log_file_path, dest_path = find_log_file(gsm_sub_dir, report_dir)
+    if not log_file_path:
+        return None
+    return place_log_file(log_file_path, dest_path)
+
+def parse_error_block(error_block_text):
+    timestamp_match = re.search(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+Z?)', error_block_text)
+    timestamp = timestamp_match.group(1) if timestamp_match else ''
+
+    request_type_match = re.search(r'Catalog request:"([^"]+)"', error_block_text)
+    request_type = request_type_match.group(1) if request_type_match else ''
+
+    payload_match = re.search(r'Payload:"([^"]+)"', error_block_text)
+    payload = payload_match.group(1) if payload_match else ''
+
+    target_match = re.search(r'Target:"([^"]+)"', error_block_text)
+    target = target_match.group(1) if target_match else ''
+
+    message_match = re.search(r'message:"([^"]+)"', error_block_text, re.DOTALL)
+    message = message_match.group(1).replace('\n', ' ') if message_match else ''
+
+    return {
+        'timestamp': timestamp,
+        'request_type': request_type,
+        'payload': payload,
+        'target': target,
+        'message': message,
+        'full_text': error_block_text
+    }
+
+def parse_gsm_log(log_file_path, resume=None):
+    """
+    Parses a GSM log file for errors, decoding only the failed request blocks.
+
+    Requests are tracked forwards from their 'Catalog request' line to their
+    'Request Done' line. When resume is given, scanning starts at resume['offset']
+    with the requests still open in resume['open_requests'], stops at the last
+    complete line, and both are updated for the next call.
+    """
+    errors = []
+    start = resume.get('offset', 0) if resume is not None else 0
+    open_requests = dict(resume.get('open_requests', {})) if resume is not None else {}
+    instrumentation.countFileRead(log_file_path)
+    with scanLog.mapLogFile(log_file_path) as data:
+        end = scanLog.completeLinesEnd(data) if resume is not None else len(data)
+        for line_start, line_end in scanLog.iterMatchingLines(data, GSM_REQUEST_PATTERN, start, end):
+            line_bytes = data[line_start:line_end]
+            if CATALOG_REQUEST_STRING in line_bytes:
+                catalog_match = CATALOG_ID_PATTERN.search(line_bytes)
+                if catalog_match:
+                    open_requests[catalog_match.group(1).decode()] = line_start
+            if REQUEST_DONE_STRING not in line_bytes:
+                continue
+            id_match = DONE_ID_PATTERN.search(line_bytes)
             if not id_match:
                 continue
-            
-            request_id = id_match.group(1)
-            
-            for j in range(i, -1, -1):
-                if f'Id="{request_id}"' in lines[j] and "Catalog request" in lines[j]:
-                    error_block_lines = lines[j:i+1]
-                    error_block_text = "".join(error_block_lines)
-                    
-                    timestamp_match = re.search(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+Z?)', error_block_text)
-                    timestamp = timestamp_match.group(1) if timestamp_match else ''
-
-                    request_type_match = re.search(r'Catalog request:"([^"]+)"', error_block_text)
-                    request_type = request_type_match.group(1) if request_type_match else ''
-
-                    payload_match = re.search(r'Payload:"([^"]+)"', error_block_text)
-                    payload = payload_match.group(1) if payload_match else ''
-                    
-                    target_match = re.search(r'Target:"([^"]+)"', error_block_text)
-                    target = target_match.group(1) if target_match else ''
-
-                    message_match = re.search(r'message:"([^"]+)"', error_block_text, re.DOTALL)
-                    message = message_match.group(1).replace('\n', ' ') if message_match else ''
-
-                    errors.append({
-                        'timestamp': timestamp,
-                        'request_type': request_type,
-                        'payload': payload,
-                        'target': target,
-                        'message': message,
-                        'full_text': error_block_text
-                    })
-                    break
+
+            block_start = open_requests.pop(id_match.group(1).decode(), None)
+            if b"Error" not in line_bytes or block_start is None:
+                continue
+            errors.append(parse_error_block(scanLog.decodeLine(data, block_start, line_end)))
+    if resume is not None:
+        resume['offset'] = end
+        resume['open_requests'] = open_requests
     return errors
 
-def parse_gsm_logs(report_dir, full_path):
-    """Main function to parse all GSM logs."""
+def parse_gsm_logs(report_dir, full_path, resume=None):
+    """
+    Main function to parse all GSM logs.
+
+    When resume is given (a dict, empty on the first run) it keeps, per log, the
+    source fingerprint, scan offset, open requests and errors found so far, so a
+    later call only parses what was appended. Logs that were rotated or truncated
+    are parsed again from the start.
+    """
     diag_path = os.path.join(full_path, 'diag')
     gsm_log_dir = find_gsm_log_dir(diag_path)
     if not gsm_log_dir:
@@ -97,8 +133,25 @@ def parse_gsm_logs(report_dir, full_path):
     for gsm_dir_name in sorted(os.listdir(gsm_log_dir)):
         if gsm_dir_name.startswith('gsm'):
             gsm_sub_dir = os.path.join(gsm_log_dir, gsm_dir_name)
-            log_file = extract_log_file(gsm_sub_dir, report_dir)
-            if log_file:
-                all_errors.extend(parse_gsm_log(log_file))
+            log_file_path, dest_path = find_log_file(gsm_sub_dir, report_dir)
+            if not log_file_path:
+                continue
+            if resume is None:
+                all_errors.extend(parse_gsm_log(place_log_file(log_file_path, dest_path)))
+                continue
+
+            source = fileFingerprint(log_file_path)
+            file_state = resume.get(dest_path)
+            if file_state and not isAppendOf(file_state['source'], source):
+                logger.info("%s was rotated or truncated, parsing it again", log_file_path)
+                if os.path.lexists(dest_path):
+                    os.remove(dest_path)
+                file_state = None
+            if not file_state:
+                file_state = {'offset': 0, 'open_requests': {}, 'errors': []}
+            file_state['source'] = source
+            file_state['errors'].extend(parse_gsm_log(place_log_file(log_file_path, dest_path), file_state))
+            resume[dest_path] = file_state
+            all_errors.extend(file_state['errors'])
     
-    return all_errors
\ No newline at end of file
+    return all_errors
@@ -1,11 +1,15 @@
 import os
 import re 
+import logging
 import datetime
 import bisect
-import time
-import gzip
-import shutil
 import html
+import instrumentation
+import memory_budget
+from concurrent.futures import ThreadPoolExecutor
+from file_parser.placeArtifact import placeGzipFile
+from . import scanLog
+from .traceMarkers import probeMarker
 
 ROLE_CHANGE_STRING = "SNR role change "
 RU_ID_STRING = "RU_ID"
@@ -25,6 +29,16 @@ PROCESS_STRING = "process_name="
 CONTINUE_FILE_STRING = "*** TRACE CONTINUES IN FILE "
 CONTINUED_FROM_FILE_DUMP_STRING = "Dump continued from file: "
 FILE_STRING = "FILE"
+CANDIDATE_WINDOW_LINES = 8
+
+LEADERSHIP_PATTERN = scanLog.compileNeedles([ROLE_CHANGE_STRING_RUID.encode(), RECOVERY_EVENT_STRING.encode()])
+EVENT_PATTERN = scanLog.compileNeedles([ROLE_CHANGE_STRING_RUID.encode(), ERROR_STRING.encode()])
+# Matches a watson.dif line that references a trace, or else a .dif, or else a .log file,
+# in that order of precedence, naming the group after the kind of file it found.
+WATSON_REFERENCE_PATTERN = re.compile(r'(?=.*?(?P<trc>\S+\.trc))|(?=.*?(?P<dif>\S+\.dif))|(?=.*?(?P<log>\S+\.log))')
+WATSON_WORKERS = 8
+
+logger = logging.getLogger(__name__)
 
 def convert_file_to_html(source_path, output_dir):
     """
@@ -37,7 +51,12 @@ def convert_file_to_html(source_path, output_dir):
     html_file_name = f"{base_name}.html"
     html_path = os.path.join(output_dir, html_file_name)
 
+    # A conversion written after the source last changed is still current.
+    if os.path.exists(html_path) and os.path.getmtime(html_path) >= os.path.getmtime(source_path):
+        return html_path
+
     try:
+        instrumentation.countFileRead(source_path)
         with open(source_path, 'r', encoding='utf-8', errors='ignore') as f_in:
             lines = f_in.readlines()
 
@@ -53,8 +72,7 @@ def convert_file_to_html(source_path, output_dir):
         
         return html_path
     except Exception as e:
-        print(f"Error converting {source_path} to HTML: {e}")
-        breakpoint()
+        logger.error("Error converting %s to HTML: %s", source_path, e)
         return None
 
 def rmdbExists(rmdbList, target):
@@ -92,7 +110,7 @@ def fetchTimestampFromIndex(lines, index):
     while not isTimeStamp(lines[index]):
         index -= 1
         if index < 0:
-            print("Error: No Timestamp found for line{}".format(index))
+            logger.error("No Timestamp found for line %s", index)
             return
     return index
 
@@ -146,32 +164,127 @@ def fetchTermSlot(eventsLog, timestamp, eventsLogTimestamps):
     if ip == 0:
         return 0
     return ip - 1
+
+# Files events under the leadership term that was current at their timestamp.
+# Args:
+#     terms (list): The sorted terms of one RUID in one shard group.
+#     events (list): The events to file.
+# Returns:
+#     list: The events that could not be filed because there are no terms yet.
+def slotEvents(terms, events):
+    if not terms:
+        return list(events)
+    termTimestamps = [datetime.datetime.fromisoformat(term['timestamp']).timestamp() for term in terms]
+    for event in events:
+        targetSlot = fetchTermSlot(terms, event['timestamp'], termTimestamps)
+        if event.get('type') == 'error':
+            history_event = terms[targetSlot]
+            if 'errors' not in history_event:
+                history_event['errors'] = []
+            history_event['errors'].append(event)
+        else:
+            terms[targetSlot]['history'].append(event)
+    return []
+
+# Removes and returns every event filed under a list of terms.
+def unslotEvents(terms):
+    events = []
+    for term in terms:
+        events.extend(term.get('history', []))
+        events.extend(term.get('errors', []))
+        term['history'] = []
+        term['errors'] = []
+    return events
+
+# Moves the events of terms that are finished to the spill file, see memory_budget.SpilledList,
+# and counts them. Their errors are kept, the clean run diff still marks them. Spilled events
+# are read-only: it must only be called once slotEvents files nothing more under the terms,
+# i.e. after the events of the last database of their shard group, or after parseHistory.
+def spillTermEvents(terms):
+    spilled = 0
+    for term in terms:
+        if isinstance(term.get('history'), list) and term['history']:
+            spilled += len(term['history'])
+            term['history'] = memory_budget.SpilledList(term['history'])
+    return spilled
+
+# Spills the events of every term of a history, see spillTermEvents.
+def spillHistory(history):
+    spilled = sum(spillTermEvents(terms) for shardGroups in history.values() for terms in shardGroups.values())
+    if spilled:
+        logger.info("Spilled %d events to disk, over the memory budget", spilled)
+    return spilled
+
+# Identifies a term across runs, for resuming a parse.
+def termKey(term):
+    return [term['timestamp'], term['term'], term['dbId']]
+
+# Returns the byte range of a log file to scan, and the timestamp governing its start.
+def scanBounds(scanRanges, logFilePath):
+    if not scanRanges or logFilePath not in scanRanges:
+        return 0, None, None
+    scanRange = scanRanges[logFilePath]
+    return scanRange['start'], scanRange['end'], scanRange.get('last_timestamp')
+
+# Returns the last line of the scanned part of a log file and the timestamp governing its end.
+# The debug logs of a database continue one another across rotations, so what precedes the
+# first line of a file is the end of the file before it.
+# Args:
+#     data (mmap.mmap or bytes): The file contents.
+#     start (int): Byte offset the scan started from.
+#     end (int): Byte offset the scan stopped at, or None for the end of the data.
+#     lastLine (str): The last line of the files before, for an empty file.
+#     lastTimestamp (str): The timestamp governing the start of the scan.
+# Returns:
+#     tuple: The last line and the timestamp, to carry over to the next file.
+def scanTail(data, start, end, lastLine, lastTimestamp):
+    end = len(data) if end is None else min(end, len(data))
+    if end > 0:
+        lastLine = scanLog.previousLine(data, end)
+    return lastLine, scanLog.precedingTimestamp(data, end, start, lastTimestamp)
        
     
 # Only leadership changes for now
-def parseLogFile(logFileContent, dbName, dbId):
-    result = dict()
-    for i in range(len(logFileContent)):
-      readLine = logFileContent[i]
-      
-      ruid = fetchRUIDFromLine(readLine)
-
-      if ruid == -1:
-         continue
-
-      if ruid not in result:
-         result[ruid] = list()
-          
-      if ROLE_CHANGE_STRING_RUID in readLine:
-          if LEADER_STRING in readLine:
-            result[ruid].append(parseLineData(readLine, logFileContent[i-1], dbName, dbId))
-
-      if RECOVERY_EVENT_STRING in readLine and len(result[ruid]) > 0:
-        if 'recoveryTime' in result[ruid][-1]:
-           continue
-        previousTimestamp = logFileContent[(fetchTimestampFromIndex(logFileContent, i))].strip()
-        result[ruid][-1]['recoveryTime'] = datetime.datetime.fromisoformat(previousTimestamp).timestamp() - datetime.datetime.fromisoformat(result[ruid][-1]['timestamp']).timestamp()
-          
+# Args:
+#     logFilePaths (list): The debug log files of one database, in order.
+#     dbName (str): The name of the database.
+#     dbId (int): The ID of the database.
+#     scanRanges (dict): Per log file, the byte range to scan when resuming a parse.
+#     openTerms (dict): Per RUID, the last term seen by a previous parse, so a
+#                       recovery logged after it resumes is still attributed to it.
+# Returns:
+#     dict: A dictionary where the keys are RUIDs and the values are lists of terms.
+def parseLogFile(logFilePaths, dbName, dbId, scanRanges=None, openTerms=None):
+    result = {ruid: [term] for ruid, term in (openTerms or {}).items()}
+    lastLine, carriedTimestamp = "", None
+    for logFilePath in logFilePaths:
+      instrumentation.countFileRead(logFilePath)
+      start, end, lastTimestamp = scanBounds(scanRanges, logFilePath)
+      lastTimestamp = lastTimestamp or carriedTimestamp
+      with scanLog.mapLogFile(logFilePath) as data:
+        for lineStart, lineEnd in scanLog.iterMatchingLines(data, LEADERSHIP_PATTERN, start, end):
+          readLine = scanLog.decodeLine(data, lineStart, lineEnd)
+
+          ruid = fetchRUIDFromLine(readLine)
+
+          if ruid == -1:
+             continue
+
+          if ruid not in result:
+             result[ruid] = list()
+
+          if ROLE_CHANGE_STRING_RUID in readLine:
+              if LEADER_STRING in readLine:
+                timestampLine = scanLog.previousLine(data, lineStart) if lineStart > 0 else lastLine
+                result[ruid].append(parseLineData(readLine, timestampLine, dbName, dbId))
+
+          if RECOVERY_EVENT_STRING in readLine and len(result[ruid]) > 0:
+            if 'recoveryTime' in result[ruid][-1]:
+               continue
+            previousTimestamp = scanLog.precedingTimestamp(data, lineStart, start, lastTimestamp).strip()
+            result[ruid][-1]['recoveryTime'] = datetime.datetime.fromisoformat(previousTimestamp).timestamp() - datetime.datetime.fromisoformat(result[ruid][-1]['timestamp']).timestamp()
+        lastLine, carriedTimestamp = scanTail(data, start, end, lastLine, lastTimestamp)
+
     return result
 
 def parseCandidateChange(lines, index):
@@ -189,7 +302,7 @@ def parseCandidateChange(lines, index):
     offset = 0
     while HEARTBEAT_PARAMETERS_STRING not in lines[index + offset]:
         offset += 1
-        if offset > 7:
+        if offset > 7 or index + offset >= len(lines):
             return result
         
     while not isTimeStamp(lines[index + offset]):
@@ -218,15 +331,15 @@ def parseErrorLog(lines, index):
     return result
 
 def findParentWithSubdir(target_subdir, start_path):
-    print(f"[{time.time()}] findParentWithSubdir: searching for '{target_subdir}' starting from '{start_path}'")
+    logger.debug("findParentWithSubdir: searching for '%s' starting from '%s'", target_subdir, start_path)
     current_path = os.path.abspath(start_path)
     while True:
         if os.path.isdir(os.path.join(current_path, target_subdir)):
-            print(f"[{time.time()}] findParentWithSubdir: found at '{current_path}'")
+            logger.debug("findParentWithSubdir: found at '%s'", current_path)
             return current_path
         parent_path = os.path.dirname(current_path)
         if parent_path == current_path:
-            print(f"[{time.time()}] findParentWithSubdir: not found for '{start_path}'")
+            logger.debug("findParentWithSubdir: not found for '%s'", start_path)
             return None
         current_path = parent_path
 
@@ -308,63 +421,50 @@ def findNearestTimestamp(filePath, target):
 
 
 
+# Finds the trace of a process and the line nearest to a timestamp in it, following the
+# trace to the file it continues in. Gzipped traces are only inflated when they are shown.
+# Returns:
+#     tuple: The trace's HTML page and the line to scroll to, or an empty path and 0.
 def findOspFile(trace_dir, targetOsp, ruid, dbName, dbId, processName, targetUnzipDirectory, foundTimestamp):
    mainOSPFile = f"{dbName}_{processName.lower()}_{targetOsp}.trc"
    osp_path = os.path.join(trace_dir, mainOSPFile)
    
-   is_gzipped = False
    if not os.path.exists(osp_path):
        if os.path.exists(osp_path + ".gz"):
            osp_path += ".gz"
-           is_gzipped = True
        else:
            return "", 0
  
-   read_path = osp_path
-   if is_gzipped:
-       dest_path = os.path.join(targetUnzipDirectory, mainOSPFile)
-       with gzip.open(osp_path, 'rb') as f_in:
-           if not os.path.exists(dest_path):
-               with open(dest_path, 'wb') as f_out:
-                   shutil.copyfileobj(f_in, f_out)
-       read_path = dest_path
- 
    continued_filename = ""
    try:
-       with open(read_path, 'r', encoding='utf-8', errors='ignore') as fp:
-           for line in fp.readlines():
-               if CONTINUE_FILE_STRING in line:
-                   words = line.split(" ")
-                   for word in words:
-                       if dbName in word:
-                           continued_filename = os.path.basename(word.strip())
-                           break
-                   if continued_filename:
-                       break
+       for line in probeMarker(osp_path, CONTINUE_FILE_STRING):
+           words = line.split(" ")
+           for word in words:
+               if dbName in word:
+                   continued_filename = os.path.basename(word.strip())
+                   break
+           if continued_filename:
+               break
    except Exception as e:
-       print(f"Error processing file {read_path}: {e}")
- 
-   if not continued_filename:
-       html_path = convert_file_to_html(read_path, targetUnzipDirectory)
-       targetLine = findNearestTimestamp(read_path, foundTimestamp)
-       return html_path, targetLine + 1
+       logger.error("Error processing file %s: %s", osp_path, e)
  
-   continued_path_source = os.path.join(trace_dir, continued_filename)
-   if os.path.exists(continued_path_source):
-       new_html_file = convert_file_to_html(continued_path_source, targetUnzipDirectory)
-       targetLine = findNearestTimestamp(continued_path_source, foundTimestamp)
-       return new_html_file, targetLine + 1
-   elif os.path.exists(continued_path_source + ".gz"):
-       continued_path_dest = os.path.join(targetUnzipDirectory, continued_filename)
-       with gzip.open(continued_path_source + ".gz", 'rb') as f_in:
-           if not os.path.exists(continued_path_dest):
-               with open(continued_path_dest, 'wb') as f_out:
-                   shutil.copyfileobj(f_in, f_out)
-       
-       new_html_file = convert_file_to_html(continued_path_dest, targetUnzipDirectory)
-       targetLine = findNearestTimestamp(continued_path_dest, foundTimestamp)
-       return new_html_file, targetLine + 1
-   
+   if continued_filename:
+       continued_path_source = os.path.join(trace_dir, continued_filename)
+       if os.path.exists(continued_path_source):
+           new_html_file = convert_file_to_html(continued_path_source, targetUnzipDirectory)
+           targetLine = findNearestTimestamp(continued_path_source, foundTimestamp)
+           return new_html_file, targetLine + 1
+       elif os.path.exists(continued_path_source + ".gz"):
+           continued_path_dest = os.path.join(targetUnzipDirectory, continued_filename)
+           placeGzipFile(continued_path_source + ".gz", continued_path_dest)
+
+           new_html_file = convert_file_to_html(continued_path_dest, targetUnzipDirectory)
+           targetLine = findNearestTimestamp(continued_path_dest, foundTimestamp)
+           return new_html_file, targetLine + 1
+
+   read_path = osp_path
+   if osp_path.endswith('.gz'):
+       read_path = placeGzipFile(osp_path, os.path.join(targetUnzipDirectory, mainOSPFile))
    html_path = convert_file_to_html(read_path, targetUnzipDirectory)
    targetLine = findNearestTimestamp(read_path, foundTimestamp)
    return html_path, targetLine + 1
@@ -377,81 +477,177 @@ def getLogName(rmdbList, target):
             return rmdb['logFolderNames']
         
 
-# Parses all other events from a log file.
+# Continues the lines following a candidate change that runs to the end of its log file
+# into the next files of the database, as a single log was read before rotation.
+# Args:
+#     window (list): The lines read so far, extended in place.
+#     nextLogFilePaths (list): The debug log files after the one the window is from.
+#     scanRanges (dict): Per log file, the byte range to scan when resuming a parse.
+def continueWindow(window, nextLogFilePaths, scanRanges):
+    for nextLogFilePath in nextLogFilePaths:
+        if len(window) >= CANDIDATE_WINDOW_LINES:
+            return
+        end = scanBounds(scanRanges, nextLogFilePath)[1]
+        with scanLog.mapLogFile(nextLogFilePath) as data:
+            window.extend(scanLog.followingLines(data, 0, CANDIDATE_WINDOW_LINES - len(window), end))
+
+# Parses all other events from the debug logs of a database.
 # Args:
-#     logFileContent (list): A list of strings representing the lines in a log file.
+#     logFilePaths (list): The debug log files of the database, in order.
 #     ruidList (list): A list of all RUIDs.
 #     dbName (str): The name of the database.
 #     dbId (int): The ID of the database.
-#     logFilePath (str): The path to the log file.
+#     logFilePath (str): The path to the database's diag folder.
 #     incidents (list): A list to store any incidents found.
+#     scanRanges (dict): Per log file, the byte range to scan when resuming a parse.
+#     pendingCandidates (list): Collects (ruid, log file, offset, event) for candidate
+#                               changes whose parameter lines run past the scanned range.
 # Returns:
 #     dict: A dictionary where the keys are RUIDs and the values are lists of events.
-def parseAllOtherEvents(logFileContent, ruidList, dbName, dbId, logFilePath, incidents, rmdbs, targetUnzipDirectory):
+def parseAllOtherEvents(logFilePaths, ruidList, dbName, dbId, logFilePath, incidents, rmdbs, targetUnzipDirectory, scanRanges=None, pendingCandidates=None):
     dbLogNames = getLogName(rmdbs, dbName)
     result = {ruid: [] for ruid in ruidList}
-    for i in range(len(logFileContent)):
-        line = logFileContent[i]
-        if CANDIDATE_STRING in line and ROLE_CHANGE_STRING_RUID in line:
-            lineInfo = parseCandidateChange(logFileContent, i)
-        elif ERROR_STRING in line:
-            lineInfo = parseErrorLog(logFileContent, i)
-            if lineInfo['code'] == 0:
-                continue
-            lineInfo['isNew'] = False
-            if 'ospid' in lineInfo and 'process_name' in lineInfo:
-                trace_parent_dir = findParentWithSubdir('trace', logFilePath)
-                if not trace_parent_dir:
-                    for dbLogName in dbLogNames:
-                        unzipPath = os.path.join(logFilePath, dbLogName)
-                        if os.path.exists(unzipPath):
-                            trace_parent_dir = unzipPath
-                            break
-                if trace_parent_dir:
-                    lineInfo['ospFile'], lineInfo['scrollIndex'] = findOspFile(os.path.join(trace_parent_dir, 'trace'), lineInfo['ospid'], fetchRUIDFromLine(line), dbLogNames[0], dbId,lineInfo['process_name'], targetUnzipDirectory, logFileContent[fetchTimestampFromIndex(logFileContent, i)].strip())
+    lastLine, carriedTimestamp = "", None
+    for fileIndex, dbLogFilePath in enumerate(logFilePaths):
+        instrumentation.countFileRead(dbLogFilePath)
+        start, end, lastTimestamp = scanBounds(scanRanges, dbLogFilePath)
+        lastTimestamp = lastTimestamp or carriedTimestamp
+        nextLogFilePaths = logFilePaths[fileIndex + 1:]
+        with scanLog.mapLogFile(dbLogFilePath) as data:
+            for lineStart, lineEnd in scanLog.iterMatchingLines(data, EVENT_PATTERN, start, end):
+                line = scanLog.decodeLine(data, lineStart, lineEnd)
+                window = None
+                if CANDIDATE_STRING in line and ROLE_CHANGE_STRING_RUID in line:
+                    window = scanLog.followingLines(data, lineStart, CANDIDATE_WINDOW_LINES, end)
+                    continueWindow(window, nextLogFilePaths, scanRanges)
+                    lineInfo = parseCandidateChange(window, 0)
+                elif ERROR_STRING in line:
+                    lineInfo = parseErrorLog([line], 0)
+                    if lineInfo['code'] == 0:
+                        continue
+                    lineInfo['isNew'] = False
+                    if 'ospid' in lineInfo and 'process_name' in lineInfo:
+                        trace_parent_dir = findParentWithSubdir('trace', logFilePath)
+                        if not trace_parent_dir:
+                            for dbLogName in dbLogNames:
+                                unzipPath = os.path.join(logFilePath, dbLogName)
+                                if os.path.exists(unzipPath):
+                                    trace_parent_dir = unzipPath
+                                    break
+                        if trace_parent_dir:
+                            with instrumentation.stage("trace_lookup"):
+                                lineInfo['ospFile'], lineInfo['scrollIndex'] = findOspFile(os.path.join(trace_parent_dir, 'trace'), lineInfo['ospid'], fetchRUIDFromLine(line), dbLogNames[0], dbId,lineInfo['process_name'], targetUnzipDirectory, scanLog.precedingTimestamp(data, lineStart, start, lastTimestamp).strip())
+                        else:
+                            logger.debug("parseAllOtherEvents: 'trace' parent directory not found for '%s' when searching for ospFile", logFilePath)
                 else:
-                    print(f"[{time.time()}] parseAllOtherEvents: 'trace' parent directory not found for '{logFilePath}' when searching for ospFile")
-        else:
-            continue
-        lineInfo['timestamp'] = logFileContent[fetchTimestampFromIndex(logFileContent, i)].strip()
-        lineInfo['original'] = line
-        lineInfo['dbName'] = dbName
-        lineInfo['dbId'] = dbId
-        ruid = fetchRUIDFromLine(line)
-        if ruid == -1:
-            continue
-        result[ruid].append(lineInfo)
+                    continue
+                lineInfo['timestamp'] = scanLog.precedingTimestamp(data, lineStart, start, lastTimestamp).strip()
+                lineInfo['original'] = line
+                lineInfo['dbName'] = dbName
+                lineInfo['dbId'] = dbId
+                ruid = fetchRUIDFromLine(line)
+                if ruid == -1:
+                    continue
+                result[ruid].append(lineInfo)
+                # Only the last file may still grow, the window of an earlier one was continued
+                if window is not None and len(window) < CANDIDATE_WINDOW_LINES and not nextLogFilePaths and pendingCandidates is not None:
+                    pendingCandidates.append((ruid, dbLogFilePath, lineStart, lineInfo))
+            lastLine, carriedTimestamp = scanTail(data, start, end, lastLine, lastTimestamp)
 
     return result
             
 
 
-def parseHistory(allRUIDs, rmdbs, logFiles, dbIds, directoryName):
+# Parses again the candidate changes whose parameter lines had not all been
+# written when they were first seen, now that the log may have grown.
+# Args:
+#     history (dict): The history of the previous parse.
+#     orphans (dict): Events of the previous parse that are not filed under a term yet.
+#     pending (list): Pending candidates, as recorded in the parse state.
+#     scanRanges (dict): Per log file, the byte range of this parse.
+#     dbLogPaths (dict): The debug log files of each database, in order, to continue a
+#                        candidate into the files rotated in since it was first seen.
+# Returns:
+#     list: The candidates that are still incomplete.
+def refreshPendingCandidates(history, orphans, pending, scanRanges, dbLogPaths):
+    stillPending = []
+    for candidate in pending:
+        events = [event for term in history.get(candidate['ruid'], {}).get(candidate['shardGroup'], []) for event in term['history']]
+        events.extend(orphans.get(candidate['ruid'], {}).get(candidate['shardGroup'], []))
+        event = next((event for event in events if event.get('timestamp') == candidate['timestamp'] and event.get('original') == candidate['original']), None)
+        if event is None or candidate['logFile'] not in scanRanges:
+            continue
+        with scanLog.mapLogFile(candidate['logFile']) as data:
+            window = scanLog.followingLines(data, candidate['offset'], CANDIDATE_WINDOW_LINES, scanRanges[candidate['logFile']]['end'])
+        dbLogFilePaths = next((paths for paths in dbLogPaths.values() if candidate['logFile'] in paths), [candidate['logFile']])
+        nextLogFilePaths = dbLogFilePaths[dbLogFilePaths.index(candidate['logFile']) + 1:]
+        continueWindow(window, nextLogFilePaths, scanRanges)
+        refreshed = parseCandidateChange(window, 0)
+        event['parameters'] = refreshed['parameters']
+        if 'reason' in refreshed:
+            event['reason'] = refreshed['reason']
+        if len(window) < CANDIDATE_WINDOW_LINES and not nextLogFilePaths:
+            stillPending.append(candidate)
+    return stillPending
+
+# Builds the leadership history of every RUID in every shard group.
+# Args:
+#     allRUIDs (list): Every RUID found in the debug logs.
+#     rmdbs (list): The shard databases from the gdsctl log.
+#     logFiles (list): The debug logs, as dicts with 'dbName', 'logFile' and 'originalLogFile'.
+#     dbIds (dict): The database IDs by name.
+#     directoryName (str): The report directory trace files are unzipped to.
+#     resume (dict): State of a previous parse to continue from, see log_parser.parseState.
+#                    Holds 'ranges', 'history', 'open_terms', 'orphans' and 'pending';
+#                    the last three are updated in place for the next resume.
+# Returns:
+#     tuple: The history dict and a list of incidents.
+def parseHistory(allRUIDs, rmdbs, logFiles, dbIds, directoryName, resume=None):
     history = {ruid: {rmdb['shardGroup']: [] for rmdb in rmdbs} for ruid in allRUIDs}
+    resume = resume if resume is not None else {}
+    scanRanges = resume.get('ranges')
+    openTerms = resume.setdefault('open_terms', {})
+    orphans = resume.setdefault('orphans', {})
+    for ruid, shardGroupTerms in (resume.get('history') or {}).items():
+        for shardGroup, terms in shardGroupTerms.items():
+            if ruid in history and shardGroup in history[ruid]:
+                history[ruid][shardGroup] = terms
+    resumedTermCounts = {(ruid, shardGroup): len(terms) for ruid in history for shardGroup, terms in history[ruid].items()}
+    pendingCandidates = []
     incidents = list()
-    dbLogsCache = dict()
+    dbLogPaths = dict()
     shardGroups = dict()
     logFilePaths = {logFile['dbName']: logFile['originalLogFile'] for logFile in logFiles}
-    print(f"[{time.time()}] --- Starting parseHistory ---")
-    print(f"[{time.time()}] allRUIDs: {allRUIDs}")
-    print(f"[{time.time()}] rmdbs: {rmdbs}")
-    print(f"[{time.time()}] logFiles: {logFiles}")
-    print(f"[{time.time()}] dbIds: {dbIds}")
+    logger.debug("--- Starting parseHistory ---")
+    logger.debug("allRUIDs: %s", allRUIDs)
+    logger.debug("rmdbs: %s", rmdbs)
+    logger.debug("logFiles: %s", logFiles)
+    logger.debug("dbIds: %s", dbIds)
 
     for logFile in logFiles:
-        print(f"[{time.time()}] Processing log file: {logFile['logFile']} for db: {logFile['dbName']}")
+        logger.debug("Processing log file: %s for db: %s", logFile['logFile'], logFile['dbName'])
         try:
-            if logFile['dbName'] not in dbLogsCache:
-                dbLogsCache[logFile['dbName']] = []
-            with open(logFile['logFile'], 'r', encoding='utf-8', errors='ignore') as fp:
-                dbLogsCache[logFile['dbName']].extend(fp.readlines())
+            if logFile['dbName'] not in dbLogPaths:
+                dbLogPaths[logFile['dbName']] = []
+            with open(logFile['logFile'], 'rb'):
+                dbLogPaths[logFile['dbName']].append(logFile['logFile'])
         except Exception as e:
-            print(f"Error processing log file {logFile['logFile']}: {e}")
+            logger.error("Error processing log file %s: %s", logFile['logFile'], e)
             continue
-
-    for dbName, logFileContents in dbLogsCache.items():
-        parsed_log = parseLogFile(logFileContents, dbName, dbIds[dbName])
-        print(f"[{time.time()}] Parsed leadership changes for {dbName}: {parsed_log}")
+    pending = refreshPendingCandidates(history, orphans, resume.get('pending', []), scanRanges or {}, dbLogPaths)
+
+    for dbName, dbLogFilePaths in dbLogPaths.items():
+        dbShardGroup = next((rmdb['shardGroup'] for rmdb in rmdbs if rmdb['dbName'] == dbName), None)
+        dbOpenTerms = {}
+        for ruid, key in openTerms.get(dbName, {}).items():
+            for term in history.get(ruid, {}).get(dbShardGroup, []):
+                if termKey(term) == key:
+                    dbOpenTerms[ruid] = term
+                    break
+        with instrumentation.stage("leadership_parse"):
+            parsed_log = parseLogFile(dbLogFilePaths, dbName, dbIds[dbName], scanRanges, dbOpenTerms)
+        openTerms[dbName] = {ruid: termKey(terms[-1]) for ruid, terms in parsed_log.items() if terms}
+        logger.debug("Parsed leadership changes for %s: %s", dbName, parsed_log)
         for ruid, events in parsed_log.items():
             if ruid in history:
                 for rmdb in rmdbs:
@@ -465,10 +661,29 @@ def parseHistory(allRUIDs, rmdbs, logFiles, dbIds, directoryName):
 
     for ruid in history:
         for shard_group in history[ruid]:
-            history[ruid][shard_group].sort(key=lambda result: datetime.datetime.fromisoformat(result['timestamp'].strip()).timestamp(), reverse=False)
+            # Ties go by database, which is the order the databases are parsed in, so
+            # a resumed parse orders terms the same way as a full one.
+            history[ruid][shard_group].sort(key=lambda result: (datetime.datetime.fromisoformat(result['timestamp'].strip()).timestamp(), result['dbId']), reverse=False)
 
-    for dbName, logFileContents in dbLogsCache.items():
-        print(f"[{time.time()}] Processing other events for DB: {dbName}")
+    # When resuming, terms from the new bytes can start before events filed by the
+    # previous parse (the databases of a shard group are not logged in lockstep), so
+    # those events are filed again. Events that had no term to go under are retried.
+    for ruid in history:
+        for shard_group, terms in history[ruid].items():
+            resumedCount = resumedTermCounts.get((ruid, shard_group), 0)
+            unfiled = orphans.get(ruid, {}).pop(shard_group, [])
+            if resumedCount and len(terms) > resumedCount:
+                unfiled = unslotEvents(terms) + unfiled
+            if unfiled:
+                leftover = slotEvents(terms, unfiled)
+                if leftover:
+                    orphans.setdefault(ruid, {})[shard_group] = leftover
+
+    # The terms of a shard group are finished once its last database's events are filed
+    lastShardGroupDbs = {next((rmdb['shardGroup'] for rmdb in rmdbs if rmdb['dbName'] == dbName), None): dbName for dbName in dbLogPaths}
+    spilled = 0
+    for dbName, dbLogFilePaths in dbLogPaths.items():
+        logger.debug("Processing other events for DB: %s", dbName)
         current_shard_group = None
         for rmdb in rmdbs:
             if rmdb['dbName'] == dbName:
@@ -482,27 +697,25 @@ def parseHistory(allRUIDs, rmdbs, logFiles, dbIds, directoryName):
         if not logFilePath:
             continue
 
-        otherEvents = parseAllOtherEvents(logFileContents, allRUIDs, dbName, dbIds[dbName], logFilePath, incidents, rmdbs, directoryName)
-        print(f"[{time.time()}] Parsed other events for {dbName}: {otherEvents}")
+        with instrumentation.stage("event_parse"):
+            otherEvents = parseAllOtherEvents(dbLogFilePaths, allRUIDs, dbName, dbIds[dbName], logFilePath, incidents, rmdbs, directoryName, scanRanges, pendingCandidates)
+        logger.debug("Parsed other events for %s: %s", dbName, otherEvents)
 
         for ruid in allRUIDs:
-            ruidEvents = otherEvents[ruid]
-            ruidShardGroupHistory = history[ruid][current_shard_group]
-            
-            leader_event_timestamps = [datetime.datetime.fromisoformat(e['timestamp']).timestamp() for e in ruidShardGroupHistory]
-
-            for event in ruidEvents:
-                if not ruidShardGroupHistory:
-                    continue
-                targetSlot = fetchTermSlot(ruidShardGroupHistory, event['timestamp'], leader_event_timestamps)
-                if event.get('type') == 'error':
-                    history_event = ruidShardGroupHistory[targetSlot]
-                    if 'errors' not in history_event:
-                        history_event['errors'] = []
-                    history_event['errors'].append(event)
-                else:
-                    ruidShardGroupHistory[targetSlot]['history'].append(event)
+            leftover = slotEvents(history[ruid][current_shard_group], otherEvents[ruid])
+            if leftover:
+                orphans.setdefault(ruid, {}).setdefault(current_shard_group, []).extend(leftover)
     
+        for ruid, candidateLogFile, offset, event in pendingCandidates:
+            pending.append({'ruid': ruid, 'shardGroup': current_shard_group, 'logFile': candidateLogFile, 'offset': offset, 'timestamp': event['timestamp'], 'original': event['original']})
+        pendingCandidates.clear()
+
+        if lastShardGroupDbs.get(current_shard_group) == dbName and memory_budget.overBudget():
+            spilled += sum(spillTermEvents(history[ruid][current_shard_group]) for ruid in allRUIDs)
+    if spilled:
+        logger.info("Spilled %d events of finished terms to disk, over the memory budget", spilled)
+    resume['pending'] = pending
+
     for ruid in history:
         for shard_group in history[ruid]:
             for event in history[ruid][shard_group]:
@@ -511,7 +724,7 @@ def parseHistory(allRUIDs, rmdbs, logFiles, dbIds, directoryName):
                 if 'errors' not in event:
                     event['errors'] = []
 
-    print(f"[{time.time()}] --- Finished parseHistory ---")
+    logger.debug("--- Finished parseHistory ---")
     return history, incidents
 
 def checkFile(filePath, unzipTo):
@@ -520,93 +733,103 @@ def checkFile(filePath, unzipTo):
     elif os.path.exists(filePath + ".gz"):
         gz_path = filePath + ".gz"
         dest_path = os.path.join(unzipTo, os.path.basename(filePath))
-        with gzip.open(gz_path, 'rb') as f_in:
-            if not os.path.exists(dest_path):
-                with open(dest_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-        return dest_path
+        return placeGzipFile(gz_path, dest_path)
     else:
         return None
     
 def listRightIndex(alist, value):
     return len(alist) - alist[-1::-1].index(value) -1
 
+# Reads the file a trace's dump was continued from.
+# Args:
+#     trcPath (str): The trace file.
+# Returns:
+#     str: The path the trace names, or an empty string if it has none.
+def findContinuedFrom(trcPath):
+    try:
+        lines = probeMarker(trcPath, CONTINUED_FROM_FILE_DUMP_STRING)
+    except Exception as e:
+        logger.error("Error reading %s to find continued log: %s", trcPath, e)
+        return ''
+    return lines[0].split(CONTINUED_FROM_FILE_DUMP_STRING, 1)[1].strip() if lines else ''
+
+# Maps the path a trace was continued from onto the LRG's diag directory.
+def continuedLogPath(logDirectory, continuedFrom, unzipTo):
+    if not continuedFrom:
+        return ''
+    pathParts = continuedFrom.split('/')
+    try:
+        rdbmsIndex = listRightIndex(pathParts, 'rdbms')
+    except ValueError:
+        return ''
+    return checkFile(os.path.join(logDirectory, 'diag', *pathParts[rdbmsIndex:]), unzipTo)
+
+# The key a watson.dif reference is resolved under. The .dif and .log references of one
+# incident share the incident's base name, so both siblings are only placed once.
+# Returns:
+#     tuple: 'trc' and the trace file name, or 'incident' and the incident's base name.
+def watsonReferenceKey(kind, fileName):
+    if kind == 'trc':
+        return kind, fileName
+    return 'incident', fileName.rsplit('.' + kind, 1)[0]
+
+# Finds the files watson.dif references under one key, and their .log or .dif siblings.
+# Args:
+#     logDirectory (str): The LRG directory.
+#     reference (tuple): The key of the reference, as returned by watsonReferenceKey.
+#     kinds (set): The kinds of reference ('trc', 'dif' or 'log') seen for the key.
+#     unzipTo (str): Where gzipped files are placed.
+# Returns:
+#     tuple: The kind and the entry, or None if no referenced file exists.
+def resolveWatsonReference(logDirectory, reference, kinds, unzipTo):
+    kind, fileName = reference
+    if kind == 'trc':
+        trcPath = checkFile(os.path.join(logDirectory, fileName), unzipTo)
+        if not trcPath:
+            return None
+        return kind, {'file': trcPath, 'log_file': continuedLogPath(logDirectory, findContinuedFrom(trcPath), unzipTo)}
+
+    difPath = checkFile(os.path.join(logDirectory, f"{fileName}.dif"), unzipTo)
+    logPath = checkFile(os.path.join(logDirectory, f"{fileName}.log"), unzipTo)
+    if not any(difPath if referenced == 'dif' else logPath for referenced in kinds):
+        return None
+    return kind, {'dif_file': difPath if difPath else '', 'log_file': logPath if logPath else ''}
+
+# Lists the trace files and the .dif/.log pairs of the incidents in an LRG's watson.dif.
+# Each line is matched once against WATSON_REFERENCE_PATTERN, every trace and incident is
+# resolved once however often it is referenced, and the references are resolved on a
+# thread pool.
+# Args:
+#     logDirectory (str): The LRG directory.
+#     unzipTo (str): Where gzipped files are placed.
+# Returns:
+#     tuple: The trace errors ('file' and the 'log_file' the trace continued from) and the
+#            watson errors ('dif_file' and 'log_file'), in watson.dif order.
 def parseWatsonLog(logDirectory, unzipTo):
     watsonDifPath = os.path.join(logDirectory, 'watson.dif')
     if not os.path.exists(watsonDifPath):
         return [], []
 
+    references = {}
+    instrumentation.countFileRead(watsonDifPath)
+    with open(watsonDifPath, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            match = WATSON_REFERENCE_PATTERN.match(line)
+            if match and match.lastgroup:
+                references.setdefault(watsonReferenceKey(match.lastgroup, match.group(match.lastgroup)), set()).add(match.lastgroup)
+
     trace_errors = []
     watson_errors = []
-    seen_errors = list() #set
-
-    with open(watsonDifPath, 'r', encoding='utf-8', errors='ignore') as f:
-        for line in f.readlines():
-            trc_match = re.search(r'(\S+\.trc)', line)
-            dif_match = re.search(r'(\S+\.dif)', line)
-            log_match = re.search(r'(\S+\.log)', line)
-
-            if trc_match:
-                trc_file = trc_match.group(1)
-                trc_path = checkFile(os.path.join(logDirectory, trc_file), unzipTo)
-                if trc_path:
-                    entry = {'file': trc_path}
-                    continued_log_path_str = ''
-                    try:
-                        with open(trc_path, 'r', encoding='utf-8', errors='ignore') as trc_fp:
-                            for trc_line in trc_fp.readlines():
-                                if CONTINUED_FROM_FILE_DUMP_STRING in trc_line:
-                                    continued_log_path_str = trc_line.split(CONTINUED_FROM_FILE_DUMP_STRING, 1)[1].strip()
-                                    break
-                    except Exception as e:
-                        print(f"Error reading {trc_path} to find continued log: {e}")
-                    
-                    if continued_log_path_str:
-                        try:
-                            path_parts = continued_log_path_str.split('/')
-                            rdbms_index = listRightIndex(path_parts,'rdbms')
-                            relative_path = os.path.join(*path_parts[rdbms_index:])
-                            diag_path = os.path.join(logDirectory, 'diag')
-                            continued_log_full_path = os.path.join(diag_path, relative_path)
-                            entry['log_file'] = checkFile(continued_log_full_path, unzipTo)
-                        except ValueError:
-                             entry['log_file'] = ''
-                    else:
-                        entry['log_file'] = ''
-                    
-                    entry_tuple = tuple(sorted(entry.items()))
-                    if entry_tuple not in seen_errors:
-                        trace_errors.append(entry)
-                        seen_errors.append(entry_tuple)
-
-            elif dif_match:
-                dif_file = dif_match.group(1)
-                base_name = dif_file.rsplit('.dif', 1)[0]
-                log_file = f"{base_name}.log"
-                
-                dif_path = checkFile(os.path.join(logDirectory, dif_file), unzipTo)
-                log_path = checkFile(os.path.join(logDirectory, log_file), unzipTo)
-                
-                if dif_path:
-                    entry = {'dif_file': dif_path, 'log_file': log_path if log_path else ''}
-                    entry_tuple = tuple(sorted(entry.items()))
-                    if entry_tuple not in seen_errors:
-                        watson_errors.append(entry)
-                        seen_errors.append(entry_tuple)
-
-            elif log_match and not dif_match and not trc_match:
-                log_file = log_match.group(1)
-                base_name = log_file.rsplit('.log', 1)[0]
-                dif_file = f"{base_name}.dif"
-
-                log_path = checkFile(os.path.join(logDirectory, log_file), unzipTo)
-                dif_path = checkFile(os.path.join(logDirectory, dif_file), unzipTo)
-
-                if log_path:
-                    entry = {'dif_file': dif_path if dif_path else '', 'log_file': log_path}
-                    entry_tuple = tuple(sorted(entry.items()))
-                    if entry_tuple not in seen_errors:
-                        watson_errors.append(entry)
-                        seen_errors.append(entry_tuple)
+    seen_errors = set()
+    with ThreadPoolExecutor(max_workers=WATSON_WORKERS) as pool:
+        resolved = pool.map(lambda item: resolveWatsonReference(logDirectory, item[0], item[1], unzipTo), references.items())
+        for result in resolved:
+            if result is None:
+                continue
+            kind, entry = result
+            entry_tuple = tuple(sorted(entry.items()))
+            if entry_tuple not in seen_errors:
+                seen_errors.add(entry_tuple)
+                (trace_errors if kind == 'trc' else watson_errors).append(entry)
 
     return trace_errors, watson_errors
@@ -1,7 +1,10 @@
 import os
 import re
+import instrumentation
+from . import scanLog
 
 RU_ID_STRING = "RU_ID"
+RU_ID_PATTERN = scanLog.compileNeedles([RU_ID_STRING.encode()])
 
 # Parses a line to find the RUID.
 # Args:
@@ -18,3 +21,22 @@ def parseRUIDLine(line):
             ruID = lineWords[i + 1].strip()
             ruID = re.sub(r"\D", "", ruID)
             return int(ruID)
+
+# Collects the RUIDs mentioned in a debug log, only decoding lines that contain RU_ID.
+# Args:
+#     filePath (str): The debug log to scan.
+#     start (int): Byte offset to start at, when resuming a parse.
+#     end (int): Byte offset to stop at. Defaults to the end of the file.
+# Returns:
+#     list: The RUIDs in order of first appearance.
+def parseRUIDFile(filePath, start=0, end=None):
+    ruIDs = list()
+    seen = set()
+    instrumentation.countFileRead(filePath)
+    with scanLog.mapLogFile(filePath) as data:
+        for lineStart, lineEnd in scanLog.iterMatchingLines(data, RU_ID_PATTERN, start, end):
+            ruID = parseRUIDLine(scanLog.decodeLine(data, lineStart, lineEnd))
+            if ruID > 0 and ruID not in seen:
+                seen.add(ruID)
+                ruIDs.append(ruID)
+    return ruIDs
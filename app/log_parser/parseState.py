@@ -0,0 +1,142 @@
+import os
+import json
+import logging
+import tempfile
+import memory_budget
+from . import scanLog
+
+PARSE_STATE_FILE_NAME = "parse_state.json"
+PARSE_STATE_VERSION = 1
+PARSE_RESULT_FILE_NAME = "results.json"
+
+logger = logging.getLogger(__name__)
+
+# Identifies a source file across runs, so appends can be told apart from
+# rotation (a new file under the same name) and truncation.
+def fileFingerprint(path):
+    stat = os.stat(path)
+    return {'path': path, 'device': stat.st_dev, 'inode': stat.st_ino, 'size': stat.st_size}
+
+# Whether a file is the same file as before, with at most bytes appended to it.
+# Compressed files are rewritten as a whole, so they must not have changed at all.
+def isAppendOf(previous, current):
+    if previous is None or previous.get('path') != current['path']:
+        return False
+    if (previous.get('device'), previous.get('inode')) != (current['device'], current['inode']):
+        return False
+    if current['path'].endswith('.gz'):
+        return current['size'] == previous.get('size')
+    return current['size'] >= previous.get('size', 0)
+
+def intKeys(mapping):
+    return {int(key): value for key, value in (mapping or {}).items()}
+
+# Loads the state a previous incremental parse of an LRG left in its report directory.
+# Args:
+#     report_dir (str): The LRG's report directory.
+# Returns:
+#     dict: The state, or None if there is none or it can not be used.
+def loadParseState(report_dir):
+    state_path = os.path.join(report_dir, PARSE_STATE_FILE_NAME)
+    if not os.path.exists(state_path):
+        return None
+    try:
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable parse state %s: %s", state_path, e)
+        return None
+    if state.get('version') != PARSE_STATE_VERSION:
+        logger.info("Ignoring parse state %s written by another version", state_path)
+        return None
+
+    # JSON turns the integer RUID keys into strings.
+    state['history'] = {int(ruid): shardGroups for ruid, shardGroups in state.get('history', {}).items()}
+    state['open_terms'] = {dbName: intKeys(terms) for dbName, terms in state.get('open_terms', {}).items()}
+    state['orphans'] = intKeys(state.get('orphans'))
+    return state
+
+# Writes spilled lists out as lists, and anything else JSON has no type for as text.
+def jsonValue(value):
+    if isinstance(value, memory_budget.SpilledList):
+        return list(value)
+    return str(value)
+
+# Writes JSON next to its destination first, so readers never see a partial file.
+def writeJsonAtomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, default=jsonValue)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def saveParseState(report_dir, state):
+    writeJsonAtomic(os.path.join(report_dir, PARSE_STATE_FILE_NAME), dict(state, version=PARSE_STATE_VERSION))
+
+# Saves the parse result of an LRG (what parseLog returns), so its pages can be
+# rendered later without parsing again, e.g. by report_server.
+def saveParseResult(report_dir, logContents):
+    writeJsonAtomic(os.path.join(report_dir, PARSE_RESULT_FILE_NAME), logContents)
+
+# Loads a parse result written by saveParseResult.
+# Args:
+#     report_dir (str): The LRG's report directory.
+# Returns:
+#     dict: The log contents, or None if the LRG has not been parsed.
+def loadParseResult(report_dir):
+    result_path = os.path.join(report_dir, PARSE_RESULT_FILE_NAME)
+    if not os.path.exists(result_path):
+        return None
+    with open(result_path, 'r') as f:
+        logContents = json.load(f)
+    logContents['history'] = {int(ruid): shardGroups for ruid, shardGroups in logContents.get('history', {}).items()}
+    if 'error_rollups' in logContents:
+        logContents['error_rollups']['ruids'] = intKeys(logContents['error_rollups']['ruids'])
+    if 'leadership_stats' in logContents:
+        logContents['leadership_stats']['ruids'] = intKeys(logContents['leadership_stats']['ruids'])
+    return logContents
+
+# Lists the debug logs whose source was rotated or truncated since the previous parse.
+# Args:
+#     logFiles (list): The debug logs, as dicts with 'logFile' and 'sourceLogFile'.
+#     previousFiles (dict): The 'files' entry of the previous parse state.
+# Returns:
+#     list: The logFiles entries that can not be resumed.
+def findRotatedLogs(logFiles, previousFiles):
+    rotated = []
+    for logFile in logFiles:
+        previous = previousFiles.get(logFile['logFile'])
+        if previous and not isAppendOf(previous['source'], fileFingerprint(logFile['sourceLogFile'])):
+            rotated.append(logFile)
+    return rotated
+
+# Works out which bytes of each placed debug log still have to be scanned. Scans stop
+# at the last complete line, so a line that is still being written is read next time.
+# Args:
+#     logFiles (list): The debug logs, as dicts with 'logFile' and 'sourceLogFile'.
+#     previousFiles (dict): The 'files' entry of the previous parse state, empty for a full parse.
+# Returns:
+#     dict: Per placed log, 'start', 'end', 'last_timestamp' (the timestamp governing
+#           'start') and the entry to record as 'files' in the next state.
+def planLogScan(logFiles, previousFiles):
+    ranges = {}
+    for logFile in logFiles:
+        path = logFile['logFile']
+        previous = previousFiles.get(path) or {}
+        start = previous.get('end', 0)
+        last_timestamp = previous.get('last_timestamp')
+        with scanLog.mapLogFile(path) as data:
+            end = scanLog.completeLinesEnd(data)
+            next_timestamp = scanLog.precedingTimestamp(data, end, start, last_timestamp)
+        ranges[path] = {
+            'start': start,
+            'end': end,
+            'last_timestamp': last_timestamp,
+            'record': {'source': fileFingerprint(logFile['sourceLogFile']), 'end': end, 'last_timestamp': next_timestamp},
+        }
+    return ranges
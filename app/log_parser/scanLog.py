@@ -0,0 +1,135 @@
+import os
+import re
+import mmap
+import datetime
+import contextlib
+
+NEWLINE = b"\n"
+TIMESTAMP_START = re.compile(rb"\s*\d{4}-\d\d-\d\d")
+
+# Maps a log file read-only so it can be searched at the bytes level without
+# decoding or loading it. Falls back to reading the file when mmap is not
+# available (empty files, some network filesystems).
+# Args:
+#     path (str): The log file.
+# Yields:
+#     mmap.mmap or bytes: The file contents.
+@contextlib.contextmanager
+def mapLogFile(path):
+    with open(path, 'rb') as fp:
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            yield fp.read()
+            return
+        try:
+            yield data
+        finally:
+            data.close()
+
+# Prepares a list of byte strings for iterMatchingLines. Literal needles are
+# searched with bytes.find, which is much faster than a regex alternation.
+def compileNeedles(needles):
+    return tuple(needles)
+
+def decodeLine(data, line_start, line_end):
+    return data[line_start:line_end].decode('utf-8', errors='ignore').replace("\r\n", "\n")
+
+def lineBounds(data, position):
+    line_start = data.rfind(NEWLINE, 0, position) + 1
+    line_end = data.find(NEWLINE, position)
+    line_end = len(data) if line_end == -1 else line_end + 1
+    return line_start, line_end
+
+# Returns the first offset at or after position where any needle occurs.
+# next_hits remembers each needle's next occurrence (None if not searched yet,
+# -1 once exhausted) so every needle is only searched again after it was passed.
+def findAny(data, needles, next_hits, position):
+    hit = -1
+    for index, needle in enumerate(needles):
+        if next_hits[index] is None or 0 <= next_hits[index] < position:
+            next_hits[index] = data.find(needle, position)
+        if next_hits[index] != -1 and (hit == -1 or next_hits[index] < hit):
+            hit = next_hits[index]
+    return hit
+
+# Finds every line that contains a match, without decoding any line.
+# Args:
+#     data (mmap.mmap or bytes): The file contents.
+#     pattern (tuple or re.Pattern): Literal needles from compileNeedles, or a compiled bytes regex.
+#     start (int): Byte offset to start searching from, at a line boundary.
+#     end (int): Byte offset to stop at, at a line boundary. Defaults to the end of the data.
+# Yields:
+#     tuple: (line_start, line_end) byte offsets, line_end including the newline.
+def iterMatchingLines(data, pattern, start=0, end=None):
+    position = start
+    size = len(data) if end is None else min(end, len(data))
+    next_hits = [None] * len(pattern) if isinstance(pattern, tuple) else None
+    while position < size:
+        if next_hits is not None:
+            hit = findAny(data, pattern, next_hits, position)
+        else:
+            match = pattern.search(data, position)
+            hit = match.start() if match else -1
+        if hit == -1 or hit >= size:
+            return
+        line_start, line_end = lineBounds(data, hit)
+        yield line_start, line_end
+        position = line_end
+
+def previousLine(data, line_start):
+    if line_start <= 0:
+        return ""
+    previous_start = data.rfind(NEWLINE, 0, line_start - 1) + 1
+    return decodeLine(data, previous_start, line_start)
+
+def isTimeStampBytes(data, line_start, line_end):
+    if not TIMESTAMP_START.match(data, line_start, line_end):
+        return False
+    try:
+        datetime.datetime.fromisoformat(decodeLine(data, line_start, line_end).strip())
+        return True
+    except ValueError:
+        return False
+
+# Walks backwards from a line to the closest preceding line that is only a timestamp.
+# Args:
+#     data (mmap.mmap or bytes): The file contents.
+#     line_start (int): Byte offset of the line to start from (not included).
+#     lower_bound (int): Byte offset the walk stops at, e.g. where a resumed scan started.
+#     default (str): Returned when no timestamp is found above lower_bound.
+# Returns:
+#     str: The timestamp line, or default if there is none.
+def precedingTimestamp(data, line_start, lower_bound=0, default=None):
+    line_end = line_start
+    while line_end > lower_bound:
+        previous_start = max(data.rfind(NEWLINE, 0, line_end - 1) + 1, lower_bound)
+        if isTimeStampBytes(data, previous_start, line_end):
+            return decodeLine(data, previous_start, line_end)
+        line_end = previous_start
+    return default
+
+# Returns the offset just past the last complete line, so a file that is still
+# being written is never read up to a half-written line.
+def completeLinesEnd(data, end=None):
+    end = len(data) if end is None else end
+    return data.rfind(NEWLINE, 0, end) + 1
+
+# Decodes a line and the lines after it.
+# Args:
+#     data (mmap.mmap or bytes): The file contents.
+#     line_start (int): Byte offset of the first line.
+#     count (int): Maximum number of lines to return.
+#     end (int): Byte offset not to read past. Defaults to the end of the data.
+# Returns:
+#     list: The decoded lines, shorter than count at the end of the file.
+def followingLines(data, line_start, count, end=None):
+    lines = []
+    position = line_start
+    size = len(data) if end is None else min(end, len(data))
+    while position < size and len(lines) < count:
+        line_end = data.find(NEWLINE, position)
+        line_end = size if line_end == -1 else line_end + 1
+        lines.append(decodeLine(data, position, line_end))
+        position = line_end
+    return lines
@@ -0,0 +1,172 @@
+import os
+import gzip
+import zlib
+import instrumentation
+
+MARKER_HEAD_BYTES_ENV = "FINISHEDLOG_MARKER_HEAD_BYTES"
+MARKER_TAIL_BYTES_ENV = "FINISHEDLOG_MARKER_TAIL_BYTES"
+DEFAULT_MARKER_WINDOW_BYTES = 64 * 1024
+GZIP_MEMBER_MAGIC = b"\x1f\x8b\x08"
+# Compressed bytes at the end of a gzipped trace searched for the start of its last member.
+GZIP_TAIL_SEARCH_BYTES = 1024 * 1024
+CHUNK_BYTES = 1024 * 1024
+
+markerWindows = {
+    'head': int(os.environ.get(MARKER_HEAD_BYTES_ENV) or DEFAULT_MARKER_WINDOW_BYTES),
+    'tail': int(os.environ.get(MARKER_TAIL_BYTES_ENV) or DEFAULT_MARKER_WINDOW_BYTES),
+}
+
+# Marker lines by (path, mtime, size, marker), so a trace referenced again is not read again.
+markerCache = {}
+
+# Sets how many bytes at the head and at the tail of a trace probeMarker reads.
+def setMarkerWindows(headBytes, tailBytes):
+    if headBytes < 0 or tailBytes < 0:
+        raise ValueError("Marker windows can not be negative, got {} and {}".format(headBytes, tailBytes))
+    markerWindows['head'] = headBytes
+    markerWindows['tail'] = tailBytes
+    markerCache.clear()
+
+# Decodes the lines of data, which holds whole lines, that contain the marker.
+def markerLines(data, marker):
+    markerText = marker.decode()
+    lines = []
+    position = data.find(marker)
+    while position != -1:
+        lineStart = data.rfind(b"\n", 0, position) + 1
+        lineEnd = data.find(b"\n", position)
+        lineEnd = len(data) if lineEnd == -1 else lineEnd + 1
+        lines.extend(line for line in data[lineStart:lineEnd].decode('utf-8', errors='ignore').splitlines() if markerText in line)
+        position = data.find(marker, lineEnd)
+    return lines
+
+# The whole lines at the end of data that hold its last window bytes.
+def lastWindow(data, window):
+    return data[data.rfind(b"\n", 0, max(0, len(data) - window)) + 1:]
+
+# Drops the lines at the front of a growing buffer that lastWindow would not keep. The
+# buffer is only trimmed once it is well past the window, so it is not copied on every chunk.
+def trimToWindow(data, window):
+    if len(data) <= 2 * window + CHUNK_BYTES:
+        return data
+    return lastWindow(data, window)
+
+# Returns the offset of the line an offset of a plain file is in, reading backwards.
+def lineStartBefore(f, position, lowerBound):
+    while position > lowerBound:
+        chunkStart = max(lowerBound, position - CHUNK_BYTES)
+        f.seek(chunkStart)
+        chunk = f.read(position - chunkStart)
+        instrumentation.count('bytes_read', len(chunk))
+        newline = chunk.rfind(b"\n")
+        if newline != -1:
+            return chunkStart + newline + 1
+        position = chunkStart
+    return lowerBound
+
+def readPlainMarkerLines(path, marker, size):
+    instrumentation.count('files_opened')
+    with open(path, 'rb') as f:
+        head = f.read(markerWindows['head'])
+        if len(head) == markerWindows['head']:
+            head += f.readline()
+        tailStart = max(len(head), size - markerWindows['tail'])
+        if tailStart > len(head):
+            tailStart = lineStartBefore(f, tailStart, len(head))
+        f.seek(tailStart)
+        tail = f.read()
+    instrumentation.count('bytes_read', len(head) + len(tail))
+    return markerLines(head, marker) + markerLines(tail, marker)
+
+# Inflates one gzip member, keeping only the last window bytes of it.
+# Returns:
+#     tuple: The kept bytes and the inflated size, or None if data is not exactly one member.
+def inflateMemberTail(data, window):
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    tail = b""
+    inflated = 0
+    pending = data
+    try:
+        while pending and not inflater.eof:
+            chunk = inflater.decompress(pending, CHUNK_BYTES)
+            inflated += len(chunk)
+            tail = trimToWindow(tail + chunk, window)
+            pending = inflater.unconsumed_tail
+        chunk = inflater.flush()
+    except zlib.error:
+        return None
+    if not inflater.eof or inflater.unused_data:
+        return None
+    inflated += len(chunk)
+    instrumentation.countInflated(inflated)
+    return tail + chunk, inflated
+
+# The tail of a gzipped trace, inflated from its last members alone. Traces that are appended
+# to while compressed get a member per append, so the tail is in the small last members.
+# Members are inflated from the last one backwards until they hold the whole window.
+# Returns:
+#     tuple: The tail, and its offset in the inflated trace when the members inflated start
+#            the trace (None otherwise), or None when the members holding the window do not
+#            all start in the searched bytes.
+def gzipMemberTail(path, size, window):
+    searchStart = max(0, size - GZIP_TAIL_SEARCH_BYTES)
+    with open(path, 'rb') as f:
+        f.seek(searchStart)
+        data = f.read()
+    instrumentation.count('bytes_read', len(data))
+    tail = b""
+    inflated = 0
+    end = len(data)
+    position = data.rfind(GZIP_MEMBER_MAGIC)
+    while position != -1:
+        member = inflateMemberTail(data[position:end], window)
+        if member is not None:
+            memberTail, memberInflated = member
+            tail = memberTail + tail
+            inflated += memberInflated
+            end = position
+            # Whole once it starts the trace, or has a line starting before the window
+            if searchStart + position == 0 or inflated > len(tail) or tail.rfind(b"\n", 0, max(0, len(tail) - window)) != -1:
+                tail = lastWindow(tail, window)
+                return tail, (inflated - len(tail) if searchStart + position == 0 else None)
+        position = data.rfind(GZIP_MEMBER_MAGIC, 0, position)
+    return None
+
+def readGzipMarkerLines(path, marker, size):
+    instrumentation.count('files_opened')
+    with gzip.open(path, 'rb') as f:
+        head = f.read(markerWindows['head'])
+        if len(head) < markerWindows['head']:
+            return markerLines(head, marker)
+        head += f.readline()
+        memberTail = gzipMemberTail(path, size, markerWindows['tail'])
+        if memberTail is not None:
+            tail, tailStart = memberTail
+            if tailStart is not None and tailStart < len(head):
+                tail = tail[len(head) - tailStart:]
+        else:
+            # A single member too large to find its start: stream it past the head
+            tail = b""
+            for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+                tail = trimToWindow(tail + chunk, markerWindows['tail'])
+            instrumentation.countInflated(f.tell())
+            tail = lastWindow(tail, markerWindows['tail'])
+    instrumentation.count('bytes_read', len(head))
+    return markerLines(head, marker) + markerLines(tail, marker)
+
+# Finds the lines of a trace that hold a marker, such as where the trace continues. Markers
+# sit near the head or the tail of a trace, so only a window at each end is read: by seeking
+# in plain files, and from the last gzip member in compressed ones, streaming the file only
+# when its last member can not be found. Each window is widened to whole lines.
+# Args:
+#     path (str): The trace, plain or gzipped.
+#     marker (str): The text to look for.
+# Returns:
+#     list: The lines holding the marker, in file order.
+def probeMarker(path, marker):
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size, marker)
+    if key not in markerCache:
+        readMarkerLines = readGzipMarkerLines if path.endswith('.gz') else readPlainMarkerLines
+        markerCache[key] = readMarkerLines(path, marker.encode(), stat.st_size)
+    return markerCache[key]
@@ -0,0 +1,65 @@
+import os
+import contextlib
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+LRG_NAME_STRING = "snr"
+# Probes are a stat or two each; on network filesystems their latency, not CPU, is the cost.
+DISCOVERY_WORKERS = 16
+
+# Whether a directory holds an LRG's logs.
+def isLrgPath(full_path):
+    return os.path.isdir(os.path.join(full_path, 'diag', 'rdbms'))
+
+def isLrgDir(start_dir, dir_name):
+    return LRG_NAME_STRING in dir_name and isLrgPath(os.path.join(start_dir, dir_name))
+
+# Yields the directories under start_dir that may be LRGs, in directory order, as the
+# directory is read. os.scandir reports the entry types along with the names, so no entry
+# is stat'ed.
+# Yields:
+#     os.DirEntry: Every directory whose name contains LRG_NAME_STRING.
+def iterLrgCandidates(start_dir):
+    with os.scandir(start_dir) as it:
+        for entry in it:
+            if LRG_NAME_STRING in entry.name and entry.is_dir():
+                yield entry
+
+def probeLrg(entry, check_watson_dif):
+    return {
+        'name': entry.name,
+        'path': entry.path,
+        'is_lrg': isLrgPath(entry.path),
+        'has_watson_dif': check_watson_dif and os.path.exists(os.path.join(entry.path, 'watson.dif')),
+    }
+
+# Probes the candidates on a thread pool as they are listed and yields them in order as
+# soon as each one's probe is done, so the caller can start parsing the first LRGs while
+# the directory is still being read. At most two probes per worker are queued ahead of the
+# caller. Closing the generator, or dropping it, cancels the queued probes and shuts the
+# pool down.
+# Args:
+#     candidates (iterable): Entries from iterLrgCandidates.
+#     check_watson_dif (bool): Also check for a watson.dif file.
+#     workers (int): Probes run at once.
+# Yields:
+#     dict: 'name', 'path', 'is_lrg' (it has a diag/rdbms directory) and 'has_watson_dif'.
+def probeLrgs(candidates, check_watson_dif=False, workers=DISCOVERY_WORKERS):
+    pending = collections.deque()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for entry in candidates:
+            pending.append(pool.submit(probeLrg, entry, check_watson_dif))
+            while pending and (len(pending) >= 2 * workers or pending[0].done()):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# Yields the LRG directories under start_dir, see probeLrgs.
+def discoverLrgs(start_dir, check_watson_dif=False, workers=DISCOVERY_WORKERS):
+    with contextlib.closing(iterLrgCandidates(start_dir)) as candidates:
+        yield from probeLrgs(candidates, check_watson_dif, workers)
@@ -0,0 +1,141 @@
+import os
+import time
+import hashlib
+import logging
+import lrg_discovery
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+# Full rescans still happen with inotify, to catch anything the watches missed
+# (directories created before their watch was added, filesystems without events).
+INOTIFY_RESCAN_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+def scanFiles(directory, entries):
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+
+def subDirs(directory):
+    try:
+        with os.scandir(directory) as it:
+            return [entry.path for entry in it if entry.is_dir()]
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+# Lists the directories whose files feed an LRG report: the LRG root (gdsctl, watson.dif),
+# the debug log folders of every database and the GSM log folders.
+def lrgLogDirs(full_path):
+    dirs = [full_path]
+    for db_dir in subDirs(os.path.join(full_path, 'diag', 'rdbms')):
+        dirs.extend(os.path.join(aime_dir, 'log') for aime_dir in subDirs(db_dir))
+    for gsm_host_dir in subDirs(os.path.join(full_path, 'diag', 'gsm')):
+        dirs.extend(os.path.join(gsm_dir, 'log') for gsm_dir in subDirs(gsm_host_dir))
+    return dirs
+
+# Stats the files an LRG report is built from, without reading any of them.
+# Args:
+#     full_path (str): The LRG directory.
+# Returns:
+#     tuple: The newest modification time, and (path, size, mtime) of every file.
+def lrgSignature(full_path):
+    entries = []
+    for directory in lrgLogDirs(full_path):
+        scanFiles(directory, entries)
+    entries.sort()
+    newest = max((entry[2] for entry in entries), default=0)
+    return newest, tuple(entries)
+
+# A short, storable form of an lrgSignature.
+def lrgFingerprint(signature):
+    return hashlib.sha1(repr(signature[1]).encode()).hexdigest()
+
+# Creates the state used to detect new and changed LRGs under a directory.
+# Args:
+#     start_dir (str): The directory the LRGs are in.
+#     interval (float): Seconds between two full rescans when polling.
+#     use_inotify (bool): Use inotify when inotify_simple is installed.
+# Returns:
+#     dict: The watcher state for pollChanges.
+def createWatcher(start_dir, interval=5.0, use_inotify=True):
+    watcher = {'start_dir': start_dir, 'interval': interval, 'signatures': {}, 'notifier': None, 'watches': {}, 'watched_dirs': set(), 'last_scan': float('-inf')}
+    if use_inotify and inotify_simple is not None:
+        try:
+            watcher['notifier'] = inotify_simple.INotify()
+            watcher['watches'][watcher['notifier'].add_watch(start_dir, inotifyFlags())] = None
+            logger.info("Watching %s with inotify", start_dir)
+        except OSError as e:
+            logger.warning("inotify is not available (%s), polling %s instead", e, start_dir)
+            watcher['notifier'] = None
+    else:
+        logger.info("Polling %s for changes", start_dir)
+    return watcher
+
+def inotifyFlags():
+    flags = inotify_simple.flags
+    return flags.CREATE | flags.MODIFY | flags.MOVED_TO | flags.CLOSE_WRITE | flags.DELETE
+
+def addWatches(watcher, dir_name):
+    for directory in lrgLogDirs(os.path.join(watcher['start_dir'], dir_name)):
+        if directory in watcher['watched_dirs']:
+            continue
+        try:
+            watcher['watches'][watcher['notifier'].add_watch(directory, inotifyFlags())] = dir_name
+            watcher['watched_dirs'].add(directory)
+        except OSError as e:
+            logger.debug("Could not watch %s: %s", directory, e)
+
+def fullRescan(watcher):
+    watcher['last_scan'] = time.monotonic()
+    names = set(watcher['signatures']) | {entry.name for entry in lrg_discovery.iterLrgCandidates(watcher['start_dir'])}
+    return rescan(watcher, sorted(names))
+
+def rescan(watcher, names):
+    changed = []
+    for dir_name in names:
+        if not lrg_discovery.isLrgDir(watcher['start_dir'], dir_name):
+            watcher['signatures'].pop(dir_name, None)
+            continue
+        signature = lrgSignature(os.path.join(watcher['start_dir'], dir_name))
+        if watcher['signatures'].get(dir_name) != signature:
+            watcher['signatures'][dir_name] = signature
+            changed.append(dir_name)
+        if watcher['notifier'] is not None:
+            addWatches(watcher, dir_name)
+    return changed
+
+# Waits up to timeout seconds and returns the LRGs that are new or whose logs changed.
+# With inotify only the LRGs that had events are stat'ed again; without it every
+# LRG's signature is compared, which costs a few directory listings per LRG.
+# Args:
+#     watcher (dict): State from createWatcher.
+#     timeout (float): Seconds to wait for changes.
+# Returns:
+#     list: (newest modification time, LRG directory name) of the changed LRGs.
+def pollChanges(watcher, timeout):
+    notifier = watcher['notifier']
+    if notifier is None:
+        wait = watcher['interval'] - (time.monotonic() - watcher['last_scan'])
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+            if time.monotonic() - watcher['last_scan'] < watcher['interval']:
+                return []
+        changed = fullRescan(watcher)
+    elif time.monotonic() - watcher['last_scan'] >= INOTIFY_RESCAN_SECONDS:
+        changed = fullRescan(watcher)
+    else:
+        names = set()
+        for event in notifier.read(timeout=int(timeout * 1000)):
+            dir_name = watcher['watches'].get(event.wd)
+            names.add(dir_name if dir_name is not None else event.name)
+        changed = rescan(watcher, sorted(name for name in names if name))
+    return [(watcher['signatures'][name][0], name) for name in changed]
@@ -1,39 +1,62 @@
 import os
 import sys
+import logging
 import log_parser
 import html_parser
 import file_parser
-import gzip
-import shutil
+import instrumentation
+import log_config
+import report_db
+import memory_budget
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 # ./scratch/reports C:\\Users\\danii\\OneDrive\\Documents\\mytar2\\lrgdbcongsmshsnr17
 
+logger = logging.getLogger(__name__)
 
 
 
 
-# Parses the log files in a given directory and generates an HTML report.
+
+# Parses the gdsctl logs of an LRG, all at once. LRGs deployed the same way have the same
+# gdsctl logs, so topologies are kept in the report cache database by the logs' fingerprint
+# and only parsed for logs not seen before.
 # Args:
-#     rmdbsDirectory (str): The name of the directory containing the log files.
-#     directoryName (str): The directory to port report to.
-def find_and_analyze_added_errors(original_errors, new_errors):
-    added_indices = []
-    original_idx = 0
-    new_idx = 0
-
-    while new_idx < len(new_errors):
-        is_match = (original_idx < len(original_errors) and
-                    new_errors[new_idx] == original_errors[original_idx])
-        
-        if is_match:
-            original_idx += 1
-            new_idx += 1
-        else:
-            added_indices.append(new_idx)
-            new_idx += 1
-    
-    return added_indices
-def parseLog(logDirectory, directoryName, clean_run_mode=False):
+#     logDirectory (str): The directory reports are written to.
+#     directoryName (str): The LRG directory.
+#     fileNames (list): The gdsctl logs, as log_parser.findGdsctlLogs lists them.
+# Returns:
+#     list: The topology of each log, in the order of fileNames.
+def parse_gdsctl_logs(logDirectory, directoryName, fileNames):
+    paths = [os.path.join(directoryName, fileName) for fileName in fileNames]
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        try:
+            fingerprints = list(pool.map(log_parser.gdsctlFingerprint, paths))
+            with report_db.open_report_db(os.path.dirname(logDirectory)) as db:
+                topologies = [report_db.load_gdsctl_topology(db, fingerprint) for fingerprint in fingerprints]
+                missing = [i for i, topology in enumerate(topologies) if topology is None]
+                logger.debug("Reusing the topology of %d of %d gdsctl log(s)", len(paths) - len(missing), len(paths))
+                for i, topology in zip(missing, pool.map(log_parser.parseGdsctlTopology, [paths[i] for i in missing])):
+                    topologies[i] = topology
+                    report_db.save_gdsctl_topology(db, fingerprints[i], topology)
+        except (FileNotFoundError, OSError, EOFError) as e:
+            raise FileNotFoundError(f"Error: Could not read the gdsctl logs of '{directoryName}': {e}")
+    return topologies
+
+# Parses the log files of an LRG and generates its HTML report.
+# Args:
+#     logDirectory (str): The directory reports are written to.
+#     directoryName (str): The LRG directory.
+#     clean_run_mode (bool): Only parse, skipping the clean run diff and the HTML report.
+#     incremental (bool): Resume from the parse state left by the previous incremental
+#                         run, so only bytes appended to the logs since then are parsed.
+#                         Falls back to a full parse when the topology changed or a log
+#                         was rotated or truncated.
+#     render (bool): Write the static HTML pages. Without them the report is served by
+#                    report_server from the saved parse result.
+#     detailRules (list): Rules for the flags of the batch report's details, see
+#                         log_parser.loadDetailRules. Defaults to DEFAULT_DETAIL_RULES.
+def parseLog(logDirectory, directoryName, clean_run_mode=False, incremental=False, render=True, detailRules=None):
     fileName = ""
     logContents = {}
     rmdbs = []
@@ -50,98 +73,84 @@ def parseLog(logDirectory, directoryName, clean_run_mode=False):
         dir_base_name = os.path.basename(os.path.normpath(directoryName))
     
     report_dir = os.path.join(logDirectory, dir_base_name)
+    instrumentation.reset(dir_base_name, report_dir)
 
-    fileName = "sdbdeploy_gdsctl.lst"
-    gdsctl_path = os.path.join(directoryName, fileName)
-
-    if not os.path.exists(gdsctl_path) and not os.path.exists(gdsctl_path + ".gz"):
-        print(f"'{fileName}' not found. Scanning directory for 'gdsctl.lst' files...")
-        found_gdsctl_file = None
-        for f in os.listdir(directoryName):
-            if "gdsctl.lst" in f:
-                found_gdsctl_file = f
-                break
-        
-        if found_gdsctl_file:
-            fileName = found_gdsctl_file
-            print(f"Found gdsctl log file: {fileName}")
-        else:
-            raise FileNotFoundError(f"Error: No gdsctl log file found in '{directoryName}'.")
-    else:
-        print("Found gdsctl log file!")
+    gdsctlFiles = log_parser.findGdsctlLogs(directoryName)
+    if not gdsctlFiles:
+        raise FileNotFoundError(f"Error: No gdsctl log file found in '{directoryName}'.")
+    logger.info("Found gdsctl log file(s): %s", ", ".join(gdsctlFiles))
 
-    try:
-        filepath = os.path.join(directoryName, fileName)
-        if filepath.endswith('.gz'):
-            unzipped_path = filepath[:-3]
-            if not os.path.exists(unzipped_path):
-                with gzip.open(filepath, 'rb') as f_in:
-                    with open(unzipped_path, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-            print(f"Unzipped {filepath} to {unzipped_path}")
-            filepath = unzipped_path
-        
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
-            logFileLines = file.readlines()
-
-    except (FileNotFoundError, OSError) as e:
-        raise FileNotFoundError(f"Error: Could not open or read file '{fileName}': {e}")
-
-    if not logFileLines:
-        raise ValueError("Error: No lines in the log file  file '{}'!".format(fileName))
-    
-    extractionDirectory = directoryName
+    with instrumentation.stage("gdsctl_parse"):
+        topologies = parse_gdsctl_logs(logDirectory, directoryName, gdsctlFiles)
 
-    for i in range(len(logFileLines)):
-        if log_parser.ADDSHARD_PREFIX in logFileLines[i]:
-            targetLines = log_parser.fetchAddShardInfo(logFileLines, i)
-            if len(targetLines) < 2:
-                raise ValueError("Error from add shard command on line {}, failed to fetch db + shardgroup info lines!".format(i + 1))
-            shardGroup, rmdb = log_parser.parseAddShard(targetLines)
-            if shardGroup == "NULL":
-                raise ValueError("Error from add shard command on line {}, failed to parse db + shardgroup info lines!".format(i + 1))
+    extractionDirectory = directoryName
 
-            if shardGroup not in shardGroups:
-                shardGroups.append(shardGroup)
-            dbIds[rmdb] = dbCounter
-            rmdbs.append({'dbName': rmdb, 'dbID': dbCounter, 'shardGroup': shardGroup, 'logFolderNames' : file_parser.findMainDirs(os.path.join(extractionDirectory, 'diag', 'rdbms', rmdb))})
-            dbCounter += 10
+    for command in log_parser.mergeGdsctlTopologies(topologies):
+        shardGroup, rmdb = command['shardGroup'], command['dbName']
+        if shardGroup not in shardGroups:
+            shardGroups.append(shardGroup)
+        dbIds[rmdb] = dbCounter
+        rmdbs.append({'dbName': rmdb, 'dbID': dbCounter, 'shardGroup': shardGroup, 'logFolderNames' : file_parser.findMainDirs(os.path.join(extractionDirectory, 'diag', 'rdbms', rmdb))})
+        dbCounter += 10
 
-    print("SHARD GROUPS: ", shardGroups)
-    print("RMDBS", rmdbs)
+    logger.debug("SHARD GROUPS: %s", shardGroups)
+    logger.debug("RMDBS %s", rmdbs)
 
     for rmdb in rmdbs:
         rmdbName = rmdb['dbName']
         targetLog = os.path.join(extractionDirectory, 'diag', 'rdbms', rmdbName)
         try:
-            unzipped_log_files = file_parser.findLogFilesInDir(targetLog, report_dir)
-            for log_file in unzipped_log_files:
-                logFiles.append({'dbName': rmdbName, 'logFile': log_file, 'originalLogFile': targetLog})
+            for source_log_file, log_file in file_parser.findLogFileSources(targetLog, report_dir):
+                logFiles.append({'dbName': rmdbName, 'logFile': log_file, 'sourceLogFile': source_log_file, 'originalLogFile': targetLog})
         except Exception as e:
             raise FileNotFoundError("Error: Failed to find log file for {}, {}".format(rmdbName, type(e).__name__))
 
+    previousState = log_parser.loadParseState(report_dir) if incremental else None
+    topology = [[rmdb['dbName'], rmdb['dbID'], rmdb['shardGroup']] for rmdb in rmdbs]
+    if previousState and previousState.get('topology') != topology:
+        logger.info("Shard topology of %s changed since the last parse, parsing from the start", dir_base_name)
+        previousState = None
+    if previousState:
+        rotated = log_parser.findRotatedLogs(logFiles, previousState['files'])
+        if rotated:
+            logger.info("%d debug log(s) of %s were rotated or truncated, parsing from the start", len(rotated), dir_base_name)
+            for logFile in rotated:
+                if os.path.lexists(logFile['logFile']):
+                    os.remove(logFile['logFile'])
+            previousState = None
+    if previousState:
+        ruidLists = previousState['ruids']
+        logger.info("Resuming the parse of %s", dir_base_name)
+
     for logFile in logFiles:
         try:
-            with open(logFile['logFile'], 'r', encoding='utf-8', errors='ignore') as file:
-                logLines = file.readlines()
-            if logFile['dbName'] not in ruidLists:
-                ruidLists[logFile['dbName']] = list() #set
-            for i in range(len(logLines)):
-                ruID = log_parser.parseRUIDLine(logLines[i])
-                if ruID > 0:
+            with instrumentation.stage("artifact_copy"):
+                file_parser.placeLogFile(logFile['sourceLogFile'], logFile['logFile'])
+        except Exception as e:
+            raise FileNotFoundError("Error: Failed to find log file for {}, {}".format(logFile['dbName'], type(e).__name__))
+
+    scanRanges = log_parser.planLogScan(logFiles, previousState['files'] if previousState else {}) if incremental else None
+
+    for logFile in logFiles:
+        try:
+            with instrumentation.stage("ruid_discovery"):
+                if logFile['dbName'] not in ruidLists:
+                    ruidLists[logFile['dbName']] = list() #set
+                start, end, _ = log_parser.scanBounds(scanRanges, logFile['logFile'])
+                for ruID in log_parser.parseRUIDFile(logFile['logFile'], start, end):
                     if ruID not in ruidLists[logFile['dbName']]:
                         ruidLists[logFile['dbName']].append(ruID)
         except Exception as e:
             raise ValueError("Error: Failed to parse log file for {}, {}".format(logFile['dbName'], type(e).__name__))
 
-        print("RUIDS for {}".format(logFile['dbName']), ruidLists[logFile['dbName']])
+        logger.debug("RUIDS for %s %s", logFile['dbName'], ruidLists[logFile['dbName']])
 
     for ruids in ruidLists.values():
         for ruid in ruids:
             if ruid not in allRUIDs:
                 allRUIDs.append(ruid)
 
-    print("Parsing History")
+    logger.info("Parsing History")
 
     toUnzip = report_dir
     if "C:" not in report_dir:
@@ -149,26 +158,34 @@ def parseLog(logDirectory, directoryName, clean_run_mode=False):
 
     logContents['rmdbs'] = rmdbs
     logContents['shardGroups'] = shardGroups
-    logContents['history'], _ = log_parser.parseHistory(allRUIDs, rmdbs, logFiles, dbIds, report_dir)
+    resume = None
+    if incremental:
+        resume = {'ranges': scanRanges}
+        if previousState:
+            resume.update(history=previousState['history'], open_terms=previousState['open_terms'], orphans=previousState['orphans'], pending=previousState.get('pending', []))
+    logContents['history'], _ = log_parser.parseHistory(allRUIDs, rmdbs, logFiles, dbIds, report_dir, resume)
     new_errors = []
 
     if clean_run_mode != True:
-        cache_path = os.path.join(os.path.dirname(logDirectory), 'clean_run_errors_cache.json')
+        for shardgroup_data in logContents['history'].values():
+            for term_data in shardgroup_data.values():
+                for term in term_data:
+                    for error in term.get('errors', []):
+                        error['isNew'] = False
+
         dir_base_name = os.path.basename(directoryName)
         clean_run_errors_dict = {}
         for ruid, shardgroup_data in logContents['history'].items():
             clean_run_errors_dict[ruid] = {}
             for shardgroup, term_data in shardgroup_data.items():
-                clean_run_errors_dict[ruid][shardgroup] = {}
-                for i in range(len(term_data)):
-                    clean_run_errors_dict[ruid][shardgroup][i + 1] = []
+                # Keyed by term number, which only starts at 1 when the logs go back to the first term
+                clean_run_errors_dict[ruid][shardgroup] = {term.get('term', None): [] for term in term_data}
 
-        if os.path.exists(cache_path):
-            print(f"Reading clean run error cache from {cache_path}")
+        with report_db.open_report_db(os.path.dirname(logDirectory)) as db:
+            cached_errors = report_db.load_clean_run_errors(db, dir_base_name)
+        if cached_errors:
+            logger.info("Read %d clean run errors of %s", len(cached_errors), dir_base_name)
             try:
-                import json
-                with open(cache_path, 'r') as f:
-                    cached_errors = json.load(f)
                 for error in cached_errors:
                     ruid = error['ruid']
                     shardgroup = error['shard_group']
@@ -178,7 +195,7 @@ def parseLog(logDirectory, directoryName, clean_run_mode=False):
                         continue
                     clean_run_errors_dict[ruid][shardgroup][term].append(error)
             except Exception as e:
-                print(f"Failed to load cache from {cache_path}: {e}")
+                logger.warning("Failed to load clean run errors of %s: %s", dir_base_name, e)
 
         for ruid, shardgroup_data in logContents['history'].items():
             for shardgroup, term_data in shardgroup_data.items():
@@ -186,7 +203,6 @@ def parseLog(logDirectory, directoryName, clean_run_mode=False):
                     currentTerm = term_data[i].get('term', None)
                     clean_run_error_list = clean_run_errors_dict[ruid][shardgroup][currentTerm]
                     filtered_errors = [error for error in clean_run_error_list]
-                    # breakpoint()
                     if filtered_errors:
                         cached_errors = filtered_errors
                         current_errors = term_data[i].get('errors', [])
@@ -210,28 +226,51 @@ def parseLog(logDirectory, directoryName, clean_run_mode=False):
 
     logContents['allRUIDS'] = allRUIDs
     logContents['logDirectory'] = directoryName
-    logContents['trace_errors'], logContents['watson_errors'] = log_parser.parseWatsonLog(directoryName, toUnzip)
-    logContents['gsm_errors'] = log_parser.parse_gsm_logs(report_dir, directoryName)
+    with instrumentation.stage("watson"):
+        logContents['trace_errors'], logContents['watson_errors'] = log_parser.parseWatsonLog(directoryName, toUnzip)
+    gsmResume = (previousState.get('gsm', {}) if previousState else {}) if incremental else None
+    with instrumentation.stage("gsm"):
+        logContents['gsm_errors'] = log_parser.parse_gsm_logs(report_dir, directoryName, gsmResume)
+
+    if incremental:
+        log_parser.saveParseState(report_dir, {
+            'topology': topology,
+            'ruids': ruidLists,
+            'files': {path: scanRange['record'] for path, scanRange in scanRanges.items()},
+            'history': logContents['history'],
+            'open_terms': resume['open_terms'],
+            'orphans': resume['orphans'],
+            'pending': resume['pending'],
+            'gsm': gsmResume,
+        })
 
     # Calculate Clean Run Diff
-    all_current_errors = logContents.get('trace_errors', []) + logContents.get('watson_errors', []) + logContents.get('gsm_errors', [])
-    
-    def is_error_in_list(error, error_list):
-        # Simplified comparison based on a few key fields
-        for e in error_list:
-            if error.get('code') == e.get('code') and error.get('original') == e.get('original'):
-                return True
-        return False
-
     clean_run_diff = new_errors
     logContents['clean_run_diff'] = clean_run_diff
+    logContents['error_rollups'] = log_parser.buildErrorRollups(logContents['history'])
+    logContents['leadership_stats'] = log_parser.buildLeadershipStats(logContents['history'])
+    # Rendering holds a page's tree on top of the history, so the events go to disk first
+    # when the budget is exceeded and are read back one term at a time.
+    if memory_budget.overBudget():
+        log_parser.spillHistory(logContents['history'])
 
     # Identify term histories with new errors
 
-    print("Creating Log Folder")
+    logger.info("Creating Log Folder")
+
+    if clean_run_mode != True and render:
+        with instrumentation.stage("render"):
+            html_parser.createLogFolder(logContents, report_dir)
+
+    if clean_run_mode != True:
+        with instrumentation.stage("detail_rules"):
+            detailMatches = log_parser.matchDetailRules(logContents, detailRules)
+        logContents['detail_matches'] = detailMatches
 
+    logContents['timings'] = instrumentation.snapshot()
+    instrumentation.writeStats(os.path.join(report_dir, instrumentation.TIMINGS_FILE_NAME), logContents['timings'])
     if clean_run_mode != True:
-        html_parser.createLogFolder(logContents, report_dir)
+        log_parser.saveParseResult(report_dir, logContents)
 
     return logContents
 
@@ -239,16 +278,21 @@ def parseLog(logDirectory, directoryName, clean_run_mode=False):
 
 if __name__ == "__main__":
     try:
-        if len(sys.argv) < 2:
-            raise ValueError("Usage: python main.py <report_directory> <target_directory(Optional)>")
+        argv, debug = log_config.popDebugFlag(sys.argv)
+        log_config.configureLogging(debug)
+        incremental = "--incremental" in argv
+        render = "--no-render" not in argv
+        argv = [arg for arg in argv if arg not in ("--incremental", "--no-render")]
+        if len(argv) < 2:
+            raise ValueError("Usage: python main.py <report_directory> <target_directory(Optional)> [--incremental] [--no-render] [--debug]")
         else:
-            directoryName = sys.argv[1]
+            directoryName = argv[1]
             rmdbsDirectory = None
-            if len(sys.argv) > 2:
-                rmdbsDirectory = sys.argv[2]
+            if len(argv) > 2:
+                rmdbsDirectory = argv[2]
             else:
                 rmdbsDirectory = '.'
-            parseLog(directoryName, rmdbsDirectory)
+            parseLog(directoryName, rmdbsDirectory, incremental=incremental, render=render)
     except KeyboardInterrupt:
         print("\nScript interrupted by user. Exiting...")
         sys.exit(0)
\ No newline at end of file
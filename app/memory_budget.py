@@ -0,0 +1,160 @@
+import os
+import re
+import io
+import array
+import pickle
+import weakref
+import tempfile
+import threading
+import collections.abc
+import instrumentation
+
+MEMORY_BUDGET_ENV = "FINISHEDLOG_MEMORY_BUDGET"
+SPILL_DIR_ENV = "FINISHEDLOG_SPILL_DIR"
+SIZE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$', re.IGNORECASE)
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+# Parses a size such as "512M", "2G" or "1.5GiB" into bytes.
+# Returns:
+#     int: The size, or None for an empty size, which means no budget.
+def parseByteSize(size):
+    if not size:
+        return None
+    match = SIZE_PATTERN.match(str(size))
+    if not match:
+        raise ValueError("Invalid size '{}', expected a number of bytes with an optional K, M, G or T suffix".format(size))
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+budget_settings = {
+    'bytes': parseByteSize(os.environ.get(MEMORY_BUDGET_ENV)),
+    # Where spill files are created, the system's temporary directory when None
+    'spill_dir': os.environ.get(SPILL_DIR_ENV) or None,
+}
+
+# The spill file SpilledLists are appended to, by process. Only the lists hold it, so it is
+# closed, and being a temporary file removed, once the last list spilled to it is released.
+spill_state = {'pid': None, 'file': None, 'lock': threading.Lock()}
+
+# Sets how much memory a run may hold, None for no limit.
+def setMemoryBudget(budgetBytes):
+    if budgetBytes is not None and budgetBytes <= 0:
+        raise ValueError("The memory budget must be positive, got {}".format(budgetBytes))
+    budget_settings['bytes'] = budgetBytes
+
+def setSpillDir(spillDir):
+    budget_settings['spill_dir'] = spillDir or None
+
+def getMemoryBudget():
+    return budget_settings['bytes']
+
+# The resident size of this process, read from /proc where there is one and approximated
+# by the peak resident size elsewhere.
+def residentBytes():
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return instrumentation.peakRssBytes()
+
+# Whether this process holds more than the memory budget.
+def overBudget():
+    budget = budget_settings['bytes']
+    if budget is None:
+        return False
+    resident = residentBytes()
+    return resident is not None and resident > budget
+
+# Returns the spill file of this process, creating one when there is none. A worker
+# forked from a process that spilled gets a file of its own.
+def spillFile():
+    spill = spill_state['file']() if spill_state['file'] is not None and spill_state['pid'] == os.getpid() else None
+    if spill is None:
+        if budget_settings['spill_dir']:
+            os.makedirs(budget_settings['spill_dir'], exist_ok=True)
+        spill = tempfile.TemporaryFile(prefix="finishedlog_spill_", dir=budget_settings['spill_dir'])
+        spill_state['pid'] = os.getpid()
+        spill_state['file'] = weakref.ref(spill)
+    return spill
+
+# Reads size bytes at an offset of a spill file, without moving the file position where the
+# platform allows it.
+def readSpill(file, offset, size):
+    if size <= 0:
+        return b""
+    if hasattr(os, 'pread'):
+        return os.pread(file.fileno(), size, offset)
+    with spill_state['lock']:
+        file.seek(offset)
+        return file.read(size)
+
+# A read-only file view of the bytes offset..offset + size of a spill file, so pickles can
+# be streamed from one list's part of the file without reading the rest of it.
+class SpillView(io.RawIOBase):
+    def __init__(self, file, offset, size):
+        self.file = file
+        self.position = offset
+        self.end = offset + size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = readSpill(self.file, self.position, min(len(buffer), self.end - self.position))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+# A list written to a spill file on disk instead of kept in memory, for structures that are
+# no longer changed, such as the events of finished terms. The items are pickled one after
+# the other, with the offset of each kept, so iterating streams the list's part of the file
+# and unpickles one item at a time, and indexing reads and unpickles only the item asked for.
+# Spilled lists are read-only, so a list may only be spilled once nothing is added to it any
+# more; pickling one, e.g. to send it to another process, gives a plain list.
+class SpilledList(collections.abc.Sequence):
+    def __init__(self, items):
+        # Where each item starts, relative to the list's offset, and where the last one ends
+        self.itemOffsets = array.array('q', [0])
+        with spill_state['lock']:
+            self.file = spillFile()
+            self.file.seek(0, os.SEEK_END)
+            self.offset = self.file.tell()
+            for item in items:
+                data = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+                self.file.write(data)
+                self.itemOffsets.append(self.itemOffsets[-1] + len(data))
+            self.file.flush()
+        self.count = len(self.itemOffsets) - 1
+        self.size = self.itemOffsets[-1]
+        instrumentation.count('bytes_spilled', self.size)
+
+    def __iter__(self):
+        stream = io.BufferedReader(SpillView(self.file, self.offset, self.size))
+        for _ in range(self.count):
+            yield pickle.load(stream)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("SpilledList index out of range")
+        start = self.itemOffsets[index]
+        return pickle.loads(readSpill(self.file, self.offset + start, self.itemOffsets[index + 1] - start))
+
+    # Defined to fail with a clear error instead of an AttributeError, for code that still
+    # adds to a list it expects to be a plain one.
+    def append(self, item):
+        raise TypeError("A SpilledList is read-only, items can only be added before the list is spilled")
+
+    def extend(self, items):
+        self.append(None)
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+    def __repr__(self):
+        return "SpilledList({} items, {} bytes)".format(self.count, self.size)
@@ -0,0 +1,189 @@
+import os
+import json
+import sqlite3
+import logging
+import contextlib
+
+REPORT_DB_FILE_NAME = "report_cache.db"
+LRG_CACHE_FILE_NAME = "cache.json"
+CLEAN_RUN_CACHE_FILE_NAME = "clean_run_errors_cache.json"
+CACHE_DIR_ENV = "FINISHEDLOG_CACHE_DIR"
+# Seconds a writer waits for another run's transaction before giving up.
+BUSY_TIMEOUT_SECONDS = 30
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS lrgs (lrg TEXT PRIMARY KEY, date TEXT NOT NULL, last_reset TEXT, last_accessed TEXT, fingerprint TEXT)",
+    "CREATE TABLE IF NOT EXISTS clean_run_errors (id INTEGER PRIMARY KEY, lrg TEXT NOT NULL, ruid INTEGER, shard_group TEXT, term INTEGER, error TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS clean_run_errors_term ON clean_run_errors (lrg, ruid, shard_group, term)",
+    "CREATE TABLE IF NOT EXISTS gdsctl_topologies (fingerprint TEXT PRIMARY KEY, topology TEXT NOT NULL)",
+    # Append-only samples of every parse for trend_analytics
+    "CREATE TABLE IF NOT EXISTS trend_runs (id INTEGER PRIMARY KEY, lrg TEXT NOT NULL, run_date TEXT NOT NULL, term_count INTEGER, ruid_count INTEGER, span_seconds REAL, error_count INTEGER, new_error_count INTEGER)",
+    "CREATE INDEX IF NOT EXISTS trend_runs_date ON trend_runs (run_date, lrg)",
+    "CREATE TABLE IF NOT EXISTS trend_terms (run_id INTEGER NOT NULL, shard_group TEXT, ruid INTEGER, term INTEGER, recovery_time REAL, error_count INTEGER)",
+    "CREATE INDEX IF NOT EXISTS trend_terms_run ON trend_terms (run_id)",
+    "CREATE TABLE IF NOT EXISTS trend_error_codes (run_id INTEGER NOT NULL, code TEXT, occurrences INTEGER)",
+    "CREATE INDEX IF NOT EXISTS trend_error_codes_run ON trend_error_codes (run_id)",
+    "CREATE TABLE IF NOT EXISTS trend_gsm_errors (run_id INTEGER NOT NULL, request_type TEXT, occurrences INTEGER)",
+    "CREATE INDEX IF NOT EXISTS trend_gsm_errors_run ON trend_gsm_errors (run_id)",
+)
+# Raised whenever SCHEMA gains a table, so databases created before get it too.
+SCHEMA_VERSION = "3"
+
+logger = logging.getLogger(__name__)
+
+report_db_settings = {
+    # Directory of the database, instead of the one holding the report directories
+    'dir': os.environ.get(CACHE_DIR_ENV) or None,
+}
+
+# The clean run errors of every LRG, kept in memory between the stages of a pipeline run
+# by keep_clean_run_errors. None when they are read from the database.
+clean_run_baseline = {'errors': None}
+
+# Keeps the report cache database in cache_dir, whatever report directory it is opened for.
+# None puts it back next to the report directories.
+def set_cache_dir(cache_dir):
+    report_db_settings['dir'] = cache_dir or None
+
+# Opens the report cache database kept next to the report directories: the LRGs seen by
+# batch_report, the errors of the clean runs, the parsed gdsctl topologies and the samples
+# trend_analytics computes its trends from. The database is in WAL mode, so runs can read
+# it while another run writes, and every LRG is written in its own transaction, so an
+# interrupted run keeps the LRGs it finished. cache.json and clean_run_errors_cache.json
+# from older versions are imported the first time it is opened.
+# Args:
+#     base_dir (str): The directory holding the report directories, unless set_cache_dir
+#                     moved the database elsewhere.
+# Returns:
+#     sqlite3.Connection: Closed when the with block ends.
+@contextlib.contextmanager
+def open_report_db(base_dir):
+    base_dir = report_db_settings['dir'] or base_dir
+    os.makedirs(base_dir or ".", exist_ok=True)
+    db = sqlite3.connect(os.path.join(base_dir, REPORT_DB_FILE_NAME), timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        if not is_initialized(db):
+            initialize_report_db(db, base_dir)
+        yield db
+    finally:
+        db.close()
+
+def read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Not importing unreadable cache %s: %s", path, e)
+        return None
+
+def is_initialized(db):
+    try:
+        row = db.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+    except sqlite3.OperationalError:
+        return False
+    return row is not None and row[0] == SCHEMA_VERSION
+
+# Creates the tables and imports the JSON caches, once. The check is repeated under the
+# write lock, in case another run got there first. The JSON files are left in place.
+def initialize_report_db(db, base_dir):
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        for statement in SCHEMA:
+            db.execute(statement)
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (SCHEMA_VERSION,))
+        if db.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+        lrg_cache = read_json(os.path.join(base_dir, LRG_CACHE_FILE_NAME)) or {}
+        for lrg, entry in lrg_cache.items():
+            write_lrg(db, lrg, entry)
+        cached_errors = read_json(os.path.join(base_dir, CLEAN_RUN_CACHE_FILE_NAME)) or []
+        db.executemany("INSERT INTO clean_run_errors (lrg, ruid, shard_group, term, error) VALUES (?, ?, ?, ?, ?)", [error_row(error['lrg'], error) for error in cached_errors])
+        db.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', '1')")
+    if lrg_cache or cached_errors:
+        logger.info("Imported %d LRGs and %d clean run errors into %s", len(lrg_cache), len(cached_errors), REPORT_DB_FILE_NAME)
+
+# Loads every LRG's entry, in the form batch_report keeps its cache in.
+# Returns:
+#     dict: LRG directory name -> {'date', 'lastReset', 'last_accessed'}.
+def load_lrgs(db):
+    cache = {}
+    for lrg, date, last_reset, last_accessed in db.execute("SELECT lrg, date, last_reset, last_accessed FROM lrgs ORDER BY rowid"):
+        entry = {'date': date}
+        if last_reset is not None:
+            entry['lastReset'] = last_reset
+        if last_accessed is not None:
+            entry['last_accessed'] = last_accessed
+        cache[lrg] = entry
+    return cache
+
+def write_lrg(db, lrg, entry):
+    db.execute(
+        "INSERT INTO lrgs (lrg, date, last_reset, last_accessed) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (lrg) DO UPDATE SET date = excluded.date, last_reset = excluded.last_reset, last_accessed = excluded.last_accessed",
+        (lrg, entry['date'], entry.get('lastReset'), entry.get('last_accessed')))
+
+# Saves one LRG's cache entry in its own transaction.
+def save_lrg(db, lrg, entry):
+    with db:
+        write_lrg(db, lrg, entry)
+
+def load_fingerprint(db, lrg):
+    row = db.execute("SELECT fingerprint FROM lrgs WHERE lrg = ?", (lrg,)).fetchone()
+    return row[0] if row else None
+
+def save_fingerprint(db, lrg, fingerprint):
+    with db:
+        db.execute("UPDATE lrgs SET fingerprint = ? WHERE lrg = ?", (fingerprint, lrg))
+
+def error_row(lrg, error):
+    return (lrg, error.get('ruid'), error.get('shard_group'), error.get('term'), json.dumps(error, default=str))
+
+# Replaces the clean run errors of one LRG in a single transaction.
+# Args:
+#     lrg (str): The LRG directory name.
+#     errors (list): The LRG's errors, each with its 'ruid', 'shard_group' and 'term'.
+def save_clean_run_errors(db, lrg, errors):
+    with db:
+        db.execute("DELETE FROM clean_run_errors WHERE lrg = ?", (lrg,))
+        db.executemany("INSERT INTO clean_run_errors (lrg, ruid, shard_group, term, error) VALUES (?, ?, ?, ?, ?)", [error_row(lrg, error) for error in errors])
+    if clean_run_baseline['errors'] is not None:
+        clean_run_baseline['errors'][lrg] = list(errors)
+
+# Loads the clean run errors of one LRG, in the order they were saved.
+def load_clean_run_errors(db, lrg):
+    if clean_run_baseline['errors'] is not None:
+        return clean_run_baseline['errors'].get(lrg, [])
+    return [json.loads(error) for (error,) in db.execute("SELECT error FROM clean_run_errors WHERE lrg = ? ORDER BY id", (lrg,))]
+
+# Reads the clean run errors of every LRG in one query and keeps them in memory, so the
+# LRGs parsed next by this process compare against them without querying the database.
+# Returns:
+#     int: The number of errors kept.
+def keep_clean_run_errors(db):
+    errors = {}
+    for lrg, error in db.execute("SELECT lrg, error FROM clean_run_errors ORDER BY id"):
+        errors.setdefault(lrg, []).append(json.loads(error))
+    clean_run_baseline['errors'] = errors
+    return sum(len(lrg_errors) for lrg_errors in errors.values())
+
+def release_clean_run_errors():
+    clean_run_baseline['errors'] = None
+
+# Loads the topology parsed from a gdsctl log, see log_parser.parseGdsctlTopology.
+# Returns:
+#     list: The topology records, or None if no log with this fingerprint was parsed yet.
+def load_gdsctl_topology(db, fingerprint):
+    row = db.execute("SELECT topology FROM gdsctl_topologies WHERE fingerprint = ?", (fingerprint,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def save_gdsctl_topology(db, fingerprint, topology):
+    with db:
+        db.execute("INSERT OR REPLACE INTO gdsctl_topologies (fingerprint, topology) VALUES (?, ?)", (fingerprint, json.dumps(topology)))
+
+def count_clean_run_errors(db):
+    return db.execute("SELECT COUNT(*) FROM clean_run_errors").fetchone()[0]
@@ -0,0 +1,228 @@
+import os
+import re
+import sys
+import glob
+import html
+import logging
+import mimetypes
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, quote, unquote
+import html_parser
+import log_parser
+import log_config
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_CACHE_SIZE = 256
+CHUNK_LINES = 2000
+SERVER_OPTIONS = {'host': DEFAULT_HOST, 'port': DEFAULT_PORT, 'cache_size': DEFAULT_CACHE_SIZE}
+
+RU_PAGE_PATTERN = re.compile(r'^RULog(\d+)\.html$')
+SHARD_GROUP_PAGE_PATTERN = re.compile(r'^ShardGroupLog_(.+)_RUID_(\d+)\.html$')
+HISTORY_PAGE_PATTERN = re.compile(r'^history_(\d+)_.+\.html$')
+LINES_PREFIX = "lines/"
+
+logger = logging.getLogger(__name__)
+
+server_state = {
+    'report_root': None,
+    'cache_size': DEFAULT_CACHE_SIZE,
+    'pages': OrderedDict(),  # (lrg, page, query, result mtime) -> rendered page, least recently used first
+    'results': {},           # lrg -> (result mtime, log contents)
+    'lock': threading.Lock(),
+}
+
+# Links a file to a chunk of it around an error's line, or to its first chunk, instead of
+# a converted copy of the whole file. Unlike static_file_link it never places the file in
+# the report, so serving a page writes nothing.
+def chunk_file_link(file_path, scroll_index, report_dir):
+    if not file_path:
+        return ''
+    name = os.path.basename(file_path)
+    if name.endswith('.html'):
+        name = name[:-len('.html')]
+    line = scroll_index if scroll_index is not None else 1
+    return "./{}{}?line={}#line{}".format(LINES_PREFIX, quote(name), line, line)
+
+# Finds the raw file a chunk page is rendered from: a file placed in the report, a trace
+# or Watson file the index page links to, or a trace that was read straight from the LRG
+# directory.
+def find_raw_file(report_dir, log_contents, name):
+    placed_path = os.path.join(report_dir, name)
+    if os.path.isfile(placed_path):
+        return placed_path
+    for errors, keys in ((log_contents.get('trace_errors', []), ('file', 'log_file')), (log_contents.get('watson_errors', []), ('dif_file', 'log_file'))):
+        for error in errors:
+            for key in keys:
+                if error.get(key) and os.path.basename(error[key]) == name and os.path.isfile(error[key]):
+                    return error[key]
+    pattern = os.path.join(glob.escape(log_contents.get('logDirectory', '')), 'diag', 'rdbms', '*', '*', 'trace', glob.escape(name))
+    matches = glob.glob(pattern)
+    return matches[0] if matches else None
+
+def load_result(lrg):
+    report_dir = os.path.join(server_state['report_root'], lrg)
+    result_path = os.path.join(report_dir, log_parser.PARSE_RESULT_FILE_NAME)
+    try:
+        mtime = os.stat(result_path).st_mtime_ns
+    except FileNotFoundError:
+        return None, None
+    with server_state['lock']:
+        cached = server_state['results'].get(lrg)
+    if cached and cached[0] == mtime:
+        return mtime, cached[1]
+    log_contents = log_parser.loadParseResult(report_dir)
+    with server_state['lock']:
+        server_state['results'][lrg] = (mtime, log_contents)
+    return mtime, log_contents
+
+# Whether a request path segment names an LRG report directory: a plain child of the
+# report root, never '.', '..' or a path.
+def is_lrg_name(root, name):
+    if name in ("", ".", "..") or name != os.path.basename(name):
+        return False
+    return os.path.isdir(os.path.join(root, name))
+
+# Renders one page of an LRG report from its saved parse result.
+# Returns:
+#     str: The page, or None if the name is not a rendered page.
+def render_page(lrg, page, query, log_contents):
+    report_dir = os.path.join(server_state['report_root'], lrg)
+    if page in ("", "index.html"):
+        return html_parser.render_index_page(log_contents, report_dir, chunk_file_link)
+
+    match = RU_PAGE_PATTERN.match(page)
+    if match and int(match.group(1)) in log_contents['history']:
+        return html_parser.render_ru_page(log_contents, int(match.group(1)))
+
+    match = SHARD_GROUP_PAGE_PATTERN.match(page)
+    if match:
+        shardGroup, ruid = match.group(1), int(match.group(2))
+        terms = log_contents['history'].get(ruid, {}).get(shardGroup)
+        if terms is not None:
+            history_names = html_parser.history_page_names(ruid, shardGroup, terms)
+            return html_parser.render_shard_group_page(log_contents, ruid, shardGroup, history_names)
+
+    match = HISTORY_PAGE_PATTERN.match(page)
+    if match:
+        ruid = int(match.group(1))
+        for shardGroup, terms in log_contents['history'].get(ruid, {}).items():
+            history_names = html_parser.history_page_names(ruid, shardGroup, terms)
+            if page in history_names:
+                return html_parser.render_history_page(terms[history_names.index(page)], report_dir, chunk_file_link)
+
+    if page.startswith(LINES_PREFIX):
+        name = os.path.basename(page[len(LINES_PREFIX):])
+        raw_path = find_raw_file(report_dir, log_contents, name)
+        if raw_path:
+            line = int(query.get('line', ['1'])[0])
+            first_line = max(1, line - CHUNK_LINES // 2)
+            return html_parser.render_file_chunk(raw_path, first_line, CHUNK_LINES, lambda start: "./{}?line={}".format(quote(name), start))
+    return None
+
+def cached_page(lrg, page, query):
+    mtime, log_contents = load_result(lrg)
+    if log_contents is None:
+        return None
+    key = (lrg, page, tuple(sorted((k, tuple(v)) for k, v in query.items())), mtime)
+    with server_state['lock']:
+        pages = server_state['pages']
+        if key in pages:
+            pages.move_to_end(key)
+            return pages[key]
+    rendered = render_page(lrg, page, query, log_contents)
+    if rendered is not None:
+        with server_state['lock']:
+            pages[key] = rendered
+            while len(pages) > server_state['cache_size']:
+                pages.popitem(last=False)
+    return rendered
+
+def render_lrg_list():
+    root = server_state['report_root']
+    lrgs = sorted(name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, log_parser.PARSE_RESULT_FILE_NAME)))
+    items = "".join('<li><a href="./{}/index.html">{}</a></li>\n'.format(quote(lrg), html.escape(lrg)) for lrg in lrgs)
+    if os.path.exists(os.path.join(root, "viewer.html")):
+        items = '<li><a href="./viewer.html">Batch viewer</a></li>\n' + items
+    return '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="UTF-8">\n<title>LRG reports</title>\n</head>\n<body>\n<h1>LRG reports</h1>\n<ul>\n{}</ul>\n</body>\n</html>'.format(items)
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = unquote(url.path).lstrip('/')
+        query = parse_qs(url.query)
+        try:
+            body, content_type = self.resolve(path, query)
+        except (OSError, ValueError) as e:
+            logger.error("Failed to serve %s: %s", self.path, e)
+            self.send_error(500)
+            return
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def resolve(self, path, query):
+        root = os.path.realpath(server_state['report_root'])
+        if path in ("", "index.html") and not os.path.exists(os.path.join(root, "index.html")):
+            return render_lrg_list().encode('utf-8'), "text/html; charset=utf-8"
+
+        lrg, _, page = path.partition('/')
+        if page == "style.css":
+            return html_parser.loadTemplate('style.css').encode('utf-8'), "text/css"
+        if is_lrg_name(root, lrg):
+            rendered = cached_page(lrg, page, query)
+            if rendered is not None:
+                return rendered.encode('utf-8'), "text/html; charset=utf-8"
+
+        # Everything else (batch index, placed traces, converted files) is served as is.
+        file_path = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, file_path]) != root or not os.path.isfile(file_path):
+            return None, None
+        with open(file_path, 'rb') as f:
+            return f.read(), mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+# Serves the LRG reports under a report directory, rendering RU, shard group, term
+# history and trace chunk pages from each LRG's saved parse result when they are
+# requested. Rendered pages are kept in an LRU cache, which is invalidated when
+# an LRG is parsed again. Runs until interrupted.
+# Args:
+#     report_root (str): The batch report directory, holding one folder per LRG.
+#     host (str): The address to listen on.
+#     port (int): The port to listen on.
+#     cache_size (int): How many rendered pages to keep.
+def serve(report_root, host=DEFAULT_HOST, port=DEFAULT_PORT, cache_size=DEFAULT_CACHE_SIZE):
+    server_state['report_root'] = report_root
+    server_state['cache_size'] = cache_size
+    httpd = ThreadingHTTPServer((host, port), ReportRequestHandler)
+    logger.info("Serving reports from %s on http://%s:%d/", report_root, host, httpd.server_address[1])
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping report server")
+    finally:
+        httpd.server_close()
+
+if __name__ == "__main__":
+    argv, debug = log_config.popDebugFlag(sys.argv)
+    log_config.configureLogging(debug)
+    options = dict(SERVER_OPTIONS)
+    positional = []
+    for arg in argv[1:]:
+        key = arg[2:].split("=", 1)[0].replace("-", "_") if arg.startswith("--") and "=" in arg else None
+        if key in options:
+            options[key] = type(options[key])(arg.split("=", 1)[1])
+        else:
+            positional.append(arg)
+    if len(positional) < 1:
+        raise ValueError("Usage: python report_server.py <report_directory> [--host=127.0.0.1] [--port=8000] [--cache-size=256] [--debug]")
+    serve(positional[0], options['host'], options['port'], options['cache_size'])
@@ -0,0 +1,183 @@
+import os
+import sys
+import gzip
+import json
+import random
+import datetime
+
+DEFAULT_SHAPE = {
+    'lrg_count': 4,            # LRG directories written under the root
+    'clean_lrgs': 2,           # how many of them have no watson.dif (clean runs)
+    'shard_dbs': 4,            # shard databases per LRG
+    'shard_groups': 2,         # shard groups the databases are spread over
+    'ruids': 6,                # replication units per LRG
+    'terms': 8,                # leadership terms per RUID per database
+    'error_density': 0.3,      # chance that a term logs an error with a trace
+    'noise_lines': 20,         # irrelevant debug log lines written per term
+    'trace_lines': 200,        # lines per trace file
+    'continued_traces': 0.2,   # share of traces that continue in a second file
+    'gzip_ratio': 0.5,         # share of debug logs and traces stored as .gz
+    'watson_entries': 10,      # extra .dif/.log incident pairs listed in watson.dif
+    'gsm_requests': 20,        # GSM catalog requests per LRG
+    'gsm_error_blocks': 5,     # how many of those requests end in an error
+    'seed': 1,
+}
+ERROR_CODES = (600, 7445, 12345, 29771, 60015)
+GSM_REQUEST_TYPES = ("add shard", "deploy", "move chunk", "add service")
+BASE_TIME = datetime.datetime(2025, 7, 4, 15, 0, 0, tzinfo=datetime.timezone.utc)
+
+def timestamp(seconds):
+    return (BASE_TIME + datetime.timedelta(seconds=seconds)).isoformat()
+
+def writeFile(path, text, compress=False):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if compress:
+        with gzip.open(path + ".gz", 'wt', encoding='utf-8') as f:
+            f.write(text)
+        return path + ".gz"
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+def gdsctlLog(shape):
+    lines = []
+    for db in range(shape['shard_dbs']):
+        lines.append("Command name: add shard \n")
+        lines.append("  shardgroup : sg{} \n".format(db % shape['shard_groups']))
+        lines.append("  deploy_as : primary \n")
+        lines.append("  cdb : cdb{} \n".format(db))
+        lines.append("Command name: config shard \n")
+        lines.append("  shard : cdb{}_pdb \n".format(db))
+    lines.append("Command name: deploy \n")
+    return "".join(lines)
+
+def traceBody(rnd, shape, start_seconds, header=""):
+    lines = [header] if header else []
+    for i in range(shape['trace_lines']):
+        if i % 10 == 0:
+            lines.append(timestamp(start_seconds + i // 10 - 2) + "\n")
+        lines.append("*** trace frame {} {:x}\n".format(i, rnd.getrandbits(32)))
+    return "".join(lines)
+
+def writeShardDb(rnd, shape, lrg_dir, db):
+    db_name = "cdb{}".format(db)
+    aime = "aime{}".format(db)
+    db_dir = os.path.join(lrg_dir, 'diag', 'rdbms', db_name, aime)
+    trace_dir = os.path.join(db_dir, 'trace')
+    traces = []
+    lines = []
+    seconds = db
+    for term in range(1, shape['terms'] + 1):
+        for ruid in range(1, shape['ruids'] + 1):
+            seconds += rnd.randint(5, 60)
+            lines.append(timestamp(seconds) + "\n")
+            lines.append("SNR role change RU_ID {} became LEADER Term {} \n".format(ruid, term))
+            seconds += rnd.randint(1, 5)
+            lines.append(timestamp(seconds) + "\n")
+            lines.append("RU_ID {} with event=RECOVER complete\n".format(ruid))
+            seconds += 1
+            lines.append(timestamp(seconds) + "\n")
+            lines.append("SNR role change RU_ID {} to CANDIDATE Reason=heartbeat_timeout \n".format(ruid))
+            lines.append("Heatbeat parameters: hb_interval=1000\n")
+            lines.append("  hb_timeout=5000 election_timeout=8000\n")
+            for noise in range(shape['noise_lines']):
+                if noise % 4 == 0:
+                    lines.append(timestamp(seconds) + "\n")
+                lines.append("kjsnr: apply lwm={} hwm={} batch={}\n".format(rnd.getrandbits(20), rnd.getrandbits(20), noise))
+            if rnd.random() < shape['error_density']:
+                seconds += 1
+                osp = 1000 + db * 1000 + term * 10 + ruid
+                code = rnd.choice(ERROR_CODES)
+                lines.append(timestamp(seconds) + "\n")
+                lines.append("RU_ID {} apply failed error={} ospid={} process_name=rsm \n".format(ruid, code, osp))
+                trace_name = "{}_rsm_{}.trc".format(aime, osp)
+                compress = rnd.random() < shape['gzip_ratio']
+                header = "Dump continued from file: /ade/{}/diag/rdbms/{}/{}/log/debug_{}.log\n".format(os.path.basename(lrg_dir), db_name, aime, aime)
+                if rnd.random() < shape['continued_traces']:
+                    continued_name = "{}_rsm_{}_2.trc".format(aime, osp)
+                    header += "*** TRACE CONTINUES IN FILE /ade/{} \n".format(continued_name)
+                    writeFile(os.path.join(trace_dir, continued_name), traceBody(rnd, shape, seconds), compress)
+                writeFile(os.path.join(trace_dir, trace_name), traceBody(rnd, shape, seconds, header), compress)
+                traces.append(os.path.join('diag', 'rdbms', db_name, aime, 'trace', trace_name))
+    log_path = os.path.join(db_dir, 'log', "debug_{}.log".format(aime))
+    writeFile(log_path, "".join(lines), rnd.random() < shape['gzip_ratio'])
+    return traces
+
+def writeWatsonDif(rnd, shape, lrg_dir, traces):
+    lines = ["Watson incident summary\n"]
+    for trace in traces:
+        lines.append("Incident trace: {}\n".format(trace))
+    for i in range(shape['watson_entries']):
+        incident = os.path.join('diag', 'incident', "incdir_{}".format(i))
+        writeFile(os.path.join(lrg_dir, incident + ".dif"), "diff {}\n".format(i))
+        writeFile(os.path.join(lrg_dir, incident + ".log"), "log {}\n".format(i))
+        lines.append("Incident diff: {}.dif\n".format(incident))
+        lines.append("Incident log: {}.log\n".format(incident))
+    writeFile(os.path.join(lrg_dir, 'watson.dif'), "".join(lines))
+
+def writeGsmLog(rnd, shape, lrg_dir):
+    error_ids = set(rnd.sample(range(shape['gsm_requests']), min(shape['gsm_error_blocks'], shape['gsm_requests'])))
+    lines = []
+    for request_id in range(shape['gsm_requests']):
+        stamp = timestamp(request_id * 3).replace("+00:00", "Z")
+        request_type = rnd.choice(GSM_REQUEST_TYPES)
+        lines.append('{} Catalog request:"{}" Id="{}" Payload:"shard{}" Target:"cdb{}"\n'.format(stamp, request_type, request_id, request_id, request_id % shape['shard_dbs']))
+        lines.append("  processing request {}\n".format(request_id))
+        if request_id in error_ids:
+            lines.append('{} Request Done Id={} Error message:"ORA-{:05d}: request {} failed"\n'.format(stamp, request_id, rnd.choice(ERROR_CODES), request_id))
+        else:
+            lines.append("{} Request Done Id={} Success\n".format(stamp, request_id))
+    writeFile(os.path.join(lrg_dir, 'diag', 'gsm', 'gsmhost', 'gsm1', 'log', 'gsm1.log'), "".join(lines))
+
+# Writes one synthetic LRG directory.
+# Args:
+#     root (str): Directory the LRG is created in.
+#     name (str): The LRG directory name. Must contain 'snr' to be picked up by the batch scanners.
+#     shape (dict): Overrides for DEFAULT_SHAPE.
+#     clean (bool): When True no watson.dif is written, so the LRG counts as a clean run.
+# Returns:
+#     str: The path of the LRG directory.
+def generateLrg(root, name, shape=None, clean=False):
+    shape = dict(DEFAULT_SHAPE, **(shape or {}))
+    rnd = random.Random("{}:{}".format(shape['seed'], name))
+    lrg_dir = os.path.join(root, name)
+    writeFile(os.path.join(lrg_dir, 'sdbdeploy_gdsctl.lst'), gdsctlLog(shape))
+    traces = []
+    for db in range(shape['shard_dbs']):
+        traces.extend(writeShardDb(rnd, shape, lrg_dir, db))
+    if not clean:
+        writeWatsonDif(rnd, shape, lrg_dir, traces)
+    writeGsmLog(rnd, shape, lrg_dir)
+    return lrg_dir
+
+# Writes a tree of synthetic LRGs, the first 'clean_lrgs' of them without watson.dif.
+# Args:
+#     root (str): Directory the LRGs are created in.
+#     shape (dict): Overrides for DEFAULT_SHAPE.
+# Returns:
+#     list: The paths of the LRG directories.
+def generateTree(root, shape=None):
+    shape = dict(DEFAULT_SHAPE, **(shape or {}))
+    lrg_dirs = []
+    for i in range(shape['lrg_count']):
+        name = "lrgsynthsnr{:03d}".format(i)
+        lrg_dirs.append(generateLrg(root, name, shape, clean=i < shape['clean_lrgs']))
+    return lrg_dirs
+
+def parseShapeArgs(args):
+    shape = {}
+    for arg in args:
+        if not arg.startswith("--") or "=" not in arg:
+            raise ValueError("Expected --key=value, got '{}'".format(arg))
+        key, value = arg[2:].split("=", 1)
+        key = key.replace("-", "_")
+        if key not in DEFAULT_SHAPE:
+            raise ValueError("Unknown shape option '{}', expected one of {}".format(key, ", ".join(DEFAULT_SHAPE)))
+        shape[key] = type(DEFAULT_SHAPE[key])(value)
+    return shape
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise ValueError("Usage: python synthetic_lrg.py <output_directory> [--key=value ...]\nShape keys: " + json.dumps(DEFAULT_SHAPE))
+    generated = generateTree(sys.argv[1], parseShapeArgs(sys.argv[2:]))
+    print("Generated {} LRGs under {}".format(len(generated), sys.argv[1]))
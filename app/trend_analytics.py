@@ -0,0 +1,176 @@
+import html
+import logging
+from datetime import datetime, timedelta
+
+# Percentiles of the recovery times reported per shard group.
+RECOVERY_PERCENTILES = (50, 90, 99)
+# An LRG's leadership churn regressed when its latest run changes leaders this many times
+# as often as its earlier runs did, and by at least CHURN_MIN_INCREASE terms per RUID and hour.
+CHURN_REGRESSION_RATIO = 1.5
+CHURN_MIN_INCREASE = 1.0
+# Shortest span of terms a churn rate is computed over, so a few terms in a minute do not
+# look like hundreds an hour.
+MIN_CHURN_SPAN_SECONDS = 600
+TOP_ERROR_CODES = 20
+
+logger = logging.getLogger(__name__)
+
+# Reduces a parse result to the samples the trends are computed from.
+# Returns:
+#     dict: The run's totals, and its 'terms', 'error_codes' and 'gsm_errors' samples.
+def run_samples(log_contents):
+    terms = []
+    error_codes = {}
+    timestamps = []
+    for ruid, shard_groups in log_contents.get('history', {}).items():
+        for shard_group, shard_group_terms in shard_groups.items():
+            for term in shard_group_terms:
+                errors = term.get('errors') or []
+                terms.append((shard_group, ruid, term.get('term'), term.get('recoveryTime'), len(errors)))
+                if term.get('timestamp'):
+                    timestamps.append(datetime.fromisoformat(term['timestamp']))
+                for error in errors:
+                    code = str(error.get('code'))
+                    error_codes[code] = error_codes.get(code, 0) + 1
+    gsm_errors = {}
+    for error in log_contents.get('gsm_errors') or []:
+        request_type = error.get('request_type') or "unknown"
+        gsm_errors[request_type] = gsm_errors.get(request_type, 0) + 1
+    span = (max(timestamps) - min(timestamps)).total_seconds() if timestamps else 0.0
+    return {
+        'term_count': len(terms),
+        'ruid_count': len(log_contents.get('history', {})),
+        'span_seconds': span,
+        'error_count': sum(error_codes.values()),
+        'new_error_count': len(log_contents.get('clean_run_diff', [])),
+        'terms': terms,
+        'error_codes': error_codes,
+        'gsm_errors': gsm_errors,
+    }
+
+# Appends a parsed LRG to the trend tables of the report cache database, in one transaction.
+# Runs are only ever added, so the trends of past days stay as they were.
+# Args:
+#     db (sqlite3.Connection): From report_db.open_report_db.
+#     lrg (str): The LRG directory name.
+#     run_date (datetime): When the LRG was parsed.
+#     log_contents (dict): The parse result, as parseLog returns it.
+def record_run(db, lrg, run_date, log_contents):
+    samples = run_samples(log_contents)
+    with db:
+        run_id = db.execute(
+            "INSERT INTO trend_runs (lrg, run_date, term_count, ruid_count, span_seconds, error_count, new_error_count) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (lrg, run_date.isoformat(), samples['term_count'], samples['ruid_count'], samples['span_seconds'], samples['error_count'], samples['new_error_count'])).lastrowid
+        db.executemany("INSERT INTO trend_terms (run_id, shard_group, ruid, term, recovery_time, error_count) VALUES (?, ?, ?, ?, ?, ?)",
+                       [(run_id,) + term for term in samples['terms']])
+        db.executemany("INSERT INTO trend_error_codes (run_id, code, occurrences) VALUES (?, ?, ?)",
+                       [(run_id, code, count) for code, count in samples['error_codes'].items()])
+        db.executemany("INSERT INTO trend_gsm_errors (run_id, request_type, occurrences) VALUES (?, ?, ?)",
+                       [(run_id, request_type, count) for request_type, count in samples['gsm_errors'].items()])
+
+# LRGs are parsed again on every batch, so the queries only count the latest run of each
+# LRG since the cutoff; otherwise an LRG would weigh as much as the times it was parsed.
+LATEST_RUNS = "SELECT MAX(id) FROM trend_runs WHERE run_date >= ? GROUP BY lrg"
+
+# How often each error code occurred since a date.
+# Returns:
+#     list: (code, occurrences, number of LRGs) tuples, the most frequent first.
+def error_code_frequency(db, since, limit=TOP_ERROR_CODES):
+    return db.execute(
+        f"SELECT code, SUM(occurrences), COUNT(*) FROM trend_error_codes WHERE run_id IN ({LATEST_RUNS}) "
+        "GROUP BY code ORDER BY SUM(occurrences) DESC, code LIMIT ?", (since.isoformat(), limit)).fetchall()
+
+def gsm_error_frequency(db, since, limit=TOP_ERROR_CODES):
+    return db.execute(
+        f"SELECT request_type, SUM(occurrences), COUNT(*) FROM trend_gsm_errors WHERE run_id IN ({LATEST_RUNS}) "
+        "GROUP BY request_type ORDER BY SUM(occurrences) DESC, request_type LIMIT ?", (since.isoformat(), limit)).fetchall()
+
+# Recovery time percentiles per shard group since a date. SQLite has no percentile
+# function, so each shard group's times are ranked with window functions and the
+# nearest-rank value of every percentile is picked out in the same query.
+# Returns:
+#     list: (shard group, number of terms, {percentile: seconds}, max seconds) tuples.
+def recovery_percentiles(db, since, percentiles=RECOVERY_PERCENTILES):
+    # Nearest rank of an integer percentile: ceil(terms * percent / 100), at least 1
+    percentile_columns = "".join(", MAX(CASE WHEN position = MAX(1, (terms * ? + 99) / 100) THEN recovery_time END)" for _ in percentiles)
+    rows = db.execute(
+        "WITH ranked AS (SELECT shard_group, recovery_time, "
+        "ROW_NUMBER() OVER (PARTITION BY shard_group ORDER BY recovery_time) AS position, "
+        "COUNT(*) OVER (PARTITION BY shard_group) AS terms "
+        f"FROM trend_terms WHERE recovery_time IS NOT NULL AND run_id IN ({LATEST_RUNS})) "
+        f"SELECT shard_group, MAX(terms){percentile_columns}, MAX(recovery_time) FROM ranked GROUP BY shard_group ORDER BY shard_group",
+        (since.isoformat(),) + tuple(percentiles)).fetchall()
+    return [(row[0], row[1], dict(zip(percentiles, row[2:-1])), row[-1]) for row in rows]
+
+# The churn of every run since a date with terms: its terms per RUID and hour of history,
+# counting at least MIN_CHURN_SPAN_SECONDS of history.
+CHURN_RATES = (
+    "SELECT lrg, id, CAST(term_count AS REAL) / MAX(ruid_count, 1) / (MAX(span_seconds, ?) / 3600.0) AS rate "
+    "FROM trend_runs WHERE run_date >= ? AND term_count > 0"
+)
+
+# Finds the LRGs whose latest run changed leaders much more often than their earlier runs
+# since a date, comparing the latest churn with the (lower) median churn of the earlier runs.
+# Returns:
+#     list: (lrg, earlier churn, latest churn) tuples, the largest regression first.
+def churn_regressions(db, since, ratio=CHURN_REGRESSION_RATIO, min_increase=CHURN_MIN_INCREASE):
+    return db.execute(
+        f"WITH rates AS ({CHURN_RATES}), "
+        "latest AS (SELECT lrg, MAX(id) AS id, COUNT(*) AS runs FROM rates GROUP BY lrg HAVING COUNT(*) >= 2), "
+        "earlier AS (SELECT rates.lrg, rates.rate, ROW_NUMBER() OVER (PARTITION BY rates.lrg ORDER BY rates.rate) AS position "
+        "FROM rates JOIN latest ON rates.lrg = latest.lrg AND rates.id < latest.id) "
+        "SELECT latest.lrg, earlier.rate, rates.rate FROM latest "
+        "JOIN rates ON rates.id = latest.id "
+        "JOIN earlier ON earlier.lrg = latest.lrg AND earlier.position = (latest.runs - 2) / 2 + 1 "
+        "WHERE rates.rate >= earlier.rate * ? AND rates.rate - earlier.rate >= ? "
+        "ORDER BY rates.rate - earlier.rate DESC, latest.lrg",
+        (MIN_CHURN_SPAN_SECONDS, since.isoformat(), ratio, min_increase)).fetchall()
+
+def trend_table(title, headers, rows):
+    header_cells = "".join(f"<th>{header}</th>" for header in headers)
+    body = "".join("<tr>" + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + "</tr>" for row in rows)
+    return f"""
+    <h2>{title}</h2>
+    <div class="table-container">
+        <table>
+            <thead>
+                <tr>{header_cells}</tr>
+            </thead>
+            <tbody>
+                {body}
+            </tbody>
+        </table>
+    </div>
+"""
+
+# Renders the trends section of the batch page.
+# Args:
+#     db (sqlite3.Connection): From report_db.open_report_db.
+#     now (datetime): When the batch ran.
+#     days (int): How many days back the trends cover.
+# Returns:
+#     str: The section, or an empty string when no runs were recorded in that time.
+def render_trends(db, now, days):
+    since = now - timedelta(days=days)
+    run_count, lrg_count = db.execute("SELECT COUNT(*), COUNT(DISTINCT lrg) FROM trend_runs WHERE run_date >= ?", (since.isoformat(),)).fetchone()
+    if not run_count:
+        return ""
+    section = f"""
+    <h1>Trends of the Last {days} Days</h1>
+    <div class="info-box">
+        <p><strong>LRGs:</strong> {lrg_count}</p>
+        <p><strong>Parses:</strong> {run_count}</p>
+    </div>
+"""
+    section += trend_table("Error Code Frequency", ["Error Code", "Occurrences", "LRGs"], error_code_frequency(db, since))
+    recovery_rows = [[shard_group, count] + [f"{values[percent]:.2f}" for percent in RECOVERY_PERCENTILES] + [f"{longest:.2f}"]
+                     for shard_group, count, values, longest in recovery_percentiles(db, since)]
+    section += trend_table("Recovery Time per Shard Group (seconds)", ["Shard Group", "Terms"] + [f"p{percent}" for percent in RECOVERY_PERCENTILES] + ["Max"], recovery_rows)
+    gsm_rows = gsm_error_frequency(db, since)
+    if gsm_rows:
+        section += trend_table("GSM Error Types", ["Request Type", "Occurrences", "LRGs"], gsm_rows)
+    regressions = churn_regressions(db, since)
+    if regressions:
+        section += trend_table("Leadership Churn Regressions (terms per RUID and hour)", ["LRG", "Earlier", "Latest"],
+                               [(lrg, f"{earlier:.2f}", f"{latest:.2f}") for lrg, earlier, latest in regressions])
+    return section
@@ -0,0 +1,78 @@
+import os
+import sys
+import gzip
+import shutil
+import logging
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import main
+import log_parser
+import synthetic_lrg
+
+SHAPE = {'shard_dbs': 4, 'shard_groups': 2, 'ruids': 2, 'terms': 3, 'gzip_ratio': 0.0, 'watson_entries': 0, 'gsm_requests': 2, 'gsm_error_blocks': 0}
+
+def addShards(*shards):
+    return "".join("Command name: add shard \n  shardgroup : {} \n  deploy_as : primary \n  cdb : {} \n".format(shardGroup, dbName) for shardGroup, dbName in shards) + "Command name: deploy \n"
+
+# The synthetic LRG adds cdb0 to cdb3 to sg0 and sg1 in turn. Here its topology is split
+# across three logs that add (sg1, cdb1) twice, one of them next to a gzipped twin that
+# must be ignored, and one only gzipped.
+GDSCTL_LOGS = {
+    'sdbdeploy_gdsctl.lst': addShards(('sg0', 'cdb0'), ('sg1', 'cdb1')),
+    'extra_gdsctl.lst': addShards(('sg1', 'cdb3'), ('sg1', 'cdb1')),
+    'extra_gdsctl.lst.gz': addShards(('sg0', 'cdb2'), ('sg1', 'cdb1')),
+    'more_gdsctl.lst.gz': addShards(('sg1', 'cdb1'), ('sg0', 'cdb2')),
+}
+EXPECTED_RMDBS = [('sg0', 'cdb0', 1), ('sg1', 'cdb1', 11), ('sg1', 'cdb3', 21), ('sg0', 'cdb2', 31)]
+
+class GdsctlLogsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.source = synthetic_lrg.generateLrg(os.path.join(self.tmp.name, 'source'), 'lrgsnrgds', SHAPE, clean=True)
+
+    # Copies the LRG with its gdsctl logs written in the given order, so the directory
+    # lists them in a different order too.
+    def makeLrg(self, name, order):
+        lrg = os.path.join(self.tmp.name, name, 'lrgsnrgds')
+        shutil.copytree(self.source, lrg)
+        for fileName in order:
+            path = os.path.join(lrg, fileName)
+            opener = gzip.open if fileName.endswith('.gz') else open
+            with opener(path, 'wt') as f:
+                f.write(GDSCTL_LOGS[fileName])
+        return lrg
+
+    def rmdbs(self, lrg):
+        report_dir = os.path.join(os.path.dirname(lrg), 'reports')
+        logContents = main.parseLog(report_dir, lrg, render=False)
+        return [(rmdb['shardGroup'], rmdb['dbName'], rmdb['dbID']) for rmdb in logContents['rmdbs']]
+
+    def test_logs_are_found_in_a_stable_order(self):
+        for name, order in (('forward', sorted(GDSCTL_LOGS)), ('backward', sorted(GDSCTL_LOGS, reverse=True))):
+            with self.subTest(order=name):
+                lrg = self.makeLrg(name, order)
+                self.assertEqual(log_parser.findGdsctlLogs(lrg), ['sdbdeploy_gdsctl.lst', 'extra_gdsctl.lst', 'more_gdsctl.lst.gz'])
+
+    def test_overlapping_logs_merge_once(self):
+        lrg = self.makeLrg('merge', sorted(GDSCTL_LOGS))
+        topologies = [log_parser.parseGdsctlTopology(os.path.join(lrg, fileName)) for fileName in log_parser.findGdsctlLogs(lrg)]
+        merged = log_parser.mergeGdsctlTopologies(topologies)
+        self.assertEqual([(record['shardGroup'], record['dbName']) for record in merged], [(shardGroup, dbName) for shardGroup, dbName, _ in EXPECTED_RMDBS])
+
+    # The database IDs follow the merged order, whatever order the directory lists the
+    # logs in, and again when the topologies come from the report cache database.
+    def test_database_ids_are_deterministic(self):
+        forward = self.makeLrg('forward', sorted(GDSCTL_LOGS))
+        backward = self.makeLrg('backward', sorted(GDSCTL_LOGS, reverse=True))
+        self.assertEqual(self.rmdbs(forward), EXPECTED_RMDBS)
+        self.assertEqual(self.rmdbs(backward), EXPECTED_RMDBS)
+        self.assertEqual(self.rmdbs(forward), EXPECTED_RMDBS)
+
+if __name__ == "__main__":
+    unittest.main()
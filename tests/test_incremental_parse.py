@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import main
+import synthetic_lrg
+
+SHAPE = {'shard_dbs': 2, 'shard_groups': 2, 'ruids': 3, 'terms': 6, 'gzip_ratio': 0.0, 'watson_entries': 2, 'gsm_requests': 10, 'gsm_error_blocks': 3}
+COMPARED_KEYS = ('history', 'allRUIDS', 'gsm_errors', 'clean_run_diff')
+
+class IncrementalParseTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        source = synthetic_lrg.generateLrg(os.path.join(self.tmp.name, 'source'), 'lrgsnrinc', SHAPE, clean=True)
+        self.lrg = os.path.join(self.tmp.name, 'work', 'lrgsnrinc')
+        shutil.copytree(source, self.lrg)
+        self.logs = {}
+        for root, _, names in os.walk(self.lrg):
+            for name in names:
+                if name.endswith('.log') and name.startswith(('debug_', 'gsm')):
+                    with open(os.path.join(root, name), 'rb') as f:
+                        self.logs[os.path.join(root, name)] = f.read()
+        self.assertTrue(any(os.path.basename(path).startswith('debug_') for path in self.logs))
+
+    def parse(self, name, incremental):
+        report_dir = os.path.join(self.tmp.name, name, 'reports')
+        os.makedirs(report_dir, exist_ok=True)
+        logContents = main.parseLog(report_dir, self.lrg, incremental=incremental, render=False)
+        # Only the report directory differs between the two parses
+        text = json.dumps({key: logContents[key] for key in COMPARED_KEYS}, sort_keys=True, default=list)
+        return json.loads(text.replace(os.path.join(self.tmp.name, name), "<reports>"))
+
+    # Cuts every log at the same share of its bytes, usually in the middle of a line.
+    def writeLogs(self, share):
+        for path, content in self.logs.items():
+            with open(path, 'wb') as f:
+                f.write(content[:int(len(content) * share)])
+
+    def appendLogs(self, share):
+        for path, content in self.logs.items():
+            with open(path, 'ab') as f:
+                f.write(content[os.path.getsize(path):int(len(content) * share)])
+
+    def test_resumed_parse_matches_a_full_parse(self):
+        self.writeLogs(0.4)
+        self.parse('incremental', True)
+        self.appendLogs(0.7)
+        self.parse('incremental', True)
+        self.appendLogs(1.0)
+        self.assertEqual(self.parse('incremental', True), self.parse('full', False))
+
+    # A log replaced by a new file, here longer than the one parsed before, or cut shorter
+    # can not be resumed and is parsed from the start.
+    def test_rotated_or_truncated_log_is_parsed_again(self):
+        debugLog = next(path for path in sorted(self.logs) if os.path.basename(path).startswith('debug_'))
+        content = self.logs[debugLog]
+        cut = content.index(b"\n", int(len(content) * 0.4)) + 1
+        def rotate():
+            with open(debugLog + ".new", 'wb') as f:
+                f.write(content[cut:])
+            os.replace(debugLog + ".new", debugLog)
+        def truncate():
+            with open(debugLog, 'r+b') as f:
+                f.truncate(cut)
+        for change, parsedBefore in ((rotate, content[:cut]), (truncate, content)):
+            with self.subTest(change=change.__name__):
+                name = 'incremental_' + change.__name__
+                self.writeLogs(1.0)
+                with open(debugLog, 'wb') as f:
+                    f.write(parsedBefore)
+                self.parse(name, True)
+                change()
+                self.assertEqual(self.parse(name, True), self.parse('full_' + change.__name__, False))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import sys
+import pickle
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import memory_budget
+
+EVENTS = [{'type': "candidate", 'timestamp': "2025-07-04T15:00:{:02}+00:00".format(index), 'parameters': ["line {}\n".format(index)] * index} for index in range(12)]
+
+class SpilledListTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(memory_budget.setSpillDir, memory_budget.budget_settings['spill_dir'])
+        memory_budget.setSpillDir(self.tmp.name)
+        self.spilled = memory_budget.SpilledList(EVENTS)
+        # A second list in the same spill file, so reads must stay within their own part
+        self.other = memory_budget.SpilledList(["other"] * 3)
+
+    def test_iteration_round_trips(self):
+        self.assertEqual(list(self.spilled), EVENTS)
+        self.assertEqual(list(self.spilled), EVENTS)
+        self.assertEqual(list(self.other), ["other"] * 3)
+        self.assertEqual(list(memory_budget.SpilledList([])), [])
+
+    def test_indexing_round_trips(self):
+        self.assertEqual(len(self.spilled), len(EVENTS))
+        for index in range(-len(EVENTS), len(EVENTS)):
+            self.assertEqual(self.spilled[index], EVENTS[index])
+        for index in (len(EVENTS), -len(EVENTS) - 1):
+            with self.assertRaises(IndexError):
+                self.spilled[index]
+
+    def test_slicing_round_trips(self):
+        for sliced in (slice(None), slice(3, 7), slice(-4, None), slice(None, None, 3), slice(None, None, -2), slice(20, 30)):
+            self.assertEqual(self.spilled[sliced], EVENTS[sliced])
+
+    def test_pickles_as_a_list(self):
+        self.assertEqual(pickle.loads(pickle.dumps(self.spilled)), EVENTS)
+
+    def test_is_read_only(self):
+        for add in (lambda: self.spilled.append(EVENTS[0]), lambda: self.spilled.extend(EVENTS)):
+            with self.assertRaisesRegex(TypeError, "read-only"):
+                add()
+        self.assertEqual(list(self.spilled), EVENTS)
+
+if __name__ == "__main__":
+    unittest.main()
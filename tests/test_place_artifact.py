@@ -0,0 +1,159 @@
+import os
+import sys
+import gzip
+import errno
+import contextlib
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from file_parser import placeArtifact
+
+def failing(code):
+    def fail(*args, **kwargs):
+        raise OSError(code, os.strerror(code))
+    return fail
+
+class PlaceArtifactTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        settings = dict(placeArtifact.artifact_settings)
+        self.addCleanup(placeArtifact.artifact_settings.update, settings)
+        self.source = self.write('source.log', b"line 1\n")
+        self.dest = os.path.join(self.tmp.name, 'report', 'placed.log')
+        os.makedirs(os.path.dirname(self.dest))
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def sameFile(self, path, other):
+        return os.path.samefile(path, other) and not os.path.islink(path)
+
+    def leftovers(self):
+        return [name for name in os.listdir(os.path.dirname(self.dest)) if name.endswith('.tmp')]
+
+    def test_hardlink_falls_back_to_copy_across_devices(self):
+        placeArtifact.setArtifactMode("hardlink")
+        with mock.patch.object(placeArtifact.os, 'link', failing(errno.EXDEV)):
+            placeArtifact.placeFile(self.source, self.dest)
+        self.assertEqual(self.read(self.dest), b"line 1\n")
+        self.assertFalse(os.path.islink(self.dest))
+        self.assertFalse(os.path.samefile(self.source, self.dest))
+        self.assertEqual(self.leftovers(), [])
+
+    def test_existing_destination_is_kept(self):
+        placeArtifact.setArtifactMode("copy")
+        with open(self.dest, 'wb') as f:
+            f.write(b"placed before\n")
+        self.assertEqual(placeArtifact.placeFile(self.source, self.dest), self.dest)
+        self.assertEqual(self.read(self.dest), b"placed before\n")
+
+    def test_auto_falls_back_through_every_strategy(self):
+        placeArtifact.setArtifactMode("auto")
+        reflink = mock.patch.object(placeArtifact, 'reflinkFile', failing(errno.EOPNOTSUPP))
+        hardlink = mock.patch.object(placeArtifact.os, 'link', failing(errno.EXDEV))
+        symlink = mock.patch.object(placeArtifact.os, 'symlink', failing(errno.EPERM))
+        for failures, expected in (((reflink,), "hardlink"), ((reflink, hardlink), "symlink"), ((reflink, hardlink, symlink), "copy")):
+            with self.subTest(expected=expected), contextlib.ExitStack() as stack:
+                placeArtifact.removeIfPresent(self.dest)
+                for failure in failures:
+                    stack.enter_context(failure)
+                placeArtifact.placeFile(self.source, self.dest)
+                stack.close()
+                placed = "symlink" if os.path.islink(self.dest) else "hardlink" if self.sameFile(self.dest, self.source) else "copy"
+                self.assertEqual(placed, expected)
+                self.assertEqual(self.read(self.dest), b"line 1\n")
+                self.assertEqual(self.leftovers(), [])
+
+    def test_last_strategy_failure_is_raised(self):
+        placeArtifact.setArtifactMode("symlink")
+        with mock.patch.object(placeArtifact.os, 'symlink', failing(errno.EPERM)), \
+                mock.patch.object(placeArtifact, 'copyFile', failing(errno.ENOSPC)):
+            with self.assertRaises(OSError) as raised:
+                placeArtifact.placeFile(self.source, self.dest)
+        self.assertEqual(raised.exception.errno, errno.ENOSPC)
+        self.assertFalse(os.path.lexists(self.dest))
+        self.assertEqual(self.leftovers(), [])
+
+    def test_stale_temp_name_is_replaced(self):
+        placeArtifact.setArtifactMode("copy")
+        with open(placeArtifact.placementTempPath(self.dest), 'wb') as f:
+            f.write(b"interrupted\n")
+        placeArtifact.placeFile(self.source, self.dest)
+        self.assertEqual(self.read(self.dest), b"line 1\n")
+        self.assertEqual(self.leftovers(), [])
+
+    # Another placement links dest_path to the same file between the link to the temporary
+    # name and the rename, which then leaves both names in place.
+    def test_race_linking_the_same_file(self):
+        placeArtifact.setArtifactMode("hardlink")
+        linkFile = placeArtifact.linkFile
+        def racingLink(strategy, source_path, dest_path):
+            linkFile(strategy, source_path, dest_path)
+            os.link(source_path, self.dest)
+        with mock.patch.object(placeArtifact, 'linkFile', racingLink):
+            placeArtifact.placeFile(self.source, self.dest)
+        self.assertTrue(self.sameFile(self.dest, self.source))
+        self.assertEqual(self.leftovers(), [])
+
+    # Another placement wins the race with a file of its own; it is kept and no other
+    # strategy is tried.
+    def test_race_placing_a_different_file(self):
+        placeArtifact.setArtifactMode("hardlink")
+        calls = []
+        def racingLink(strategy, source_path, dest_path):
+            calls.append(strategy)
+            with open(self.dest, 'wb') as f:
+                f.write(b"placed by the other process\n")
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dest_path)
+        with mock.patch.object(placeArtifact, 'linkFile', racingLink):
+            self.assertEqual(placeArtifact.placeFile(self.source, self.dest), self.dest)
+        self.assertEqual(calls, ["hardlink"])
+        self.assertEqual(self.read(self.dest), b"placed by the other process\n")
+        self.assertEqual(self.leftovers(), [])
+
+    def test_gzip_files_share_one_store_object(self):
+        placeArtifact.setArtifactMode("hardlink")
+        gz_path = os.path.join(self.tmp.name, 'source.log.gz')
+        with gzip.open(gz_path, 'wb') as f:
+            f.write(b"inflated\n")
+        first = os.path.join(self.tmp.name, 'report', 'first.log')
+        second = os.path.join(self.tmp.name, 'other_report', 'second.log')
+        os.makedirs(os.path.dirname(second))
+        placeArtifact.placeGzipFile(gz_path, first)
+        placeArtifact.placeGzipFile(gz_path, second)
+
+        store_dir = os.path.join(self.tmp.name, placeArtifact.STORE_DIR_NAME)
+        objects = [os.path.join(root, name) for root, _, names in os.walk(store_dir) for name in names]
+        self.assertEqual(len(objects), 1)
+        self.assertEqual(self.read(first), b"inflated\n")
+        self.assertTrue(self.sameFile(first, objects[0]))
+        self.assertTrue(self.sameFile(second, objects[0]))
+
+    def test_refresh_replaces_a_grown_source(self):
+        placeArtifact.setArtifactMode("copy")
+        placeArtifact.placeFile(self.source, self.dest)
+        with open(self.source, 'ab') as f:
+            f.write(b"line 2\n")
+        placeArtifact.refreshFile(self.source, self.dest)
+        self.assertEqual(self.read(self.dest), b"line 1\nline 2\n")
+
+    def test_refresh_keeps_a_current_copy(self):
+        placeArtifact.setArtifactMode("copy")
+        placeArtifact.placeFile(self.source, self.dest)
+        inode = os.stat(self.dest).st_ino
+        placeArtifact.refreshFile(self.source, self.dest)
+        self.assertEqual(os.stat(self.dest).st_ino, inode)
+
+if __name__ == "__main__":
+    unittest.main()
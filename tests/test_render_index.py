@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import bs4
+import html_parser
+
+class RenderIndexPageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.report_dir = os.path.join(self.tmp.name, 'report')
+        os.makedirs(self.report_dir)
+        self.trace = os.path.join(self.tmp.name, 'db_ora_1.trc')
+        self.osp_trace = os.path.join(self.tmp.name, 'db_rsm_2.trc')
+        for path in (self.trace, self.osp_trace):
+            with open(path, 'w') as f:
+                f.write("trace\n")
+        self.results = {
+            'logDirectory': os.path.join(self.tmp.name, 'lrgsnr'),
+            'allRUIDS': [1],
+            'history': {1: {'sg0': []}},
+            'trace_errors': [{'file': self.trace}],
+            'clean_run_diff': [{'timestamp': "2025-01-01T00:00:00", 'code': 600, 'original': "error=600", 'ospFile': self.osp_trace, 'scrollIndex': 3, 'ruid': 1, 'shard_group': 'sg0', 'term': 1}],
+        }
+
+    def tables(self, page):
+        return bs4.BeautifulSoup(page, 'html.parser').find_all('table')
+
+    # The trace errors table must not hide the file_link used by the clean run diff table.
+    def test_trace_errors_and_clean_run_diff_links(self):
+        page = html_parser.render_index_page(self.results, self.report_dir)
+        hrefs = [[a.get('href') for a in table.find_all('a')] for table in self.tables(page)[1:]]
+        self.assertEqual(hrefs, [["./db_ora_1.trc"], ["./db_rsm_2.trc#line3"]])
+
+    def test_custom_file_link(self):
+        page = html_parser.render_index_page(self.results, self.report_dir, lambda path, line, report_dir: "./lines/{}?line={}".format(os.path.basename(path), line))
+        self.assertEqual([a.get('href') for a in self.tables(page)[-1].find_all('a')], ["./lines/db_rsm_2.trc?line=3"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+import unittest
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import report_db
+
+LRG_CACHE = {'lrgsnr001': {'date': "2025-07-01", 'lastReset': "2025-07-02", 'last_accessed': "2025-07-03"}}
+CLEAN_RUN_ERRORS = [{'lrg': 'lrgsnr001', 'ruid': 1, 'shard_group': 'sg0', 'term': 2, 'code': 600}]
+WRITER_LRGS = 20
+
+def cleanRunError(lrg, term):
+    return {'lrg': lrg, 'ruid': 1, 'shard_group': 'sg0', 'term': term, 'code': 60015}
+
+# Saves LRGs one transaction each, as batch_report and clean_run_report do.
+def writeLrgs(base_dir, prefix, start):
+    report_db.set_cache_dir(None)
+    start.wait()
+    with report_db.open_report_db(base_dir) as db:
+        for index in range(WRITER_LRGS):
+            lrg = "{}{:03}".format(prefix, index)
+            report_db.save_lrg(db, lrg, {'date': "2025-07-04"})
+            report_db.save_clean_run_errors(db, lrg, [cleanRunError(lrg, term) for term in range(3)])
+
+class ReportDbTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(report_db.set_cache_dir, report_db.report_db_settings['dir'])
+        report_db.set_cache_dir(None)
+        self.base_dir = self.tmp.name
+
+    def writeJsonCaches(self):
+        with open(os.path.join(self.base_dir, report_db.LRG_CACHE_FILE_NAME), 'w') as f:
+            json.dump(LRG_CACHE, f)
+        with open(os.path.join(self.base_dir, report_db.CLEAN_RUN_CACHE_FILE_NAME), 'w') as f:
+            json.dump(CLEAN_RUN_ERRORS, f)
+
+    def meta(self, db):
+        return dict(db.execute("SELECT key, value FROM meta"))
+
+    def test_json_caches_are_migrated(self):
+        self.writeJsonCaches()
+        with report_db.open_report_db(self.base_dir) as db:
+            self.assertEqual(report_db.load_lrgs(db), LRG_CACHE)
+            self.assertEqual(report_db.load_clean_run_errors(db, 'lrgsnr001'), CLEAN_RUN_ERRORS)
+            self.assertEqual(self.meta(db), {'schema_version': report_db.SCHEMA_VERSION, 'json_migrated': '1'})
+        # The JSON files are kept, for older versions still reading them
+        self.assertTrue(os.path.exists(os.path.join(self.base_dir, report_db.LRG_CACHE_FILE_NAME)))
+
+    def test_migrated_database_is_not_imported_again(self):
+        self.writeJsonCaches()
+        with report_db.open_report_db(self.base_dir):
+            pass
+        with open(os.path.join(self.base_dir, report_db.LRG_CACHE_FILE_NAME), 'w') as f:
+            json.dump({'lrgsnr002': {'date': "2025-07-05"}}, f)
+        with report_db.open_report_db(self.base_dir) as db:
+            self.assertEqual(report_db.load_lrgs(db), LRG_CACHE)
+            self.assertEqual(report_db.count_clean_run_errors(db), len(CLEAN_RUN_ERRORS))
+
+    # A database of an older schema version gains the new tables and keeps its rows.
+    def test_older_schema_is_upgraded_without_importing_again(self):
+        self.writeJsonCaches()
+        db = sqlite3.connect(os.path.join(self.base_dir, report_db.REPORT_DB_FILE_NAME))
+        with db:
+            for statement in report_db.SCHEMA[:4]:
+                db.execute(statement)
+            db.execute("INSERT INTO meta (key, value) VALUES ('schema_version', '2'), ('json_migrated', '1')")
+            report_db.write_lrg(db, 'lrgsnr003', {'date': "2025-06-30"})
+        db.close()
+        with report_db.open_report_db(self.base_dir) as db:
+            self.assertEqual(report_db.load_lrgs(db), {'lrgsnr003': {'date': "2025-06-30"}})
+            self.assertEqual(report_db.count_clean_run_errors(db), 0)
+            self.assertEqual(self.meta(db)['schema_version'], report_db.SCHEMA_VERSION)
+            self.assertEqual(db.execute("SELECT COUNT(*) FROM trend_runs").fetchone()[0], 0)
+
+    # Both processes find the database missing, so both try to create it and import the
+    # JSON caches, then write their LRGs at the same time.
+    def test_concurrent_writers(self):
+        self.writeJsonCaches()
+        start = multiprocessing.Barrier(2)
+        writers = [multiprocessing.Process(target=writeLrgs, args=(self.base_dir, prefix, start)) for prefix in ("lrgsnra", "lrgsnrb")]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join(60)
+            self.assertEqual(writer.exitcode, 0)
+
+        with report_db.open_report_db(self.base_dir) as db:
+            lrgs = report_db.load_lrgs(db)
+            self.assertEqual(len(lrgs), 2 * WRITER_LRGS + len(LRG_CACHE))
+            self.assertEqual(report_db.load_clean_run_errors(db, 'lrgsnr001'), CLEAN_RUN_ERRORS)
+            for lrg in lrgs:
+                if lrg != 'lrgsnr001':
+                    self.assertEqual(report_db.load_clean_run_errors(db, lrg), [cleanRunError(lrg, term) for term in range(3)])
+            self.assertEqual(report_db.count_clean_run_errors(db), 2 * WRITER_LRGS * 3 + len(CLEAN_RUN_ERRORS))
+
+if __name__ == "__main__":
+    unittest.main()
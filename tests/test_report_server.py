@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import http.client
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import bs4
+import log_parser
+import report_server
+
+def listFiles(directory):
+    return sorted(os.path.relpath(os.path.join(root, name), directory) for root, _, names in os.walk(directory) for name in names)
+
+class ReportServerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.lrg_dir = os.path.join(self.tmp.name, 'lrgsnr001')
+        self.report_root = os.path.join(self.tmp.name, 'reports')
+        self.report_dir = os.path.join(self.report_root, 'lrgsnr001')
+        self.trace = self.write(os.path.join(self.lrg_dir, 'diag', 'rdbms', 'cdb0', 'aime0', 'trace', 'aime0_rsm_1.trc'), "trace line\n" * 10)
+        self.dif = self.write(os.path.join(self.lrg_dir, 'diag', 'incident', 'incdir_0.dif'), "incident\n")
+        results = {
+            'logDirectory': self.lrg_dir,
+            'allRUIDS': [1],
+            'history': {1: {'sg0': []}},
+            'trace_errors': [{'file': self.trace, 'log_file': ''}],
+            'watson_errors': [{'dif_file': self.dif, 'log_file': ''}],
+            'clean_run_diff': [],
+        }
+        log_parser.saveParseResult(self.report_dir, results)
+        # Outside the report root, where a '..' segment would find it
+        log_parser.saveParseResult(self.tmp.name, results)
+
+        report_server.server_state['report_root'] = self.report_root
+        report_server.server_state['pages'].clear()
+        report_server.server_state['results'].clear()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), report_server.ReportRequestHandler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.addCleanup(self.httpd.server_close)
+        self.addCleanup(self.httpd.shutdown)
+
+    def write(self, path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def get(self, path):
+        connection = http.client.HTTPConnection('127.0.0.1', self.httpd.server_address[1])
+        self.addCleanup(connection.close)
+        connection.request('GET', path)
+        response = connection.getresponse()
+        return response.status, response.read().decode('utf-8', errors='ignore')
+
+    # Serving the index writes nothing: the trace and Watson files link to chunk pages
+    # rendered from the files where they are.
+    def test_index_does_not_place_files(self):
+        before = listFiles(self.report_root)
+        status, page = self.get('/lrgsnr001/index.html')
+        self.assertEqual(status, 200)
+        self.assertEqual(listFiles(self.report_root), before)
+
+        hrefs = [a.get('href') for a in bs4.BeautifulSoup(page, 'html.parser').find_all('a') if a.get('href', '').startswith('./lines/')]
+        self.assertEqual(hrefs, ["./lines/aime0_rsm_1.trc?line=1#line1", "./lines/incdir_0.dif?line=1#line1"])
+        for href, text in zip(hrefs, ("trace line", "incident")):
+            status, chunk = self.get('/lrgsnr001/' + href[len('./'):].split('#')[0])
+            self.assertEqual(status, 200)
+            self.assertIn(text, chunk)
+        self.assertEqual(listFiles(self.report_root), before)
+
+    def test_parent_segments_are_rejected(self):
+        for path in ('/../index.html', '/%2E%2E/index.html', '/./index.html', '/../reports/lrgsnr001/index.html'):
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path)[0], 404)
+        self.assertEqual(self.get('/lrgsnr001/index.html')[0], 200)
+
+if __name__ == "__main__":
+    unittest.main()
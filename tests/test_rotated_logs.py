@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+import unittest
+import importlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+# log_parser.parseHistory is the function, as `from .parseHistory import *` made it
+parseHistory = importlib.import_module('log_parser.parseHistory')
+
+# The debug log of one database, rotated at points where a lookback or a candidate's
+# parameter lines cross into the file before or after.
+ROTATED_LOG = [
+    "2025-07-04T15:00:12+00:00\n"
+    "SNR role change RU_ID 1 became LEADER Term 1 \n"
+    "2025-07-04T15:00:17+00:00\n"
+    "RU_ID 1 with event=RECOVER complete\n"
+    "2025-07-04T15:00:18+00:00\n"
+    "SNR role change RU_ID 1 to CANDIDATE Reason=heartbeat_timeout \n"
+    "Heatbeat parameters: hb_interval=1000\n",
+
+    "  hb_timeout=5000 election_timeout=8000\n"
+    "RU_ID 1 apply failed error=600 \n"
+    "2025-07-04T15:00:30+00:00\n",
+
+    "SNR role change RU_ID 1 became LEADER Term 2 \n"
+    "RU_ID 1 apply failed error=60015 \n"
+    "RU_ID 1 with event=RECOVER complete\n"
+    "2025-07-04T15:00:35+00:00\n"
+    "RU_ID 1 with event=RECOVER complete\n",
+]
+
+RMDBS = [{'dbName': 'cdb1', 'shardGroup': 'sg0', 'logFolderNames': ['aime1']}]
+
+class RotatedLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.rotated = [self.write('debug_aime1_{}.log'.format(index), content) for index, content in enumerate(ROTATED_LOG)]
+        self.whole = [self.write('debug_aime1.log', "".join(ROTATED_LOG))]
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def otherEvents(self, logFilePaths):
+        return parseHistory.parseAllOtherEvents(logFilePaths, [1], 'cdb1', 1, self.tmp.name, [], RMDBS, self.tmp.name)
+
+    # Scanning the files one by one gives the terms of the log they were rotated from.
+    def test_terms_match_the_unrotated_log(self):
+        terms = parseHistory.parseLogFile(self.rotated, 'cdb1', 1)
+        self.assertEqual(terms, parseHistory.parseLogFile(self.whole, 'cdb1', 1))
+        self.assertEqual([(term['term'], term['timestamp'], term['recoveryTime']) for term in terms[1]], [
+            (1, "2025-07-04T15:00:12+00:00", 5.0),
+            (2, "2025-07-04T15:00:30+00:00", 0.0),
+        ])
+
+    def test_events_match_the_unrotated_log(self):
+        events = self.otherEvents(self.rotated)
+        self.assertEqual(events, self.otherEvents(self.whole))
+        candidate, carried, error = events[1]
+        self.assertEqual(candidate['parameters'], [
+            "Heatbeat parameters: hb_interval=1000\n",
+            "  hb_timeout=5000 election_timeout=8000\n",
+            "RU_ID 1 apply failed error=600 \n",
+        ])
+        self.assertEqual(carried['timestamp'], "2025-07-04T15:00:18+00:00")
+        self.assertEqual(error['timestamp'], "2025-07-04T15:00:30+00:00")
+
+    # A candidate cut off by the end of the last file is left for the next resume.
+    def test_only_the_last_file_leaves_candidates_pending(self):
+        pending = []
+        parseHistory.parseAllOtherEvents(self.rotated[:1], [1], 'cdb1', 1, self.tmp.name, [], RMDBS, self.tmp.name, pendingCandidates=pending)
+        self.assertEqual([(ruid, logFile) for ruid, logFile, offset, event in pending], [(1, self.rotated[0])])
+        pending.clear()
+        parseHistory.parseAllOtherEvents(self.rotated, [1], 'cdb1', 1, self.tmp.name, [], RMDBS, self.tmp.name, pendingCandidates=pending)
+        self.assertEqual(pending, [])
+
+if __name__ == "__main__":
+    unittest.main()
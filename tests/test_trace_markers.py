@@ -0,0 +1,88 @@
+import os
+import sys
+import gzip
+import tempfile
+import unittest
+import importlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+traceMarkers = importlib.import_module('log_parser.traceMarkers')
+
+WINDOW = 4096
+MARKER = "*** TRACE CONTINUES IN FILE "
+MARKER_LINE = MARKER + "db_ora_2.trc"
+# Long enough to push a marker line across a window boundary.
+PADDING = "x" * 100
+
+def filler(count):
+    return "".join("filler line {:05} of the trace\n".format(index) for index in range(count))
+
+# Trace contents, with the marker lines probeMarker should find. A window is widened to
+# whole lines, so a marker line that straddles its boundary is found too.
+TRACES = {
+    'head': (filler(10) + MARKER_LINE + "\n" + filler(3000), [MARKER_LINE]),
+    'tail': (filler(3000) + MARKER_LINE + "\n" + filler(10), [MARKER_LINE]),
+    'head_and_tail': (MARKER_LINE + "\n" + filler(3000) + MARKER_LINE + "\n", [MARKER_LINE, MARKER_LINE]),
+    'middle': (filler(1500) + MARKER_LINE + "\n" + filler(1500), []),
+    'straddling_head': (filler(130) + PADDING + MARKER_LINE + "\n" + filler(3000), [PADDING + MARKER_LINE]),
+    'straddling_tail': (filler(3000) + MARKER_LINE + PADDING + "\n" + filler(130), [MARKER_LINE + PADDING]),
+    # Both windows hold the whole trace, the marker must still be found once
+    'short': (filler(50) + MARKER_LINE + "\n" + filler(50), [MARKER_LINE]),
+}
+
+def gzipMembers(data, memberBytes):
+    return b"".join(gzip.compress(data[start:start + memberBytes], mtime=0) for start in range(0, len(data), memberBytes))
+
+# How each trace is written: plain, as one gzip member, and as a member per append, here
+# with members smaller than a window so the tail window spans several of them.
+LAYOUTS = {
+    'plain': ('.trc', lambda data: data),
+    'single_member': ('.trc.gz', lambda data: gzip.compress(data, mtime=0)),
+    'multi_member': ('.trc.gz', lambda data: gzipMembers(data, 997)),
+    'large_last_member': ('.trc.gz', lambda data: gzipMembers(data, max(len(data) - 2 * WINDOW, len(data) // 2))),
+}
+
+class TraceMarkersTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(traceMarkers.setMarkerWindows, traceMarkers.markerWindows['head'], traceMarkers.markerWindows['tail'])
+        traceMarkers.setMarkerWindows(WINDOW, WINDOW)
+
+    def writeTrace(self, name, layout, content):
+        suffix, encode = LAYOUTS[layout]
+        path = os.path.join(self.tmp.name, name + "_" + layout + suffix)
+        with open(path, 'wb') as f:
+            f.write(encode(content.encode()))
+        return path
+
+    def test_markers_in_the_windows_are_found(self):
+        for name, (content, expected) in TRACES.items():
+            for layout in LAYOUTS:
+                with self.subTest(trace=name, layout=layout):
+                    self.assertEqual(traceMarkers.probeMarker(self.writeTrace(name, layout, content), MARKER), expected)
+
+    # Only the last member is inflated when it holds the whole tail window.
+    def test_large_last_member_is_inflated_alone(self):
+        content = TRACES['tail'][0].encode()
+        path = self.writeTrace('tail', 'large_last_member', TRACES['tail'][0])
+        tail, tailStart = traceMarkers.gzipMemberTail(path, os.path.getsize(path), WINDOW)
+        self.assertIsNone(tailStart)
+        self.assertTrue(content.endswith(tail))
+        self.assertLess(len(tail), WINDOW + 100)
+
+    # Members smaller than the window are inflated back to the start of the trace, whose
+    # offset then tells where the tail starts.
+    def test_small_members_are_inflated_back_to_the_start(self):
+        content = TRACES['short'][0].encode()
+        path = self.writeTrace('short', 'multi_member', TRACES['short'][0])
+        self.assertEqual(traceMarkers.gzipMemberTail(path, os.path.getsize(path), WINDOW), (content, 0))
+
+    def test_inflate_member_tail_rejects_several_members(self):
+        data = b"line\n" * 10
+        self.assertEqual(traceMarkers.inflateMemberTail(gzip.compress(data, mtime=0), WINDOW), (data, len(data)))
+        self.assertIsNone(traceMarkers.inflateMemberTail(gzipMembers(data, 20), WINDOW))
+
+if __name__ == "__main__":
+    unittest.main()